@@ -0,0 +1,110 @@
+"""
+Measure the cold import time of the package modules and check they import without side effects.
+
+Every module is imported `--runs` times in a fresh interpreter with `python -X importtime`
+and the median cumulative import time is reported. Each import must leave `sys.path`,
+the logging configuration and the file system untouched, and must not load the optional
+or heavy dependencies that only some runs need (the requests HTTP stack, Scrapy,
+Twisted, pyarrow, httpx, zstandard, python-dotenv). Violations are listed and the script
+exits with an error; tests/test_imports.py runs the same check under pytest, importing
+the modules, dependencies and probe from here without `-X importtime`.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/bench_import_time.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    'bm_scraper.spiders.bebidas_spider_simple',
+    'bm_scraper.spiders.bebidas_spider_async',
+    'bm_scraper.spiders.sharded_scheduler',
+    'bm_scraper.spiders.records',
+    'bm_scraper.config.environment',
+    'bm_scraper.utils.product_parsers',
+    'bm_scraper.utils.output_writer',
+    'bm_scraper.utils.price_history',
+    'bm_scraper.utils.metrics',
+    'bm_scraper.utils.nutrition',
+    'bm_scraper.utils.promotions',
+    'bm_scraper.utils.pagination',
+]
+# Only imported by the code paths that need them: the HTTP stack, the Scrapy spider and the optional dependencies
+LAZY_DEPENDENCIES = ['requests', 'urllib3', 'scrapy', 'twisted', 'pyarrow', 'httpx', 'zstandard', 'dotenv']
+
+# Imports a module while recording the side effects the check looks for
+PROBE = """
+import json, logging, os, sys
+created = []
+for name in ('makedirs', 'mkdir'):
+    original = getattr(os, name)
+    def record(path, *args, _original=original, **kwargs):
+        created.append(str(path))
+        return _original(path, *args, **kwargs)
+    setattr(os, name, record)
+path_before = list(sys.path)
+import {module}
+print(json.dumps({{
+    'created': created,
+    'path_changed': sys.path != path_before,
+    'log_handlers': len(logging.getLogger().handlers),
+    'loaded': [name for name in {lazy!r} if name in sys.modules],
+}}))
+"""
+
+
+def import_module(module, importtime=True):
+    # (cumulative import time in microseconds, or None without `importtime`, side effects probed)
+    options = ['-X', 'importtime'] if importtime else []
+    result = subprocess.run(
+        [sys.executable, *options, '-c', PROBE.format(module=module, lazy=LAZY_DEPENDENCIES)],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative_us = 0 if importtime else None
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and line.split('|')[-1].strip() == module:
+            cumulative_us = int(line.split('|')[1])
+    return cumulative_us, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def side_effects(probe):
+    problems = []
+    if probe['created']:
+        problems.append(f"creates {', '.join(probe['created'])}")
+    if probe['path_changed']:
+        problems.append("changes sys.path")
+    if probe['log_handlers']:
+        problems.append("configures logging")
+    if probe['loaded']:
+        problems.append(f"imports {', '.join(probe['loaded'])}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='imports per module')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<44} {'median ms':>10}  side effects")
+    for module in MODULES:
+        results = [import_module(module) for _ in range(args.runs)]
+        median_ms = statistics.median(cumulative_us for cumulative_us, _ in results) / 1000
+        problems = side_effects(results[-1][1])
+        failed = failed or bool(problems)
+        print(f"{module:<44} {median_ms:>10.1f}  {'; '.join(problems) or 'none'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
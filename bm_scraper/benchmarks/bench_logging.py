@@ -0,0 +1,110 @@
+"""
+Measure the logging overhead of building products, before and after the per-product dumps were removed.
+
+`--pages` synthetic catalog pages of 20 products are built with `process_page_products`
+under four logging setups: the previous one (every product dumped as five INFO lines with
+pretty-printed JSON, written synchronously), the current one at INFO level written
+synchronously and through the QueueHandler, and the current one at DEBUG level, which
+also dumps the `LOG_ITEM_SAMPLE_RATE` sample of products. For each setup the time spent
+in the crawl thread, the time until every record was written, and the size of the log
+file are reported. Console output goes to os.devnull, so terminal speed is left out.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/bench_logging.py [--pages N]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from bm_scraper.spiders.bebidas_spider_simple import process_page_products
+from bm_scraper.utils.logging_config import configure_logging, reset_logging
+from bm_scraper.utils.promotions import PromotionIndex
+
+PRODUCTS_PER_PAGE = 20
+NO_PROMOTIONS = PromotionIndex()
+
+
+def api_product(index):
+    return {
+        'id': str(100000 + index),
+        'ean': str(8410000000000 + index),
+        'categories': [{'type': 1, 'id': 1690, 'name': 'Bebidas'}, {'type': 1, 'id': 1700, 'name': 'Cervezas'}],
+        'productData': {
+            'name': f'Cerveza MAHOU 5 Estrellas pack 6 latas 33 cl {index}',
+            'brand': {'name': 'MAHOU'},
+            'url': f'https://www.online.bmsupermercados.es/es/p/{index}',
+            'imageURL': f'https://cdn-bm.aktiosdigitalservices.com/{index}.jpg',
+        },
+        'priceData': {'prices': [{'id': 'PRICE', 'value': {'centAmount': 4.59, 'centUnitAmount': 2.32}}]},
+        'offers': [],
+    }
+
+
+def api_pages(pages):
+    return [
+        {str(100000 + index): api_product(index) for index in range(page * PRODUCTS_PER_PAGE, (page + 1) * PRODUCTS_PER_PAGE)}
+        for page in range(pages)
+    ]
+
+
+def previous_process_page_products(page_number, page_products, nutrition_map, promotions):
+    # process_page_products as it was, dumping every product
+    page_items = process_page_products(page_number, page_products, nutrition_map, promotions)
+    for product_id, bm_item in zip(page_products, page_items):
+        logging.info("\n" + "="*50)
+        logging.info(f"PRODUCT {product_id} - Page {page_number}")
+        logging.info("="*50)
+        logging.info(json.dumps(bm_item.to_dict(), indent=4, ensure_ascii=False))
+        logging.info("="*50 + "\n")
+    return page_items
+
+
+def run(pages, process, level, async_io):
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, 'w') as devnull:
+        stderr, sys.stderr = sys.stderr, devnull
+        try:
+            configure_logging(level=level, async_io=async_io, log_dir=log_dir)
+            started = time.perf_counter()
+            for page_number, page_products in enumerate(pages, start=1):
+                process(page_number, page_products, {}, NO_PROMOTIONS)
+            crawl_thread = time.perf_counter() - started
+            reset_logging()
+            written = time.perf_counter() - started
+        finally:
+            sys.stderr = stderr
+        log_file = os.path.join(log_dir, 'scraper.log')
+        with open(log_file, 'rb') as f:
+            lines = sum(1 for _ in f)
+        return crawl_thread, written, os.path.getsize(log_file), lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=500, help='catalog pages of 20 products built per setup')
+    args = parser.parse_args()
+
+    pages = api_pages(args.pages)
+    setups = [
+        ('previous, every product dumped', previous_process_page_products, logging.INFO, False),
+        ('INFO, synchronous', process_page_products, logging.INFO, False),
+        ('INFO, QueueHandler', process_page_products, logging.INFO, True),
+        ('DEBUG sampled, QueueHandler', process_page_products, logging.DEBUG, True),
+    ]
+    reset_logging()
+    print(f"{args.pages * PRODUCTS_PER_PAGE} products")
+    print(f"{'setup':<32} {'crawl thread s':>15} {'written s':>10} {'log MB':>8} {'lines':>8}")
+    for name, process, level, async_io in setups:
+        crawl_thread, written, size, lines = run(pages, process, level, async_io)
+        print(f"{name:<32} {crawl_thread:>15.3f} {written:>10.3f} {size / 1e6:>8.2f} {lines:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Check the measuring unit parser against the golden corpus and time it.
+
+Every description of the golden corpus (`tests/measuring_unit_corpus.json`, also checked by
+`tests/test_product_parsers.py`) must parse to its expected measuring unit; mismatches are
+listed and the script exits with an error. The corpus is
+then repeated up to `--items` descriptions, the way a crawl sees the same product names
+over and over, and parsed with the previous per-description parser, with
+`parse_measuring_unit` and with the batch `parse_measuring_units`.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/bench_measuring_unit.py [--items N] [--runs N]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from bm_scraper.utils.product_parsers import _parse_measuring_unit, parse_measuring_unit, parse_measuring_units
+
+CORPUS_FILE = os.path.join(PROJECT_DIR, 'tests', 'measuring_unit_corpus.json')
+
+
+def legacy_parse_measuring_unit(description):
+    """The previous parser: two uncompiled searches per description, volumes only."""
+    if not description:
+        return {"format": "unit", "value": 1.0, "unit": "L"}
+    desc_lower = description.lower()
+    pack_match = re.search(r'(\d+)x(\d+[,.]?\d*)\s*([cm]?l)\b', desc_lower)
+    unit_match = re.search(r'(\d+[,.]?\d*)\s*([cm]?l)\b', desc_lower)
+    if pack_match:
+        unit = pack_match.group(3).upper()
+        liters = float(pack_match.group(2).replace(',', '.')) * (0.01 if unit == 'CL' else 0.001 if unit == 'ML' else 1.0)
+        return {"format": "pack", "value": round(liters * int(pack_match.group(1)), 2), "unit": "L"}
+    elif unit_match:
+        unit = unit_match.group(2).upper()
+        liters = float(unit_match.group(1).replace(',', '.')) * (0.01 if unit == 'CL' else 0.001 if unit == 'ML' else 1.0)
+        return {"format": "unit", "value": round(liters, 2), "unit": "L"}
+    return {"format": "unit", "value": 1.0, "unit": "L"}
+
+
+def check_corpus(corpus):
+    mismatches = 0
+    for entry in corpus:
+        parsed = parse_measuring_unit(entry['description'])
+        if parsed != entry['expected']:
+            mismatches += 1
+            print(f"MISMATCH {entry['description']!r}: expected {entry['expected']}, got {parsed}")
+    print(f"Golden corpus: {len(corpus) - mismatches}/{len(corpus)} descriptions parsed as expected")
+    return mismatches == 0
+
+
+def time_parser(parse, descriptions, runs):
+    times = []
+    for _ in range(runs):
+        _parse_measuring_unit.cache_clear()
+        started = time.perf_counter()
+        parse(descriptions)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100_000, help='descriptions parsed per run')
+    parser.add_argument('--runs', type=int, default=5, help='runs per parser')
+    args = parser.parse_args()
+
+    with open(CORPUS_FILE, encoding='utf-8') as f:
+        corpus = json.load(f)
+    if not check_corpus(corpus):
+        sys.exit(1)
+
+    descriptions = [corpus[index % len(corpus)]['description'] for index in range(args.items)]
+    parsers = [
+        ('legacy per item', lambda batch: [legacy_parse_measuring_unit(description) for description in batch]),
+        ('per item', lambda batch: [parse_measuring_unit(description) for description in batch]),
+        ('batch', parse_measuring_units),
+    ]
+    print(f"{'parser':<16} {'median s':>9} {'items/s':>12}")
+    for name, parse in parsers:
+        median = time_parser(parse, descriptions, args.runs)
+        print(f"{name:<16} {median:>9.3f} {args.items / median if median else 0:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
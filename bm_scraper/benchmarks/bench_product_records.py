@@ -0,0 +1,98 @@
+"""
+Compare BmProductItem (scrapy.Item) with the slotted BmProductRecord.
+
+For each type, `--items` products are built field by field the way
+`process_product_data_from_api` fills them, kept in a list as the in-memory engines do, and
+serialized to JSON Lines strings the way `JsonLinesWriter` writes them. The construction
+and serialization times and the memory held by the products (traced with tracemalloc)
+are reported.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/bench_product_records.py [--items N]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from bm_scraper.spiders.items import BmProductItem
+from bm_scraper.spiders.records import BmProductRecord, as_dict
+
+
+def product_values(index):
+    return {
+        'supermarket': 'BM in 20012',
+        'id': str(100000 + index),
+        'ean': str(8410000000000 + index),
+        'brand': 'MAHOU',
+        'description': f'Cerveza MAHOU 5 Estrellas pack 6 latas 33 cl {index}',
+        'category': 'Bebidas > Cervezas',
+        'url': f'https://www.online.bmsupermercados.es/es/p/{index}',
+        'image_links': [f'https://cdn-bm.aktiosdigitalservices.com/{index}.jpg'],
+        'measuring_unit': {'format': 'pack', 'value': 1.98, 'unit': 'L'},
+        'promotion': 'No encontrado',
+        'price': 4.59,
+        'offer_price': 'No encontrado',
+        'unit_price': 2.32,
+        'manufacturer': 'Mahou S.A. - Madrid',
+        'raw_ingredients': 'Agua, malta de cebada, maíz y lúpulo',
+    }
+
+
+def build_items(values):
+    items = []
+    for product in values:
+        item = BmProductItem()
+        for name, value in product.items():
+            item[name] = value
+        items.append(item)
+    return items
+
+
+def build_records(values):
+    records = []
+    for product in values:
+        record = BmProductRecord()
+        for name, value in product.items():
+            setattr(record, name, value)
+        records.append(record)
+    return records
+
+
+def measure(build, values):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    products = build(values)
+    built = time.perf_counter() - started
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for product in products:
+        json.dumps(as_dict(product), ensure_ascii=False)
+    serialized = time.perf_counter() - started
+    return built, serialized, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100_000, help='products built per type')
+    args = parser.parse_args()
+
+    values = [product_values(index) for index in range(args.items)]
+    print(f"{'type':<16} {'build s':>8} {'serialize s':>12} {'held MB':>8} {'bytes/item':>11}")
+    for name, build in (('BmProductItem', build_items), ('BmProductRecord', build_records)):
+        built, serialized, held = measure(build, values)
+        print(f"{name:<16} {built:>8.3f} {serialized:>12.3f} {held / 1e6:>8.1f} {held / args.items:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
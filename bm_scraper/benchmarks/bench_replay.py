@@ -0,0 +1,217 @@
+"""
+Run the crawl engines end to end against the local replay server and report their throughput.
+
+`mock_bm_api.py` serves the fixtures (recorded with `record_fixtures.py`, or synthetic ones)
+in this process, and every engine runs `scrape_beverages_master` in a process of its own,
+`--runs` times, with the config pointed at the replay server: the API and CDN URLs are
+rebased onto it, the proxy is not used and every file the crawl writes (output, cache,
+logs, metrics) goes to a temporary directory. Unless `--paced` is given the configured
+request rates are lifted, so the numbers measure the crawler rather than its pacing.
+
+For each engine the items, the median wall time, items/s and requests/s, the p50 and p99
+request latency (estimated from the request duration histogram of the crawl metrics, as
+Prometheus' histogram_quantile() does) and the peak RSS of the crawl process or of its
+largest worker are reported. `--save` writes the results to a JSON file and `--baseline`
+compares them with a saved one, exiting with status 1 when an engine returns a different
+number of items, its items/s drop or its p99 latency or peak RSS grow by more than
+`--tolerance`, so a regression fails the run before it is deployed.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/bench_replay.py [--fixtures FILE] [--engines sync async sharded] [--runs N]
+                                      [--latency SECONDS] [--error-rate F] [--throttle-rate F]
+                                      [--paced] [--save FILE] [--baseline FILE] [--tolerance F]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+# Settings of the replay run, passed by the benchmark to the crawl process
+REPLAY_ENV = 'BM_REPLAY_SETTINGS'
+# Requests per second of every host when the configured rates are lifted
+UNPACED_RATE = 1000.0
+
+
+def use_replay_server(api_base_url, cdn_base_url, data_dir, paced):
+    """
+    Point the config at the replay server and keep every file of the run in `data_dir`.
+
+    Runs before the spiders are imported, which copy the config constants, both in the crawl
+    process and in the worker processes of the sharded engine, which import this module again
+    as their main module.
+    """
+    import bm_scraper.config.config as config
+    import bm_scraper.config.proxy_config as proxy_config
+
+    hosts = {}
+    for url, base_url in ((config.BEVERAGES_API_URL, api_base_url), (config.NUTRITIONAL_INFO_URL, cdn_base_url)):
+        parts = urlsplit(url)
+        hosts[f'{parts.scheme}://{parts.netloc}'] = base_url
+    for name, value in list(vars(config).items()):
+        if not name.isupper() or name == 'PROJECT_DIR' or not isinstance(value, str):
+            continue
+        for real, replay in hosts.items():
+            if value.startswith(real):
+                value = replay + value[len(real):]
+        if value.startswith(config.PROJECT_DIR):
+            value = data_dir + value[len(config.PROJECT_DIR):]
+        setattr(config, name, value)
+    proxy_config.PROXIES = {}
+    if not paced:
+        for name in ('API_REQUESTS_PER_SECOND', 'CDN_REQUESTS_PER_SECOND', 'DEFAULT_REQUESTS_PER_SECOND',
+                     'API_RATE_CEILING', 'CDN_RATE_CEILING'):
+            setattr(config, name, UNPACED_RATE)
+
+
+if os.environ.get(REPLAY_ENV):
+    use_replay_server(**json.loads(os.environ[REPLAY_ENV]))
+
+
+def peak_rss_mb():
+    import resource
+
+    # Largest of this process and of its waited-for children (the sharded workers)
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def crawl(engine, workers):
+    """Run a crawl in this process, already pointed at the replay server, and print its results as JSON."""
+    from bm_scraper.spiders.bebidas_spider_simple import scrape_beverages_master
+    from bm_scraper.utils.logging_config import configure_logging
+    from bm_scraper.utils.metrics import get_metrics
+
+    configure_logging(level='WARNING')
+    started = time.perf_counter()
+    items = scrape_beverages_master(engine=engine, workers=workers)
+    elapsed = time.perf_counter() - started
+
+    metrics = get_metrics()
+    print(json.dumps({
+        'items': items,
+        'seconds': elapsed,
+        'requests': metrics.total('bm_http_requests_total'),
+        'retries': metrics.total('bm_http_retries_total'),
+        'p50': metrics.quantile('bm_http_request_duration_seconds', 0.5, phase='total'),
+        'p99': metrics.quantile('bm_http_request_duration_seconds', 0.99, phase='total'),
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def run(engine, workers, server, paced):
+    with tempfile.TemporaryDirectory() as data_dir:
+        settings = {
+            'api_base_url': server.api_base_url,
+            'cdn_base_url': server.cdn_base_url,
+            'data_dir': data_dir,
+            'paced': paced,
+        }
+        command = [sys.executable, os.path.abspath(__file__), '--crawl', engine, '--workers', str(workers)]
+        result = subprocess.run(command, cwd=PROJECT_DIR, env={**os.environ, REPLAY_ENV: json.dumps(settings)},
+                                capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"The {engine} crawl failed:\n{result.stderr[-4000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    seconds = statistics.median(run['seconds'] for run in runs)
+    latencies = {key: [run[key] for run in runs if run[key] is not None] for key in ('p50', 'p99')}
+    return {
+        'items': runs[-1]['items'],
+        'seconds': seconds,
+        'items_per_second': runs[-1]['items'] / seconds if seconds else 0.0,
+        'requests_per_second': statistics.median(run['requests'] for run in runs) / seconds if seconds else 0.0,
+        'retries': runs[-1]['retries'],
+        'p50': statistics.median(latencies['p50']) if latencies['p50'] else None,
+        'p99': statistics.median(latencies['p99']) if latencies['p99'] else None,
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+    }
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for engine, result in results.items():
+        previous = baseline.get(engine)
+        if previous is None:
+            continue
+        if result['items'] != previous['items']:
+            found.append(f"{engine}: {result['items']} items instead of {previous['items']}")
+        if result['items_per_second'] < previous['items_per_second'] * (1 - tolerance):
+            found.append(f"{engine}: {result['items_per_second']:.1f} items/s, down from {previous['items_per_second']:.1f}")
+        if result['p99'] is not None and previous['p99'] is not None and result['p99'] > previous['p99'] * (1 + tolerance):
+            found.append(f"{engine}: p99 latency {result['p99'] * 1000:.0f} ms, up from {previous['p99'] * 1000:.0f} ms")
+        if result['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+            found.append(f"{engine}: peak RSS {result['peak_rss_mb']:.0f} MB, up from {previous['peak_rss_mb']:.0f} MB")
+    return found
+
+
+def _ms(seconds):
+    return f'{seconds * 1000:.1f}' if seconds is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', help='fixtures file written by record_fixtures.py')
+    parser.add_argument('--products', type=int, default=900, help='synthetic products served without --fixtures')
+    parser.add_argument('--engines', nargs='+', choices=['sync', 'async', 'sharded'], default=['sync', 'async', 'sharded'],
+                        help='engines benchmarked')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes of the sharded engine')
+    parser.add_argument('--runs', type=int, default=3, help='crawls per engine')
+    parser.add_argument('--latency', type=float, default=0.02, help='mean delay of every response in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the requests answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of the requests answered with a 429')
+    parser.add_argument('--paced', action='store_true', help='keep the configured request rates')
+    parser.add_argument('--save', metavar='FILE', help='write the results to a JSON file')
+    parser.add_argument('--baseline', metavar='FILE', help='results saved with --save to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change reported as a regression')
+    parser.add_argument('--crawl', choices=['sync', 'async', 'sharded'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.crawl:
+        crawl(args.crawl, args.workers)
+        return
+
+    from mock_bm_api import ReplayServer
+    from record_fixtures import load_fixtures, synthetic_fixtures
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(args.products)
+    server = ReplayServer(fixtures, latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate).start()
+    results = {}
+    print(f"{'engine':<8} {'items':>6} {'median s':>9} {'items/s':>8} {'req/s':>7} {'retries':>8} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'peak RSS MB':>12}")
+    try:
+        for engine in args.engines:
+            result = results[engine] = summarize([run(engine, args.workers, server, args.paced) for _ in range(args.runs)])
+            print(f"{engine:<8} {result['items']:>6} {result['seconds']:>9.2f} {result['items_per_second']:>8.1f} "
+                  f"{result['requests_per_second']:>7.1f} {result['retries']:>8} {_ms(result['p50']):>7} "
+                  f"{_ms(result['p99']):>7} {result['peak_rss_mb']:>12.1f}")
+    finally:
+        server.stop()
+    print(f"Replay server responses by status: {dict(sorted(server.responses.items()))}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        if found:
+            sys.exit(1)
+        print(f"No regression beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
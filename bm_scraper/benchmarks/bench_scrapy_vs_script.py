@@ -0,0 +1,64 @@
+"""
+Compare the Scrapy spider with the standalone script on a full crawl.
+
+Both crawlers run in their own process against the endpoints configured in
+`bm_scraper/config/config.py`, one after the other, and the wall time, the number of
+items and the throughput of each run are reported.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/bench_scrapy_vs_script.py [--runs N] [--engine sync|async]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from bm_scraper.config.config import OUTPUT_DIR, OUTPUT_FILE
+
+
+def run_script(engine):
+    command = [sys.executable, '-m', 'bm_scraper.spiders.bebidas_spider_simple', '--engine', engine]
+    started = time.perf_counter()
+    subprocess.run(command, cwd=PROJECT_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - started
+    with open(os.path.join(OUTPUT_DIR, OUTPUT_FILE), encoding='utf-8') as f:
+        return elapsed, len(json.load(f))
+
+
+def run_spider():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, 'items.json')
+        command = [sys.executable, '-m', 'scrapy', 'crawl', 'bebidas', '-O', output_file, '-s', 'LOG_LEVEL=WARNING']
+        started = time.perf_counter()
+        subprocess.run(command, cwd=PROJECT_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - started
+        with open(output_file, encoding='utf-8') as f:
+            return elapsed, len(json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='crawls per crawler')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync', help='engine of the standalone script')
+    args = parser.parse_args()
+
+    crawlers = [(f'script ({args.engine})', lambda: run_script(args.engine)), ('scrapy spider', run_spider)]
+    print(f"{'crawler':<16} {'items':>6} {'median s':>9} {'min s':>7} {'items/s':>8}")
+    for name, crawl in crawlers:
+        results = [crawl() for _ in range(args.runs)]
+        times = [elapsed for elapsed, _ in results]
+        items = results[-1][1]
+        median = statistics.median(times)
+        print(f"{name:<16} {items:>6} {median:>9.2f} {min(times):>7.2f} {items / median if median else 0:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
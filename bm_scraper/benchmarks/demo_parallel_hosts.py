@@ -0,0 +1,118 @@
+"""
+Show that a throttled domain does not hold back requests to other domains.
+
+Two local HTTP servers answer after a fixed latency: one is reached as 127.0.0.1 and
+listed in RATE_LIMITED_DOMAINS (standing in for the BM API), the other one is reached as
+localhost and left unthrottled (standing in for the nutritional info CDN). The same
+requests are crawled twice, once with the project's RateLimitingMiddleware and once with
+the previous implementation, which called time.sleep() in process_request. The finish
+time of every request is printed for both runs.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/demo_parallel_hosts.py [--requests N] [--latency SECONDS]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+
+class BlockingRateLimitingMiddleware:
+    """The previous RateLimitingMiddleware, blocking the reactor while it waits."""
+
+    def process_request(self, request, spider):
+        time.sleep(random.uniform(1.0, 2.0))
+        return None
+
+
+def serve(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = b'{}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def crawl(middleware, api_port, cdn_port, requests_per_host):
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+
+    finished = []
+    started = time.perf_counter()
+
+    class DemoSpider(scrapy.Spider):
+        name = 'demo'
+
+        def start_requests(self):
+            for index in range(requests_per_host):
+                yield scrapy.Request(f'http://127.0.0.1:{api_port}/api/{index}', dont_filter=True)
+                yield scrapy.Request(f'http://localhost:{cdn_port}/cdn/{index}', dont_filter=True)
+
+        def parse(self, response):
+            finished.append((response.url.split('/')[-2], round(time.perf_counter() - started, 2)))
+
+    process = CrawlerProcess({
+        'DOWNLOADER_MIDDLEWARES': {middleware: 350},
+        'RATE_LIMITED_DOMAINS': {'127.0.0.1': 0.2},
+        'CONCURRENT_REQUESTS_PER_DOMAIN': requests_per_host,
+        'DOWNLOAD_DELAY': 0,
+        'ROBOTSTXT_OBEY': False,
+        'LOG_LEVEL': 'ERROR',
+    })
+    process.crawl(DemoSpider)
+    process.start()
+    return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5, help='requests sent to each host')
+    parser.add_argument('--latency', type=float, default=0.2, help='response time of both servers in seconds')
+    parser.add_argument('--middleware', help=argparse.SUPPRESS)
+    parser.add_argument('--ports', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.middleware:
+        api_port, cdn_port = map(int, args.ports.split(','))
+        print(json.dumps(crawl(args.middleware, api_port, cdn_port, args.requests)))
+        return
+
+    api_port, cdn_port = serve(args.latency), serve(args.latency)
+    middlewares = [
+        ('non-blocking', 'bm_scraper.middlewares.rate_limiting.RateLimitingMiddleware'),
+        ('blocking sleep', '__main__.BlockingRateLimitingMiddleware'),
+    ]
+    for label, middleware in middlewares:
+        # Every crawl runs in its own process since the Twisted reactor cannot be restarted
+        output = subprocess.run(
+            [sys.executable, __file__, '--requests', str(args.requests), '--middleware', middleware, '--ports', f'{api_port},{cdn_port}'],
+            cwd=PROJECT_DIR, check=True, capture_output=True, text=True
+        ).stdout
+        finished = json.loads(output.strip().splitlines()[-1])
+        for host in ('api', 'cdn'):
+            times = [elapsed for name, elapsed in finished if name == host]
+            print(f"{label:<15} {host}: {len(times)} responses, finished at {times} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Local stand-in for the BM API and the nutritional info CDN, replaying recorded fixtures.
+
+Catalog requests are answered from the products recorded for their category and filters,
+sliced by their `offset` and `limit` (so any page size can be replayed) with `totalCount`
+and `hasMore` set accordingly; nutritional info requests get the recorded JSON with its
+ETag (and a 304 to a matching If-None-Match), or a 404. Every response can be delayed by
+`--latency` seconds (+/- 50%), and a `--error-rate` fraction of the requests get a 503
+and a `--throttle-rate` fraction a 429 with `Retry-After`. The API is served on
+127.0.0.1 and the CDN on localhost, so the crawl paces them as two hosts.
+
+Fixtures come from `record_fixtures.py`; without `--fixtures`, synthetic ones are used.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/mock_bm_api.py [--fixtures FILE] [--port N] [--latency SECONDS]
+                                     [--error-rate F] [--throttle-rate F]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from record_fixtures import catalog_path, feed_key, load_fixtures, nutrition_path_prefix, synthetic_fixtures
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ReplayServer:
+    """
+    HTTP server replaying fixtures in a background thread.
+
+    Args:
+        fixtures: Fixtures as written by `record_fixtures.py` (dictionary).
+        port: Port to listen on, or 0 for a free one (integer).
+        latency: Mean delay of every response in seconds (float).
+        error_rate: Fraction of the requests answered with a 503 (float).
+        throttle_rate: Fraction of the requests answered with a 429 (float).
+        retry_after: Retry-After of the 429 responses in seconds (integer).
+        seed: Seed of the latency and fault injection (integer).
+    """
+
+    def __init__(self, fixtures, port=0, latency=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=0):
+        self.feeds = {(feed['category'], feed['filters']): feed['products'] for feed in fixtures['catalog']}
+        self.nutrition = fixtures['nutrition']
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.responses = {}
+        self._catalog_path = catalog_path()
+        self._nutrition_prefix = nutrition_path_prefix()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def api_base_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    @property
+    def cdn_base_url(self):
+        return f'http://localhost:{self.port}'
+
+    def start(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, headers, body = replay.respond(self.path, self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _Server(('127.0.0.1', self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _draw(self):
+        with self._lock:
+            return self._random.uniform(0.5, 1.5), self._random.random()
+
+    def respond(self, path, request_headers):
+        """(status, headers, body) of the response to a GET of `path`."""
+        jitter, fault = self._draw()
+        if self.latency:
+            time.sleep(self.latency * jitter)
+
+        if fault < self.throttle_rate:
+            response = 429, {'Retry-After': str(self.retry_after)}, b''
+        elif fault < self.throttle_rate + self.error_rate:
+            response = 503, {}, b''
+        else:
+            response = self._replay(path, request_headers)
+        with self._lock:
+            self.responses[response[0]] = self.responses.get(response[0], 0) + 1
+        return response
+
+    def _replay(self, path, request_headers):
+        url = urlsplit(path)
+        if url.path == self._catalog_path:
+            query = parse_qs(url.query)
+            products = self.feeds.get(feed_key(query), [])
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', ['20'])[0])
+            body = {
+                'products': products[offset:offset + limit],
+                'totalCount': len(products),
+                'hasMore': offset + limit < len(products),
+            }
+            return 200, {'Content-Type': 'application/json'}, json.dumps(body).encode()
+
+        if url.path.startswith(self._nutrition_prefix):
+            entry = self.nutrition.get(url.path[len(self._nutrition_prefix):].rsplit('.', 1)[0])
+            if entry is None or entry['status'] != 200:
+                return 404, {}, b''
+            headers = {'Content-Type': 'application/json'}
+            if entry.get('etag'):
+                headers['ETag'] = entry['etag']
+                if request_headers.get('If-None-Match') == entry['etag']:
+                    return 304, headers, b''
+            return 200, headers, json.dumps(entry['body']).encode()
+
+        return 404, {}, b''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', help='fixtures file written by record_fixtures.py')
+    parser.add_argument('--products', type=int, default=900, help='synthetic products served without --fixtures')
+    parser.add_argument('--port', type=int, default=8800, help='port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='mean delay of every response in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the requests answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of the requests answered with a 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After of the 429 responses in seconds')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(args.products)
+    server = ReplayServer(fixtures, args.port, args.latency, args.error_rate, args.throttle_rate, args.retry_after).start()
+    print(f"API at {server.api_base_url}, nutritional info CDN at {server.cdn_base_url}; Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+        print(f"Responses by status: {dict(sorted(server.responses.items()))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Record the responses of a real crawl as fixtures for the replay server.
+
+The catalog, the promotion feeds and the nutritional info of one category are crawled
+with `scrape_beverages_api_only` through the configured proxy, and every response is
+captured by a hook on the sessions of the HTTP client. The products of each feed (a
+category and filter combination) are stored in catalog order and the nutritional info
+by EAN, including the EANs the CDN answered with a 404, so `mock_bm_api.py` can serve
+any page size and offset from them. The nutritional info cache is bypassed so every
+EAN is requested. Output and files of the crawl itself are not written.
+
+With `--synthetic N` no request is sent: a deterministic catalog of N products with
+promotions and nutritional info is generated instead, which is what `bench_replay.py`
+uses when it is not given a fixtures file.
+
+Usage (from the project directory, next to scrapy.cfg):
+    python benchmarks/record_fixtures.py [--output FILE] [--category ID] [--synthetic N]
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import bm_scraper.config.config as config
+
+DEFAULT_FIXTURES = os.path.join(PROJECT_DIR, 'benchmarks', 'fixtures', 'bm_api.json.gz')
+
+# Query string filters of the promotion feeds, as parse_qs() decodes them
+PROMOTION_FILTERS = {
+    'MxN': 'filter.offerMxN:true',
+    'SecondUnitDiscount': 'filter.offerSecondUnitDiscount:true',
+    'OfferPrice': 'filter.offerPrice:true',
+    'OfferDeferred': 'filter.offerDeferred:true',
+}
+
+
+def catalog_path():
+    return urlsplit(config.BEVERAGES_API_URL).path
+
+
+def nutrition_path_prefix():
+    return urlsplit(config.NUTRITIONAL_INFO_URL).path.split('{ean}')[0]
+
+
+def feed_key(query):
+    """(category, filters) of a catalog request, from its parsed query string."""
+    return query.get('categories', [''])[0], query.get('filters', [''])[0]
+
+
+def load_fixtures(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_fixtures(fixtures, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        json.dump(fixtures, f, ensure_ascii=False, separators=(',', ':'))
+
+
+class ResponseRecorder:
+    """
+    Requests response hook keeping the catalog pages and nutritional info JSONs of a crawl.
+
+    Args:
+        catalog_path: URL path of the catalog API (string).
+        nutrition_prefix: URL path of the nutritional info files up to the EAN (string).
+    """
+
+    def __init__(self, catalog_path, nutrition_prefix):
+        self.catalog_path = catalog_path
+        self.nutrition_prefix = nutrition_prefix
+        self.pages = {}
+        self.nutrition = {}
+        self.responses = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, response, *args, **kwargs):
+        url = urlsplit(response.url)
+        if url.path == self.catalog_path and response.status_code == 200:
+            query = parse_qs(url.query)
+            offset = int(query.get('offset', ['0'])[0])
+            products = response.json().get('products', [])
+            with self._lock:
+                self.pages.setdefault(feed_key(query), {})[offset] = products
+                self.responses += 1
+        elif url.path.startswith(self.nutrition_prefix) and response.status_code in (200, 404):
+            ean = url.path[len(self.nutrition_prefix):].rsplit('.', 1)[0]
+            entry = {'status': response.status_code}
+            if response.status_code == 200:
+                entry['body'] = response.json()
+                if response.headers.get('ETag'):
+                    entry['etag'] = response.headers['ETag']
+            with self._lock:
+                self.nutrition[ean] = entry
+                self.responses += 1
+
+    def fixtures(self):
+        with self._lock:
+            catalog = [
+                {
+                    'category': category,
+                    'filters': filters,
+                    'products': [product for offset in sorted(pages) for product in pages[offset]],
+                }
+                for (category, filters), pages in sorted(self.pages.items())
+            ]
+            return {
+                'source': 'recorded',
+                'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'catalog': catalog,
+                'nutrition': dict(self.nutrition),
+            }
+
+
+def record(category):
+    # Every EAN has to be requested, so the nutritional info cache is turned off before the spiders are imported
+    config.NUTRITION_CACHE_ENABLED = False
+    from bm_scraper.spiders.bebidas_spider_simple import scrape_beverages_api_only
+    from bm_scraper.utils.http_client import get_http_client
+
+    recorder = ResponseRecorder(catalog_path(), nutrition_path_prefix())
+    client = get_http_client()
+    for url in (config.BEVERAGES_API_URL, config.NUTRITIONAL_INFO_URL):
+        client.session_for(url).hooks['response'].append(recorder)
+    scrape_beverages_api_only(category=category)
+    logging.info(f"Recorded {recorder.responses} responses")
+    return recorder.fixtures()
+
+
+def synthetic_product(index, category, rng):
+    sizes = ['33 cl', 'pack 6 latas 33 cl', '1,5 L', '6x25cl', '70 cl', '2 L', 'pack 24 botellines 25 cl', '1 l']
+    kinds = [('Cerveza', 'MAHOU', 1701), ('Agua mineral', 'FONT VELLA', 1702), ('Refresco', 'COCA-COLA', 1703),
+             ('Zumo', 'DON SIMON', 1704), ('Vino tinto', 'RAMON BILBAO', 1705)]
+    name, brand, subcategory = kinds[index % len(kinds)]
+    price = round(rng.uniform(0.5, 15.0), 2)
+    prices = [{'id': 'PRICE', 'value': {'centAmount': price, 'centUnitAmount': round(price * 1.8, 2)}}]
+    offers = []
+    if index % 7 == 0:
+        offers = [{'minDescription': '2X1', 'shortDescription': 'Lleva 2 y paga 1', 'promotionType': 2}]
+    elif index % 11 == 0:
+        offers = [{'minDescription': '2ª al 50%', 'shortDescription': 'Segunda unidad al 50%', 'promotionType': 3}]
+    elif index % 5 == 0:
+        offer_price = round(price * 0.8, 2)
+        prices.append({'id': 'OFFER_PRICE', 'value': {'centAmount': offer_price, 'centUnitAmount': round(offer_price * 1.8, 2)}})
+        offers = [{'minDescription': 'Oferta', 'shortDescription': 'Precio rebajado', 'promotionType': 1, 'amount': offer_price}]
+    elif index % 13 == 0:
+        offers = [{'minDescription': 'Ahorro', 'shortDescription': 'Deferred 20% para tu próxima compra', 'promotionType': 4}]
+    return {
+        'id': str(100000 + index),
+        'ean': f'84{index:011d}',
+        'categories': [
+            {'type': 1, 'id': category, 'name': 'Bebidas'},
+            {'type': 1, 'id': subcategory, 'name': name},
+        ],
+        'productData': {
+            'name': f'{name} {brand} {sizes[index % len(sizes)]}',
+            'brand': {'name': brand},
+            'url': f'https://www.online.bmsupermercados.es/es/p/{100000 + index}',
+            'imageURL': f'https://cdn-bm.aktiosdigitalservices.com/tol/bm/media/product/{100000 + index}.jpg',
+        },
+        'priceData': {'prices': prices},
+        'offers': offers,
+    }
+
+
+def synthetic_nutrition(index, rng):
+    nutrients = ['Valor energético', 'Grasas', 'Saturadas', 'Hidratos de carbono', 'Azúcares', 'Proteínas', 'Sal']
+    return {
+        'nutrilabel': {
+            'productInformation': {
+                'manufacturer': {'name': f'Fabricante {index % 40}', 'address': f'Calle Mayor {index % 97}, 20012 Donostia'},
+                'ingredientsInformation': [{'ingredientsList': '<b>Agua</b>, malta de <b>cebada</b>, lúpulo, aroma natural'}],
+            },
+            'nutritionalInformation': [
+                {'name': nutrient, 'value': round(rng.uniform(0, 50), 1), 'unit': 'g'} for nutrient in nutrients
+            ],
+        }
+    }
+
+
+def synthetic_fixtures(products, category=config.CATEGORY_ID, seed=0):
+    """Deterministic fixtures of `products` products, a fifth of them without nutritional info."""
+    rng = random.Random(seed)
+    catalog = [synthetic_product(index, category, rng) for index in range(products)]
+    feeds = [{'category': str(category), 'filters': '', 'products': catalog}]
+    for promo_type, filters in PROMOTION_FILTERS.items():
+        feeds.append({
+            'category': str(category),
+            'filters': filters,
+            'products': [product for product in catalog if product['offers'] and _offer_type(product) == promo_type],
+        })
+    nutrition = {}
+    for index, product in enumerate(catalog):
+        if index % 5 == 4:
+            nutrition[product['ean']] = {'status': 404}
+        else:
+            nutrition[product['ean']] = {'status': 200, 'body': synthetic_nutrition(index, rng), 'etag': f'"{product["ean"]}"'}
+    return {'source': 'synthetic', 'catalog': feeds, 'nutrition': nutrition}
+
+
+def _offer_type(product):
+    offer = product['offers'][0]
+    if 'Deferred' in offer['shortDescription']:
+        return 'OfferDeferred'
+    return {1: 'OfferPrice', 2: 'MxN', 3: 'SecondUnitDiscount'}.get(offer['promotionType'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=DEFAULT_FIXTURES, help='fixtures file; gzip-compressed if it ends in .gz')
+    parser.add_argument('--category', type=int, default=config.CATEGORY_ID, help='store category crawled')
+    parser.add_argument('--synthetic', type=int, metavar='N', help='generate N synthetic products instead of recording')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.synthetic is not None:
+        fixtures = synthetic_fixtures(args.synthetic, args.category)
+    else:
+        fixtures = record(args.category)
+    save_fixtures(fixtures, args.output)
+    print(f"{sum(len(feed['products']) for feed in fixtures['catalog'])} catalog products in "
+          f"{len(fixtures['catalog'])} feeds and {len(fixtures['nutrition'])} nutritional info entries written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,20 +3,105 @@ Configuration constants for the BM Supermercados Beverage Scraper.
 
 """
 
-# API URLs for fetching product and promotion data
-BEVERAGES_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page={page}&limit=20&offset={offset}&orderById=1&showRecommendations=false&categories=1690"
-MXN_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page=1&limit=20&offset=0&orderById=1&filters=filter.offerMxN%3Atrue&showRecommendations=false&categories=1690"
-SECOND_UNIT_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page=1&limit=20&offset=0&orderById=1&filters=filter.offerSecondUnitDiscount%3Atrue&showRecommendations=false&categories=1690"
-OFFER_PRICE_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page={page}&limit=20&offset={offset}&orderById=1&filters=filter.offerPrice%3Atrue&showRecommendations=false&categories=1690"
-OFFER_DEFERRED_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page=1&limit=20&offset=0&orderById=1&filters=filter.offerDeferred%3Atrue&showRecommendations=false&categories=1690"
+import os
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Store categories
+CATEGORY_ID = 1690  # Bebidas, the category crawled by default
+CATEGORIES = [CATEGORY_ID]  # Categories crawled by the sharded scheduler by default
+
+# API URLs for fetching product and promotion data, formatted with the page, the page size, its offset and the category ID
+BEVERAGES_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page={page}&limit={limit}&offset={offset}&orderById=1&showRecommendations=false&categories={category}"
+MXN_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page={page}&limit={limit}&offset={offset}&orderById=1&filters=filter.offerMxN%3Atrue&showRecommendations=false&categories={category}"
+SECOND_UNIT_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page={page}&limit={limit}&offset={offset}&orderById=1&filters=filter.offerSecondUnitDiscount%3Atrue&showRecommendations=false&categories={category}"
+OFFER_PRICE_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page={page}&limit={limit}&offset={offset}&orderById=1&filters=filter.offerPrice%3Atrue&showRecommendations=false&categories={category}"
+OFFER_DEFERRED_PROMO_API_URL = "https://www.online.bmsupermercados.es/api/rest/V1.0/catalog/product?page={page}&limit={limit}&offset={offset}&orderById=1&filters=filter.offerDeferred%3Atrue&showRecommendations=false&categories={category}"
+NUTRITIONAL_INFO_URL = "https://cdn-bm.aktiosdigitalservices.com/tol/bm/media/product/nutritional-info/{ean}.json"
 
 # Pagination and retry settings
-MAX_PAGES = 45  # Maximum pages to scrape for main beverages API
-OFFER_PRICE_MAX_PAGES = 7  # Maximum pages for OfferPrice promotions
+PAGE_SIZE = 20  # Products per page requested when the API accepts no larger page size
+PAGE_SIZE_CANDIDATES = [100, 50]  # Page sizes probed, largest first, before falling back to PAGE_SIZE; empty to never probe
+PAGE_SIZE_MAX_AGE = 7 * 24 * 3600  # Seconds a negotiated page size is reused before the endpoint is probed again
+PAGE_SIZES_FILE = os.path.join(PROJECT_DIR, 'cache', 'page-sizes.json')  # Negotiated page size of every API endpoint
+CATALOG_PAGE_CONCURRENCY = 4  # Catalog pages requested at once after the first page gives the page count of the category
 MAX_EMPTY_PAGES = 3  # Stop after this many consecutive empty pages
-MAX_RETRIES = 3  # Maximum retries for failed API requests
+PROMOTION_PAGE_CONCURRENCY = 4  # Pages of a promotion feed requested at once after its first page gives the total count
+MAX_RETRIES = 3  # Times a failed request is retried
 REQUEST_TIMEOUT = 15  # Timeout for API requests in seconds
-RETRY_DELAY = 2  # Delay between retry attempts in seconds
-PAGE_DELAY = 1  # Delay between page requests in seconds
-OUTPUT_DIR = r"C:\Users\richa\Downloads\comexsoft-challengue\bm_scraper\output"
-OUTPUT_FILE = "bm_productos_bebidas.json"
\ No newline at end of file
+RETRY_DELAY = 2  # Base delay of the exponential backoff between retries in seconds, doubled on every retry
+RETRY_BACKOFF_MAX = 30  # Longest delay between retries in seconds
+RETRY_HTTP_CODES = [500, 502, 503, 504, 408, 429]  # Response codes that are retried, as RETRY_HTTP_CODES in settings.py
+RETRY_BUDGET = 100  # Retries allowed per run across all requests; once spent, failed requests are not retried
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures (connection errors, timeouts, 5xx) that open the circuit of a host
+CIRCUIT_RESET_TIMEOUT = 30  # Seconds an open circuit fails requests right away before letting a probe request through
+PAGE_DELAY = 1  # Initial delay between requests to the API host in seconds, adapted at runtime
+
+# Nutritional info settings
+NUTRITION_MAX_WORKERS = 8  # Maximum concurrent requests to the nutritional info CDN
+NUTRITION_TIMEOUT = 10  # Timeout for nutritional info requests in seconds
+
+# Async engine settings
+API_REQUESTS_PER_SECOND = 1.0 / PAGE_DELAY  # Initial request rate to the API host
+API_BURST = 1  # Requests that may be sent back to back to the API host
+CDN_REQUESTS_PER_SECOND = 20.0  # Initial request rate to the nutritional info CDN
+CDN_BURST = NUTRITION_MAX_WORKERS  # Requests that may be sent back to back to the CDN
+ASYNC_MAX_CONCURRENCY = 16  # Maximum requests in flight across all hosts
+ASYNC_PAGE_WINDOW = 4  # Catalog pages requested ahead of the page being processed
+
+# Adaptive rate limiting settings
+ADAPTIVE_RATE_LIMITING = True  # Adjust the request rate of every host to its responses (AIMD)
+ADAPTIVE_MIN_RATE = 0.1  # Requests per second a host can be backed off to
+ADAPTIVE_MAX_SPEEDUP = 4.0  # A host can be sped up to this multiple of its configured rate
+ADAPTIVE_RATE_INCREASE = 0.05  # Fraction of the configured rate added after every fast, healthy response
+ADAPTIVE_RATE_DECREASE = 0.5  # Rate multiplier applied on 429/5xx responses, connection errors or slow responses
+ADAPTIVE_LATENCY_TARGET = 2.0  # Seconds; a smoothed response time above this backs the host off
+DEFAULT_REQUESTS_PER_SECOND = 1.0  # Initial request rate to any other host
+
+# Sharded scheduler settings
+SCHEDULER_WORKERS = 4  # Worker processes fetching (category, page range) work units
+SHARD_PAGES = 5  # Catalog pages of PAGE_SIZE products per work unit; fewer pages when larger pages are negotiated
+API_RATE_CEILING = 4.0  # Requests per second to the API host across all worker processes
+CDN_RATE_CEILING = 40.0  # Requests per second to the nutritional info CDN across all worker processes
+CDN_CONCURRENCY_CEILING = 16  # Requests in flight to the nutritional info CDN across all worker processes
+
+# HTTP connection pool settings
+# A pool smaller than the requests in flight to its host opens extra connections and discards them once they are done
+API_POOL_SIZE = max(  # Keep-alive connections kept open to the API host (through the proxy)
+    ASYNC_MAX_CONCURRENCY,
+    CATALOG_PAGE_CONCURRENCY + 4 * PROMOTION_PAGE_CONCURRENCY  # Catalog pages and the pages of the four promotion feeds
+)
+CDN_POOL_SIZE = max(NUTRITION_MAX_WORKERS, ASYNC_MAX_CONCURRENCY)  # Keep-alive connections kept open to the nutritional info CDN
+DEFAULT_POOL_SIZE = 2  # Keep-alive connections kept open to any other host
+HTTP2_ENABLED = False  # Send requests over HTTP/2 (requires httpx[http2])
+
+# Product parsing settings
+MEASURING_UNIT_CACHE_SIZE = 4096  # Distinct product descriptions whose parsed measuring unit is memoized
+
+# Nutritional info cache settings
+NUTRITION_CACHE_ENABLED = True  # Keep nutritional info JSONs on disk between runs
+NUTRITION_CACHE_DIR = os.path.join(PROJECT_DIR, 'cache', 'nutritional-info')
+NUTRITION_CACHE_TTL = 7 * 24 * 3600  # Seconds a cached entry is used without revalidating it
+NUTRITION_CACHE_MAX_BYTES = 50 * 1024 * 1024  # Least recently used entries are evicted beyond this size
+OUTPUT_DIR = os.path.join(PROJECT_DIR, "output")
+OUTPUT_FILE = "bm_productos_bebidas.json"
+OUTPUT_COMPRESSION = None  # Compression of the streamed JSON Lines file: None, "gzip" or "zstd"
+PARQUET_EXPORT = False  # Also export every completed crawl as a Parquet dataset (requires pyarrow)
+PARQUET_DIR = os.path.join(OUTPUT_DIR, "parquet")  # Partitioned by run date and category
+PARQUET_BATCH_SIZE = 10000  # Items converted per Arrow record batch
+PRICE_HISTORY_ENABLED = True  # Append the prices of every completed crawl to the price history database
+PRICE_HISTORY_DB = os.path.join(OUTPUT_DIR, "price_history.sqlite3")
+PROMOTION_INDEX_DIR = os.path.join(OUTPUT_DIR, "promotions")  # Promotion index of every category, saved once its feeds are fetched
+PROMOTION_INDEX_MAX_AGE = 0  # Seconds a saved promotion index is reused instead of fetching the promotion feeds again; 0 always fetches them
+
+# Instrumentation settings
+METRICS_ENABLED = True  # Time every request and crawl stage and write the metrics to METRICS_FILE at the end of the run
+METRICS_FILE = os.path.join(OUTPUT_DIR, "metrics.prom")  # Prometheus text format, e.g. for the node_exporter textfile collector
+TRACE_FILE = None  # OTLP JSON Lines file receiving a span per request and crawl stage, e.g. os.path.join(OUTPUT_DIR, "traces.jsonl")
+TRACE_BATCH_SIZE = 256  # Spans written per line of TRACE_FILE
+
+# Logging settings
+LOG_DIR = os.path.join(PROJECT_DIR, "logs")
+LOG_LEVEL = "INFO"  # Level of the scraper logs; "DEBUG" also dumps sampled products in full
+LOG_ASYNC = True  # Format and write log records in a background thread (QueueHandler/QueueListener)
+LOG_ITEM_SAMPLE_RATE = 0.01  # Fraction of the processed products dumped as JSON at DEBUG level; 1.0 dumps all of them
@@ -1,20 +1,6 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
-
-PROXY_URL = os.getenv('PROXY_URL', 'brd.superproxy.io:33335')
-PROXY_USER = os.getenv('PROXY_USER', '')
-PROXY_PASS = os.getenv('PROXY_PASS', '')
-
-if not PROXY_USER or not PROXY_PASS:
-    raise ValueError(
-        "Las credenciales del proxy deben estar configuradas en variables de entorno. "
-        "Crea un archivo .env con PROXY_USER y PROXY_PASS"
-    )
-
-PROXY_WITH_AUTH = f'http://{PROXY_USER}:{PROXY_PASS}@{PROXY_URL}'
-PROXIES = {'http': PROXY_WITH_AUTH, 'https': PROXY_WITH_AUTH}
+DEFAULT_PROXY_URL = 'brd.superproxy.io:33335'
 
 DEFAULT_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -30,3 +16,50 @@ API_HEADERS = {
     'Referer': 'https://www.online.bmsupermercados.es/es/c/bebidas/1690',
     'X-Requested-With': 'XMLHttpRequest',
 }
+
+_proxy_settings = None
+
+
+def load_proxy_settings():
+    """
+    Read the proxy settings from the environment and the `.env` file, on first use.
+
+    Returns:
+        A dictionary with PROXY_URL, PROXY_USER, PROXY_PASS, PROXY_WITH_AUTH and PROXIES.
+
+    Raises:
+        ValueError: If PROXY_USER or PROXY_PASS are not configured.
+    """
+    global _proxy_settings
+    if _proxy_settings is None:
+        from dotenv import load_dotenv
+        load_dotenv()
+
+        proxy_url = os.getenv('PROXY_URL', DEFAULT_PROXY_URL)
+        proxy_user = os.getenv('PROXY_USER', '')
+        proxy_pass = os.getenv('PROXY_PASS', '')
+
+        if not proxy_user or not proxy_pass:
+            raise ValueError(
+                "Las credenciales del proxy deben estar configuradas en variables de entorno. "
+                "Crea un archivo .env con PROXY_USER y PROXY_PASS"
+            )
+
+        proxy_with_auth = f'http://{proxy_user}:{proxy_pass}@{proxy_url}'
+        _proxy_settings = {
+            'PROXY_URL': proxy_url,
+            'PROXY_USER': proxy_user,
+            'PROXY_PASS': proxy_pass,
+            'PROXY_WITH_AUTH': proxy_with_auth,
+            'PROXIES': {'http': proxy_with_auth, 'https': proxy_with_auth},
+        }
+    return _proxy_settings
+
+
+def __getattr__(name):
+    # PROXY_URL, PROXY_USER, PROXY_PASS, PROXY_WITH_AUTH and PROXIES are loaded when first accessed
+    if name.startswith('PROXY'):
+        settings = load_proxy_settings()
+        if name in settings:
+            return settings[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,25 +1,69 @@
-import time
 import random
+from urllib.parse import urlsplit
+
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.task import deferLater
+
+from bm_scraper.config.config import BEVERAGES_API_URL
+from bm_scraper.utils.rate_limiter import get_rate_limiter, parse_retry_after
 
 
 class RateLimitingMiddleware:
+    """
+    Paces requests per host with the adaptive limiter shared with the standalone spiders.
+
+    Only the domains listed in the `RATE_LIMITED_DOMAINS` setting (domain -> maximum random
+    extra delay in seconds) are throttled; requests to any other domain, such as the
+    nutritional info CDN, go through untouched. The wait for a request slot is scheduled on
+    the reactor instead of sleeping, so requests to other domains and responses keep
+    flowing while a domain is throttled. Every response from a throttled domain is reported
+    back to the limiter, which speeds it up while responses are fast and healthy and backs
+    it off on 429/5xx responses, download errors or rising latency, honoring `Retry-After`.
+    """
+
     def __init__(self, crawler):
         self.crawler = crawler
-        self.download_delay = crawler.settings.getfloat('DOWNLOAD_DELAY', 1.0)
+        self.limiter = get_rate_limiter()
         self.randomize_delay = crawler.settings.getbool('RANDOMIZE_DOWNLOAD_DELAY', True)
-        self.max_delay = crawler.settings.getfloat('RANDOMIZE_DOWNLOAD_DELAY_MAX', 2.0)
+        self.domain_jitter = crawler.settings.getdict('RATE_LIMITED_DOMAINS', {urlsplit(BEVERAGES_API_URL).hostname: 0.5})
         
     @classmethod
     def from_crawler(cls, crawler):
         return cls(crawler)
+
+    def max_jitter(self, request):
+        """Maximum random extra delay of the domain of a request, or None if it is not throttled."""
+        return self.domain_jitter.get(urlparse_cached(request).hostname)
     
-    def process_request(self, request, spider):
+    async def process_request(self, request, spider):
+        max_jitter = self.max_jitter(request)
+        if max_jitter is None:
+            return None
+
+        delay = self.limiter.reserve(request.url)
         if self.randomize_delay:
-            delay = random.uniform(self.download_delay, self.max_delay)
-        else:
-            delay = self.download_delay
-            
-        time.sleep(delay)
+            delay += random.uniform(0, float(max_jitter))
+
+        if delay > 0:
+            from twisted.internet import reactor
+            await maybe_deferred_to_future(deferLater(reactor, delay, lambda: None))
+        return None
+
+    def process_response(self, request, response, spider):
+        if self.max_jitter(request) is None:
+            return response
+        self.limiter.record(
+            request.url,
+            latency=request.meta.get('download_latency'),
+            status=response.status,
+            retry_after=parse_retry_after(response.headers.get('Retry-After'))
+        )
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if self.max_jitter(request) is not None:
+            self.limiter.record(request.url, failed=True)
         return None
 
 
@@ -0,0 +1,21 @@
+from scrapy.exceptions import DropItem
+
+from bm_scraper.spiders.bebidas_spider_simple import process_product_data_from_api
+from bm_scraper.spiders.items import BmRawProductItem
+from bm_scraper.utils.promotions import PromotionIndex
+
+
+class ProductParsingPipeline:
+    """Builds the final `BmProductItem` of a raw product, its promotions and nutritional info."""
+
+    def process_item(self, item, spider):
+        if not isinstance(item, BmRawProductItem):
+            return item
+
+        product = item['product']
+        ean = product.get('ean')
+        promotions = PromotionIndex({ean: item['promotions']})
+        bm_item = process_product_data_from_api(product, promotions, {ean: item['nutrition']})
+        if bm_item is None:
+            raise DropItem(f"Failed to process product {product.get('id')}")
+        return bm_item.to_item()
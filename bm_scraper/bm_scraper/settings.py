@@ -24,7 +24,8 @@ ROBOTSTXT_OBEY = True
 # Concurrency and throttling settings
 #CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
-DOWNLOAD_DELAY = 1
+# Requests are paced by RateLimitingMiddleware's adaptive per-host limiter instead
+DOWNLOAD_DELAY = 0
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -60,9 +61,9 @@ DOWNLOADER_MIDDLEWARES = {
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "bm_scraper.pipelines.BmScraperPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "bm_scraper.pipelines.ProductParsingPipeline": 400,
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -90,7 +91,11 @@ FEED_EXPORT_ENCODING = "utf-8"
 
 # Configuración ética de scraping
 RANDOMIZE_DOWNLOAD_DELAY = True
-RANDOMIZE_DOWNLOAD_DELAY_MAX = 2.0
+# Domains paced by RateLimitingMiddleware, with the maximum random extra delay (seconds) added
+# to each of their requests; other domains, like the nutritional info CDN, are not throttled
+RATE_LIMITED_DOMAINS = {
+    "www.online.bmsupermercados.es": 0.5,
+}
 
 # User-Agent identificable para el scraper
 USER_AGENT = 'BM-Scraper/1.0 (+https://github.com/tu-repo/bm-scraper)'
@@ -99,7 +104,7 @@ USER_AGENT = 'BM-Scraper/1.0 (+https://github.com/tu-repo/bm-scraper)'
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'logs/scraper.log'
 
-# Configuración de retry para errores HTTP
+# Configuración de retry para errores HTTP (RETRY_HTTP_CODES igual que en config/config.py)
 RETRY_TIMES = 3
 RETRY_HTTP_CODES = [500, 502, 503, 504, 408, 429]
 
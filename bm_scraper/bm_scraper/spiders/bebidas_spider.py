@@ -0,0 +1,256 @@
+import json
+
+import scrapy
+
+from bm_scraper.config.proxy_config import PROXIES, API_HEADERS
+from bm_scraper.config.config import (
+    CATEGORY_ID,
+    BEVERAGES_API_URL,
+    NUTRITIONAL_INFO_URL
+)
+from bm_scraper.spiders.bebidas_spider_simple import PROMOTION_FEEDS
+from bm_scraper.spiders.items import BmRawProductItem
+from bm_scraper.utils.nutrition_cache import get_nutrition_cache
+from bm_scraper.utils.pagination import CatalogPlan, get_page_sizes, page_count, page_url
+from bm_scraper.utils.promotions import PromotionIndex
+
+
+class BebidasSpider(scrapy.Spider):
+    """
+    Scrapy spider for the BM Supermercados catalog.
+
+    The promotion feeds, the catalog pages and the nutritional info JSONs are all Scrapy
+    requests, so they run concurrently on the Twisted reactor under the project settings
+    (downloader middlewares, retries, AutoThrottle, HTTP cache, feeds). The first catalog
+    page tells how many products the category has and the remaining pages are requested at
+    once; once they are all answered, the pages served while the catalog changed are
+    requested again (see `CatalogPlan`). Pages are requested with the page size last
+    negotiated by the standalone engines (`PageSizes`), as the spider does not probe the
+    API from the reactor. Every new product yields a `BmRawProductItem` once its
+    nutritional info is known and every promotion feed has been fetched: items completed
+    earlier are buffered in the spider and released, with their promotions, by the
+    callback of the last feed page, so they never hold a slot of the item pipelines. The
+    item pipelines then build the final `BmProductItem`.
+
+    Arguments:
+        category: The store category ID to crawl, e.g. `-a category=1690` (integer).
+    """
+
+    name = "bebidas"
+
+    def __init__(self, category=CATEGORY_ID, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.category = int(category)
+        self.promotions = PromotionIndex()
+        self.pending_feeds = len(PROMOTION_FEEDS)
+        self.pending_promotion_pages = [1 for _ in PROMOTION_FEEDS]
+        # Raw items completed before every promotion feed was fetched
+        self.waiting_items = []
+        self.seen_product_ids = set()
+        self.page_size = get_page_sizes().saved(BEVERAGES_API_URL, self.category)
+        self.plan = None
+        self.reconciled = False
+        self.pending_catalog_pages = 0
+        self.nutrition_cache = get_nutrition_cache()
+
+    def api_request(self, url, callback, **kwargs):
+        return scrapy.Request(
+            url,
+            callback=callback,
+            headers=API_HEADERS,
+            meta={'proxy': PROXIES.get('https')},
+            dont_filter=True,
+            **kwargs
+        )
+
+    def catalog_url(self, page_number):
+        return page_url(BEVERAGES_API_URL, page_number, self.page_size, self.category)
+
+    def start_requests(self):
+        # Promotions are requested first so the pipelines can join the products as soon as possible
+        for index, (api_url, promo_type) in enumerate(PROMOTION_FEEDS):
+            yield self.promotion_request(index, api_url, promo_type, 1, get_page_sizes().saved(api_url, self.category))
+        yield self.catalog_request(1)
+
+    def catalog_request(self, page_number):
+        self.pending_catalog_pages += 1
+        return self.api_request(
+            self.catalog_url(page_number),
+            self.parse_catalog,
+            errback=self.catalog_failed,
+            cb_kwargs={'page_number': page_number}
+        )
+
+    def promotion_request(self, index, api_url, promo_type, page_number, page_size):
+        return self.api_request(
+            page_url(api_url, page_number, page_size, self.category),
+            self.parse_promotions,
+            errback=self.promotion_failed,
+            priority=10,
+            cb_kwargs={
+                'index': index, 'api_url': api_url, 'promo_type': promo_type, 'page_number': page_number, 'page_size': page_size
+            }
+        )
+
+    def response_json(self, response, description):
+        """
+        Decoded JSON body of an API response, or None if it is not a JSON object.
+
+        A 200 answer can still carry a proxy error page or a truncated body; the exception
+        would be raised in the callback, where Scrapy does not call the errback, so it is
+        logged here like a failed request instead.
+        """
+        try:
+            data = json.loads(response.text)
+        except ValueError as e:
+            self.logger.error(f"Error decoding {description} from {response.url}: {e}")
+            return None
+        if not isinstance(data, dict):
+            self.logger.error(f"Error decoding {description} from {response.url}: not a JSON object")
+            return None
+        return data
+
+    def parse_promotions(self, response, index, api_url, promo_type, page_number, page_size):
+        data = self.response_json(response, 'promotions')
+        if data is None:
+            yield from self.promotion_page_done(index)
+            return
+        products = data.get('products', [])
+        self.promotions.add_products(products, promo_type)
+
+        total_count = data.get('totalCount')
+        next_pages = []
+        if page_number == 1 and total_count:
+            page_size = get_page_sizes().served(api_url, self.category, page_size, len(products), total_count)
+            next_pages = range(2, page_count(total_count, page_size) + 1)
+        elif not total_count and products and data.get('hasMore', False):
+            # Without a total count the pages can only be followed one after another
+            next_pages = [page_number + 1]
+        for next_page in next_pages:
+            self.pending_promotion_pages[index] += 1
+            yield self.promotion_request(index, api_url, promo_type, next_page, page_size)
+        yield from self.promotion_page_done(index)
+
+    def promotion_failed(self, failure):
+        self.logger.error(f"Error fetching promotions from {failure.request.url}: {failure.value}")
+        yield from self.promotion_page_done(failure.request.cb_kwargs['index'])
+
+    def promotion_page_done(self, index):
+        self.pending_promotion_pages[index] -= 1
+        if self.pending_promotion_pages[index] == 0:
+            yield from self.feed_done(index)
+
+    def feed_done(self, index):
+        promo_type = PROMOTION_FEEDS[index][1]
+        self.logger.info(f"{promo_type} promotions: {self.promotions.count(promo_type)} products")
+        self.pending_feeds -= 1
+        if self.pending_feeds == 0:
+            waiting_items, self.waiting_items = self.waiting_items, []
+            if waiting_items:
+                self.logger.info(f"Promotions ready; releasing {len(waiting_items)} buffered products")
+            for item in waiting_items:
+                yield from self.joined(item)
+
+    def joined(self, item):
+        # Items wait in the spider, not in the item pipelines, until every promotion feed is fetched
+        if self.pending_feeds:
+            self.waiting_items.append(item)
+            return
+        item['promotions'] = self.promotions.promotions(item['product'].get('ean'))
+        yield item
+
+    def parse_catalog(self, response, page_number):
+        data = self.response_json(response, 'catalog page')
+        if data is None:
+            yield from self.catalog_page_done()
+            return
+        products = data.get('products', [])
+        self.logger.info(f"Found {len(products)} products on page {page_number}")
+
+        total_count = data.get('totalCount')
+        if self.plan is not None:
+            self.plan.record(page_number, total_count)
+        elif total_count:
+            if page_number == 1:
+                self.page_size = get_page_sizes().served(BEVERAGES_API_URL, self.category, self.page_size, len(products), total_count)
+            self.plan = CatalogPlan(total_count, page_number, self.page_size)
+            for next_page in self.plan.remaining_pages:
+                yield self.catalog_request(next_page)
+        elif products and data.get('hasMore', False):
+            # Without a total count the pages can only be followed one after another
+            yield self.catalog_request(page_number + 1)
+
+        for position, product in enumerate(products):
+            product_id = product.get('id')
+            if product_id in self.seen_product_ids:
+                continue
+            self.seen_product_ids.add(product_id)
+            yield from self.nutrition_request(product, page_number, position)
+        yield from self.catalog_page_done()
+
+    def catalog_failed(self, failure):
+        self.logger.error(f"Error fetching catalog page {failure.request.url}: {failure.value}")
+        yield from self.catalog_page_done()
+
+    def catalog_page_done(self):
+        # Once every planned page is answered, the pages served while the catalog changed are requested again
+        self.pending_catalog_pages -= 1
+        if self.pending_catalog_pages == 0 and self.plan is not None and not self.reconciled:
+            self.reconciled = True
+            for page_number in self.plan.reconcile_pages():
+                yield self.catalog_request(page_number)
+
+    def nutrition_request(self, product, page_number, position):
+        ean = product.get('ean')
+        item = BmRawProductItem(product=product, nutrition=None, page=page_number, position=position)
+        if not ean:
+            yield from self.joined(item)
+            return
+
+        entry, fresh = self.nutrition_cache.lookup(ean) if self.nutrition_cache else (None, False)
+        if fresh:
+            item['nutrition'] = entry['body']
+            yield from self.joined(item)
+            return
+
+        headers = self.nutrition_cache.conditional_headers(entry) if self.nutrition_cache else {}
+        yield scrapy.Request(
+            NUTRITIONAL_INFO_URL.format(ean=ean),
+            callback=self.parse_nutrition,
+            errback=self.nutrition_failed,
+            headers=headers,
+            meta={'handle_httpstatus_list': [304, 404]},
+            cb_kwargs={'item': item, 'entry': entry}
+        )
+
+    def parse_nutrition(self, response, item, entry):
+        ean = item['product'].get('ean')
+        if response.status == 304 and entry:
+            item['nutrition'] = self.nutrition_cache.revalidated(ean, entry)
+        elif response.status == 404:
+            if self.nutrition_cache:
+                self.nutrition_cache.put(ean, None)
+        elif response.status == 200:
+            try:
+                item['nutrition'] = json.loads(response.text)
+            except ValueError as e:
+                # The product is still yielded, without nutritional info, as when the lookup fails
+                self.logger.warning(f"Nutritional info lookup failed for EAN {ean}: {e}")
+                yield from self.joined(item)
+                return
+            if self.nutrition_cache:
+                item['nutrition'] = self.nutrition_cache.put(
+                    ean, item['nutrition'],
+                    response.headers.get('ETag', b'').decode() or None,
+                    response.headers.get('Last-Modified', b'').decode() or None
+                )
+        yield from self.joined(item)
+
+    def nutrition_failed(self, failure):
+        item = failure.request.cb_kwargs['item']
+        self.logger.warning(f"Nutritional info lookup failed for EAN {item['product'].get('ean')}: {failure.value}")
+        yield from self.joined(item)
+
+    def closed(self, reason):
+        if self.waiting_items:
+            self.logger.error(f"{len(self.waiting_items)} products were never released: a promotion feed did not finish")
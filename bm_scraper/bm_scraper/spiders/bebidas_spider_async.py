@@ -0,0 +1,365 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bm_scraper.config.proxy_config import PROXIES, API_HEADERS
+from bm_scraper.config.config import (
+    CATEGORY_ID,
+    BEVERAGES_API_URL,
+    NUTRITIONAL_INFO_URL,
+    MAX_EMPTY_PAGES,
+    REQUEST_TIMEOUT,
+    ASYNC_MAX_CONCURRENCY,
+    ASYNC_PAGE_WINDOW
+)
+from bm_scraper.spiders.bebidas_spider_simple import (
+    PROMOTION_FEEDS,
+    catalog_page_size,
+    flush_pending_pages,
+    join_promotion_feeds,
+    saved_promotions
+)
+from bm_scraper.utils.metrics import get_metrics
+from bm_scraper.utils.nutrition import NutritionFetchStats, fetch_nutritional_data_timed
+from bm_scraper.utils.nutrition_cache import get_nutrition_cache
+from bm_scraper.utils.pagination import CatalogPlan, get_page_sizes, page_count, page_url
+from bm_scraper.utils.promotions import PromotionIndex
+from bm_scraper.utils.rate_limiter import get_rate_limiter
+
+
+def _get_json(url):
+    # The HTTP stack is only imported by the code paths that send requests
+    from bm_scraper.utils.http_client import http_get
+
+    response = http_get(url, proxies=PROXIES, headers=API_HEADERS, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+class AsyncApiClient:
+    """
+    Runs the blocking API and CDN requests of the crawl from an asyncio event loop.
+
+    This is a bridge to the blocking `requests` stack of `HttpClient`, not a native asyncio
+    HTTP client: requests are executed in a bounded thread pool, so at most
+    `max_concurrency` of them are in flight at once (the connection pools of the hosts are
+    sized to keep one connection per thread, see `API_POOL_SIZE`), and every request first
+    waits on the event loop for a slot from the shared adaptive rate limiter of its host:
+    the API host starts at the request rate of the sequential crawl while the nutritional
+    info CDN gets its own, higher rate.
+
+    Args:
+        max_concurrency: Maximum number of requests in flight across all hosts (integer).
+    """
+
+    def __init__(self, max_concurrency=ASYNC_MAX_CONCURRENCY):
+        self.limiter = get_rate_limiter()
+        self.nutrition_stats = NutritionFetchStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='async-engine')
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def get_json(self, url):
+        # The HTTP stack is only imported by the code paths that send requests
+        from bm_scraper.utils.http_client import call_paced
+
+        await self._acquire(url)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, contextvars.copy_context().run, call_paced, _get_json, url
+        )
+
+    async def _acquire(self, url):
+        started = time.perf_counter()
+        await self.limiter.acquire(url)
+        get_metrics().observe_wait(url, time.perf_counter() - started)
+
+    async def get_nutritional_data(self, ean):
+        from bm_scraper.utils.http_client import call_paced
+
+        # Fresh cache entries are served right here, so they neither wait for nor use up a CDN slot
+        cache = get_nutrition_cache()
+        cached = cache.lookup(ean) if cache else (None, False)
+        entry, fresh = cached
+        if fresh:
+            self.nutrition_stats.record(ean, 0.0, 'found' if entry['body'] else 'missing')
+            return entry['body']
+
+        await self._acquire(NUTRITIONAL_INFO_URL.format(ean=ean))
+        ean, data, elapsed, outcome, error = await asyncio.get_running_loop().run_in_executor(
+            self._executor, contextvars.copy_context().run, call_paced, fetch_nutritional_data_timed, ean, cached
+        )
+        self.nutrition_stats.record(ean, elapsed, outcome, error)
+        return data
+
+
+async def fetch_promotion_page_async(client, api_url, promo_type, category, page_number, page_size):
+    """Asynchronous counterpart of `fetch_promotion_page`."""
+    # The HTTP stack is only imported by the code paths that send requests
+    from requests.exceptions import RequestException
+
+    current_url = page_url(api_url, page_number, page_size, category)
+    try:
+        return await client.get_json(current_url)
+    except RequestException as e:
+        logging.error(f"Error fetching {promo_type} page {page_number}: {e}")
+    except ValueError as e:
+        logging.error(f"Error processing {promo_type} page {page_number}: {e}")
+    return None
+
+
+async def fetch_promotion_products_async(client, api_url, promo_type, category=CATEGORY_ID, page_size=None, probed_page=None):
+    """
+    Asynchronous counterpart of `fetch_promotion_products`.
+
+    Once the first page gives the total count of the feed, its remaining pages are all
+    requested at once, the client bounding the requests in flight and the rate limiter
+    pacing them; they are indexed in page order. Without a total count the pages are
+    followed one after another with the same empty-page rules.
+
+    Args:
+        client: The client used to issue the requests (AsyncApiClient).
+        api_url: The API URL to fetch promotions from, with `{category}`, `{page}`,
+            `{limit}` and `{offset}` placeholders (string).
+        promo_type: The type of promotion (string).
+        category: The store category ID to fetch promotions for (integer).
+        page_size: Products per page; negotiated with the API by default (integer).
+        probed_page: The first page of the feed, already fetched with `page_size` while
+            negotiating it; requested by default (dictionary).
+
+    Returns:
+        A PromotionIndex of the promotions of the feed.
+    """
+    promotions = PromotionIndex()
+    logging.info(f"Fetching {promo_type} promotions from {api_url}...")
+
+    with get_metrics().stage('promotions', feed=promo_type):
+        if page_size is None:
+            page_size, probed_page = await asyncio.to_thread(get_page_sizes().negotiate, api_url, category)
+        data = probed_page
+        if data is None:
+            data = await fetch_promotion_page_async(client, api_url, promo_type, category, 1, page_size)
+        if data is None:
+            return promotions
+        products = data.get('products', [])
+        new_count = promotions.add_products(products, promo_type)
+
+        total_count = data.get('totalCount')
+        if total_count:
+            page_size = get_page_sizes().served(api_url, category, page_size, len(products), total_count)
+            pages = await asyncio.gather(*(
+                fetch_promotion_page_async(client, api_url, promo_type, category, page_number, page_size)
+                for page_number in range(2, page_count(total_count, page_size) + 1)
+            ))
+            for page_data in pages:
+                if page_data is not None:
+                    promotions.add_products(page_data.get('products', []), promo_type)
+        else:
+            page_number = 1
+            consecutive_empty_pages = 0 if new_count else 1
+            while data.get('hasMore', False) and consecutive_empty_pages < MAX_EMPTY_PAGES:
+                page_number += 1
+                data = await fetch_promotion_page_async(client, api_url, promo_type, category, page_number, page_size)
+                if data is None:
+                    break
+                if promotions.add_products(data.get('products', []), promo_type):
+                    consecutive_empty_pages = 0
+                else:
+                    consecutive_empty_pages += 1
+            if consecutive_empty_pages >= MAX_EMPTY_PAGES:
+                logging.info(f"Stopping: {consecutive_empty_pages} consecutive empty pages {promo_type}")
+
+    logging.info(f"{promo_type} promotions: {promotions.count(promo_type)} products")
+    return promotions
+
+
+async def _scrape_beverages_async(client, snapshot, writer, checkpoint, category):
+    # The HTTP stack is only imported by the code paths that send requests
+    from requests.exceptions import RequestException
+
+    promotions = saved_promotions(category, checkpoint)
+    # Every feed negotiates its own page size: the API can accept a different limit on each endpoint
+    promo_tasks = [] if promotions is not None else [
+        asyncio.create_task(fetch_promotion_products_async(client, api_url, promo_type, category))
+        for api_url, promo_type in PROMOTION_FEEDS
+    ]
+    page_size, probed_page = await asyncio.to_thread(catalog_page_size, category, checkpoint)
+    page_tasks = {}
+    nutrition_tasks = {}
+    # Pages to process in order: the first one, then every page of the plan it gives, then the pages to reconcile
+    plan = None
+    reconciled = False
+    page_queue = [checkpoint.last_page + 1 if checkpoint is not None else 1]
+
+    async def fetch_page(page_number):
+        nonlocal probed_page
+        if probed_page is not None:
+            # The first page was fetched while negotiating the page size
+            data, probed_page = probed_page, None
+        else:
+            with get_metrics().stage('fetch', page=page_number):
+                data = await client.get_json(page_url(BEVERAGES_API_URL, page_number, page_size, category))
+        if plan is not None:
+            plan.record(page_number, data.get('totalCount'))
+        # Start the nutritional lookups as soon as the page arrives, before it is processed
+        for product in data.get('products', []):
+            ean = product.get('ean')
+            if snapshot is not None and not snapshot.needs_enrichment(product):
+                continue
+            if ean and ean not in nutrition_tasks:
+                nutrition_tasks[ean] = asyncio.create_task(client.get_nutritional_data(ean))
+        return data
+
+    def schedule_pages(position):
+        for ahead in range(position, min(position + ASYNC_PAGE_WINDOW + 1, len(page_queue))):
+            if ahead not in page_tasks:
+                page_tasks[ahead] = asyncio.create_task(fetch_page(page_queue[ahead]))
+
+    scraped_products = []
+    # Processed pages waiting for the promotion feeds, in page order
+    pending_pages = []
+    scraped_count = 0
+    seen_product_ids = set(checkpoint.seen_product_ids) if checkpoint is not None else set()
+    consecutive_empty_pages = 0
+    crawl_interrupted = False
+
+    try:
+        position = 0
+        while position < len(page_queue) or (plan is not None and not reconciled):
+            if position == len(page_queue):
+                reconciled = True
+                page_queue.extend(plan.reconcile_pages())
+                continue
+            schedule_pages(position)
+            page_number = page_queue[position]
+            page_task = page_tasks.pop(position)
+            position += 1
+            logging.info(f"Processing page {page_number} of {plan.last_page if plan is not None else 'unknown'}...")
+
+            try:
+                data = await page_task
+            except RequestException as e:
+                logging.error(f"Error getting product data (Page {page_number}): {e}")
+                crawl_interrupted = True
+                break
+            except Exception as e:
+                logging.error(f"Error processing data from page {page_number}: {e}")
+                if plan is None:
+                    consecutive_empty_pages += 1
+                    if consecutive_empty_pages < MAX_EMPTY_PAGES:
+                        page_queue.append(page_number + 1)
+                continue
+
+            products = data.get('products', [])
+            if not products:
+                logging.info(f"No products found in API page {page_number}.")
+                # A planned page can come back empty if the catalog shrank while it was crawled
+                if plan is None:
+                    break
+                continue
+
+            if plan is None and data.get('totalCount'):
+                if page_number == 1:
+                    page_size = get_page_sizes().served(BEVERAGES_API_URL, category, page_size, len(products), data['totalCount'])
+                    if checkpoint is not None:
+                        checkpoint.page_size = page_size
+                plan = CatalogPlan(data['totalCount'], page_number, page_size)
+                page_queue.extend(plan.remaining_pages)
+                schedule_pages(position)
+                logging.info(f"{plan.total_count} products in {plan.last_page} pages of {page_size}; requesting the remaining pages")
+
+            page_products = {}
+            for product in products:
+                product_id = product.get('id')
+                if product_id not in seen_product_ids and product_id not in page_products:
+                    page_products[product_id] = product
+            seen_product_ids.update(page_products)
+
+            eans = [product.get('ean') for product in page_products.values() if product.get('ean') in nutrition_tasks]
+            with get_metrics().stage('enrich', page=page_number):
+                nutrition_map = dict(zip(eans, await asyncio.gather(*(nutrition_tasks[ean] for ean in eans))))
+            pending_pages.append((page_number, page_products, nutrition_map))
+
+            # Join step: attribute promotions as soon as every promotion feed is available
+            if promotions is None and all(task.done() for task in promo_tasks):
+                promotions = join_promotion_feeds([task.result() for task in promo_tasks], category, checkpoint)
+            if promotions is not None:
+                scraped_count += flush_pending_pages(pending_pages, promotions, scraped_products, snapshot, writer, checkpoint)
+
+            new_products_count = len(page_products)
+            if new_products_count:
+                consecutive_empty_pages = 0
+                logging.info(f"Found {new_products_count} new products on page {page_number}")
+            else:
+                consecutive_empty_pages += 1
+
+            if plan is not None:
+                continue
+
+            # Without a total count the pages can only be followed one after another
+            if consecutive_empty_pages >= MAX_EMPTY_PAGES:
+                logging.info(f"Stopping: {consecutive_empty_pages} consecutive pages with no new products")
+                break
+            if not data.get('hasMore', False):
+                logging.info(f"API indicates no more pages available")
+                break
+            page_queue.append(page_number + 1)
+
+        if pending_pages:
+            logging.info(f"Waiting for promotion feeds to join {len(pending_pages)} buffered pages...")
+            if promotions is None:
+                promotions = join_promotion_feeds(await asyncio.gather(*promo_tasks), category, checkpoint)
+            scraped_count += flush_pending_pages(pending_pages, promotions, scraped_products, snapshot, writer, checkpoint)
+    finally:
+        for task in [*page_tasks.values(), *nutrition_tasks.values(), *promo_tasks]:
+            task.cancel()
+
+    if checkpoint is not None:
+        checkpoint.completed = not crawl_interrupted
+
+    return scraped_products, scraped_count
+
+
+def scrape_beverages_async(snapshot=None, writer=None, checkpoint=None, category=CATEGORY_ID):
+    """
+    Scrape beverage product data from the BM Supermercados API with an asyncio engine.
+
+    Catalog pages, the four promotion feeds and the nutritional info lookups are driven
+    concurrently, each host throttled by its own token bucket. Processed pages are buffered
+    until every promotion feed has finished and then joined with the promotions, so a slow
+    feed never stalls the catalog crawl. Once the first catalog page
+    gives the page count of the category, the remaining pages are prefetched up to
+    `ASYNC_PAGE_WINDOW` pages ahead but processed in order with the same deduplication,
+    reconciliation and stop rules as `scrape_beverages_api_only`, so both return the same
+    items.
+
+    Args:
+        snapshot: Previous snapshot for incremental runs; only products whose payload or
+            promotions changed are parsed and enriched again (IncrementalSnapshot).
+        writer: Streaming output stage; when given, items are written to it as soon as
+            they are processed instead of being kept in memory (JsonLinesWriter).
+        checkpoint: Crawl progress to start from and save after every page, as in
+            `scrape_beverages_api_only` (CrawlCheckpoint).
+        category: The store category ID to crawl; Bebidas by default (integer).
+
+    Returns:
+        A list of BmProductRecord objects containing processed product data, empty when the
+        items are streamed to `writer`.
+    """
+    # The HTTP stack is only imported by the code paths that send requests
+    from bm_scraper.utils.http_client import get_http_client
+
+    started = time.perf_counter()
+    client = AsyncApiClient()
+    try:
+        scraped_products, scraped_count = asyncio.run(_scrape_beverages_async(client, snapshot, writer, checkpoint, category))
+    finally:
+        client.close()
+
+    client.nutrition_stats.log_summary()
+    get_http_client().log_stats()
+    logging.info(f"Scraping completed in {time.perf_counter() - started:.1f}s. Total scraped products: {scraped_count}")
+
+    return scraped_products
@@ -1,26 +1,44 @@
 
+import argparse
+import contextvars
 import json
 import os
 import sys
 import time
 import re
-import requests
 import logging
-from requests.exceptions import RequestException
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 
-# Add parent directory to path for imports
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+# Running the file directly instead of with `python -m` needs the project directory on the path
+if not __package__:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from bm_scraper.spiders.items import BmProductItem
+from bm_scraper.spiders.records import BmProductRecord
 from bm_scraper.config.proxy_config import PROXIES, API_HEADERS
 from bm_scraper.utils.product_parsers import (
     parse_measuring_unit, 
+    parse_measuring_units,
     get_hierarchical_category,
     get_nutritional_data, 
     get_value_or_not_found
 )
 from bm_scraper.utils.fallback_data import generate_fallback_data
+from bm_scraper.utils.snapshot import IncrementalSnapshot
+from bm_scraper.utils.metrics import get_metrics
+from bm_scraper.utils.output_writer import JsonLinesWriter
+from bm_scraper.utils.checkpoint import CrawlCheckpoint
+from bm_scraper.utils.nutrition import NutritionFetcher
+from bm_scraper.utils.pagination import CatalogPlan, get_page_sizes, page_count, page_url
+from bm_scraper.utils.promotions import (
+    PromotionIndex,
+    load_promotion_index,
+    offer_promotion,
+    offer_type,
+    save_promotion_index
+)
 from bm_scraper.config.config import (
+    CATEGORY_ID,
     BEVERAGES_API_URL,
     MXN_PROMO_API_URL,
     OUTPUT_DIR,
@@ -28,153 +46,191 @@ from bm_scraper.config.config import (
     SECOND_UNIT_PROMO_API_URL,
     OFFER_PRICE_PROMO_API_URL,
     OFFER_DEFERRED_PROMO_API_URL,
-    MAX_PAGES,
-    OFFER_PRICE_MAX_PAGES,
     MAX_EMPTY_PAGES,
-    MAX_RETRIES,
+    CATALOG_PAGE_CONCURRENCY,
+    PROMOTION_PAGE_CONCURRENCY,
     REQUEST_TIMEOUT,
-    RETRY_DELAY,
-    PAGE_DELAY
+    SCHEDULER_WORKERS,
+    PARQUET_EXPORT,
+    PRICE_HISTORY_ENABLED,
+    TRACE_FILE,
+    LOG_LEVEL,
+    LOG_ITEM_SAMPLE_RATE
 )
 from bm_scraper.utils.logging_config import configure_logging
 
+# Promotion feeds in attribution precedence order: MxN > SecondUnit > OfferPrice > OfferDeferred
+PROMOTION_FEEDS = [
+    (MXN_PROMO_API_URL, "MxN"),
+    (SECOND_UNIT_PROMO_API_URL, "SecondUnitDiscount"),
+    (OFFER_PRICE_PROMO_API_URL, "OfferPrice"),
+    (OFFER_DEFERRED_PROMO_API_URL, "OfferDeferred"),
+]
+
+def fetch_promotion_page(api_url, promo_type, category, page_number, page_size):
+    """
+    Fetch a page of a promotion feed.
+
+    Returns:
+        The decoded API response, or None if the page could not be fetched or decoded.
+    """
+    # The HTTP stack is only imported by the code paths that send requests
+    from requests.exceptions import RequestException
 
-configure_logging()
+    from bm_scraper.utils.http_client import http_get
 
-def fetch_promotion_products(api_url, promo_type):
+    current_url = page_url(api_url, page_number, page_size, category)
+    try:
+        response = http_get(current_url, proxies=PROXIES, headers=API_HEADERS, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    except RequestException as e:
+        logging.error(f"Error fetching {promo_type} page {page_number}: {e}")
+    except ValueError as e:
+        logging.error(f"Error processing {promo_type} page {page_number}: {e}")
+    return None
+
+def fetch_promotion_products(api_url, promo_type, category=CATEGORY_ID, page_size=None, probed_page=None):
     """
     Fetch promotional products from a specified BM Supermercados API URL.
 
-    Iterates through pages of the API response (up to a maximum, depending on promo_type),
-    extracts promotional data for products, and maps EANs to promotion details. Handles
-    pagination, retries for failed requests, and stops early if consecutive empty pages are
-    encountered.
+    The first page of the feed tells how many products it has (`totalCount`); the remaining
+    pages are then requested concurrently, `PROMOTION_PAGE_CONCURRENCY` at a time and paced
+    by the rate limiter, so the whole feed is indexed rather than its first page. Pages are
+    indexed in page order. Without a total count the pages are followed one after another
+    while the API reports more (`hasMore`), stopping after `MAX_EMPTY_PAGES` consecutive
+    pages without new promotions. A page that cannot be fetched once the retry policy of
+    the HTTP client gives up on it is skipped.
 
     Args:
-        api_url: The API URL to fetch promotions from, with optional `{page}` and `{offset}`
-            placeholders for pagination (string).
+        api_url: The API URL to fetch promotions from, with `{category}`, `{page}`,
+            `{limit}` and `{offset}` placeholders (string).
         promo_type: The type of promotion, e.g., 'MxN', 'SecondUnitDiscount', 'OfferPrice',
             or 'OfferDeferred' (string).
+        category: The store category ID to fetch promotions for (integer).
+        page_size: Products per page; negotiated with the API by default (integer).
+        probed_page: The first page of the feed, already fetched with `page_size` while
+            negotiating it; requested by default (dictionary).
 
     Returns:
-        A dictionary mapping product EANs to promotion details, where each entry contains
-        'minDescription', 'shortDescription', and 'type'.
+        A PromotionIndex of the promotions of the feed.
     """
-    promo_map = {}
-    seen_eans = set()
-    max_pages = 1 if promo_type != "OfferPrice" else OFFER_PRICE_MAX_PAGES
-    consecutive_empty_pages = 0
-
+    promotions = PromotionIndex()
     logging.info(f"Fetching {promo_type} promotions from {api_url}...")
 
-    for page_number in range(1, max_pages + 1):
-        offset = (page_number - 1) * 20
-        current_url = api_url.format(page=page_number, offset=offset) if "{page}" in api_url else api_url
-
-        retries = 0
-        while retries < MAX_RETRIES:
-            try:
-                response = requests.get(current_url, proxies=PROXIES, headers=API_HEADERS, timeout=REQUEST_TIMEOUT)
-                response.raise_for_status()
-                data = response.json()
-                
-                products = data.get('products', [])
-                total_count = data.get('totalCount', 0)
-                has_more = data.get('hasMore', False)
-                
-                new_count = 0
-                for product in products:
-                    ean = product.get('ean')
-                    if ean in seen_eans:
-                        continue
-                    
-                    offers = product.get('offers', [])
-                    if offers:
-                        offer = offers[0]
-                        min_desc = offer.get('minDescription', '').strip()
-                        short_desc = offer.get('shortDescription', '').strip()
-                        if min_desc or short_desc:
-                            promo_map[ean] = {
-                                'minDescription': min_desc,
-                                'shortDescription': short_desc,
-                                'type': promo_type
-                            }
-                            seen_eans.add(ean)
-                            new_count += 1
-
-                if new_count == 0:
-                    consecutive_empty_pages += 1
-                    if consecutive_empty_pages >= MAX_EMPTY_PAGES:
-                        break
-                else:
-                    consecutive_empty_pages = 0
-
-                if not has_more or promo_type != "OfferPrice":
+    with get_metrics().stage('promotions', feed=promo_type):
+        if page_size is None:
+            page_size, probed_page = get_page_sizes().negotiate(api_url, category)
+        data = probed_page if probed_page is not None else fetch_promotion_page(api_url, promo_type, category, 1, page_size)
+        if data is None:
+            return promotions
+        products = data.get('products', [])
+        new_count = promotions.add_products(products, promo_type)
+
+        total_count = data.get('totalCount')
+        if total_count:
+            page_size = get_page_sizes().served(api_url, category, page_size, len(products), total_count)
+            pages = range(2, page_count(total_count, page_size) + 1)
+            with ThreadPoolExecutor(max_workers=PROMOTION_PAGE_CONCURRENCY, thread_name_prefix='promotion-pages') as executor:
+                # Each page runs in a copy of this context, so its request spans nest under the feed's stage
+                page_results = executor.map(
+                    lambda page_number: contextvars.copy_context().run(fetch_promotion_page, api_url, promo_type, category, page_number, page_size),
+                    pages
+                )
+                for page_data in page_results:
+                    if page_data is not None:
+                        promotions.add_products(page_data.get('products', []), promo_type)
+        else:
+            # Without a total count the pages can only be followed one after another
+            page_number = 1
+            consecutive_empty_pages = 0 if new_count else 1
+            while data.get('hasMore', False) and consecutive_empty_pages < MAX_EMPTY_PAGES:
+                page_number += 1
+                data = fetch_promotion_page(api_url, promo_type, category, page_number, page_size)
+                if data is None:
                     break
+                if promotions.add_products(data.get('products', []), promo_type):
+                    consecutive_empty_pages = 0
+                else:
+                    consecutive_empty_pages += 1
+            if consecutive_empty_pages >= MAX_EMPTY_PAGES:
+                logging.info(f"Stopping: {consecutive_empty_pages} consecutive empty pages {promo_type}")
 
-                break  
-
-            except RequestException as e:
-                retries += 1
-                logging.error(f"Error fetching {promo_type} page {page_number}, try {retries}/{MAX_RETRIES}: {e}")
-                if retries >= MAX_RETRIES:
-                    break
-                time.sleep(RETRY_DELAY)
-            except Exception as e:
-                logging.error(f"Error processing {promo_type} page {page_number}: {e}")
-                consecutive_empty_pages += 1
-                if consecutive_empty_pages >= MAX_EMPTY_PAGES:
-                    logging.info(f"Stopping: {consecutive_empty_pages} consecutive empty pages {promo_type}")
-                    break
-                break  
+    logging.info(f"{promo_type} promotions: {promotions.count(promo_type)} products")
+    return promotions
 
-        if retries >= MAX_RETRIES or consecutive_empty_pages >= MAX_EMPTY_PAGES:
-            break  
+def apply_nutritional_data(bm_item, nutritional_data):
+    """
+    Fill the manufacturer and ingredients fields of an item from its nutritional info JSON.
 
-        time.sleep(PAGE_DELAY)
+    Args:
+        bm_item: The item to update (BmProductRecord).
+        nutritional_data: The nutritional info JSON of the product, or None (dictionary).
+    """
+    bm_item.manufacturer = 'No encontrado'
+    bm_item.raw_ingredients = 'No encontrado'
+    if not nutritional_data:
+        return
+
+    nutrilabel = nutritional_data.get('nutrilabel', {})
+    product_info = nutrilabel.get('productInformation', {})
+    manufacturer_info = product_info.get('manufacturer', {})
+    if manufacturer_info:
+        manufacturer_name = manufacturer_info.get('name')
+        manufacturer_address = manufacturer_info.get('address')
+        bm_item.manufacturer = f"{manufacturer_name} - {manufacturer_address}" if manufacturer_name and manufacturer_address else manufacturer_name
     
-    return promo_map
-
-def process_product_data_from_api(product, mxn_promo_map, second_unit_promo_map, offer_price_promo_map, offer_deferred_promo_map):
+    ingredients_info = product_info.get('ingredientsInformation', [])
+    if ingredients_info and len(ingredients_info) > 0:
+        ingredients_text = ingredients_info[0].get('ingredientsList', '')
+        if ingredients_text:
+            clean_ingredients = re.sub('<.*?>', '', ingredients_text)
+            bm_item.raw_ingredients = clean_ingredients
+
+def process_product_data_from_api(product, promotions, nutrition_map=None, measuring_unit=None):
     """
     Process a single product's data from the BM Supermercados API response into a structured item.
 
     Extracts product details (EAN, brand, description, etc.), pricing information, and promotional
-    data. Prioritizes promotions from provided maps (MxN > SecondUnit > OfferPrice > OfferDeferred)
-    and falls back to API offers if no map entry is found. Also retrieves nutritional data and
-    manufacturer information if available.
+    data. Takes the promotion attributed to the EAN by the promotion index (MxN > SecondUnit >
+    OfferPrice > OfferDeferred) and falls back to the API offers if the index has none. Also retrieves nutritional data and
+    manufacturer information if available, either from a prefetched nutrition map or with a
+    request of its own.
 
     Args:
         product: The raw product data from the API, containing 'productData', 'priceData',
             and 'offers' (dictionary).
-        mxn_promo_map: Map of EANs to MxN promotion details (dictionary).
-        second_unit_promo_map: Map of EANs to SecondUnitDiscount promotion details (dictionary).
-        offer_price_promo_map: Map of EANs to OfferPrice promotion details (dictionary).
-        offer_deferred_promo_map: Map of EANs to OfferDeferred promotion details (dictionary).
+        promotions: The promotions of the promotion feeds (PromotionIndex).
+        nutrition_map: Optional map of EANs to nutritional info JSONs fetched in batch by
+            `NutritionFetcher`; when None the nutritional info is fetched here (dictionary).
+        measuring_unit: Measuring unit of the product parsed with the rest of its page by
+            `parse_measuring_units`, or 'No encontrado'; when None it is parsed here
+            (dictionary or string).
 
     Returns:
-        A BmProductItem object with product details, or None if processing fails.
+        A BmProductRecord with product details, or None if processing fails.
     """
     try:
-        bm_item = BmProductItem()
+        bm_item = BmProductRecord()
 
         product_data = product.get('productData', {})
         price_data = product.get('priceData', {})
         prices = price_data.get('prices', [])
         ean = product.get('ean')
         
-        bm_item['supermarket'] = 'BM in 20012'
-        bm_item['id'] = product.get('id')
-        bm_item['ean'] = ean
-        bm_item['brand'] = product_data.get('brand', {}).get('name')
-        bm_item['description'] = product_data.get('name')
-        bm_item['category'] = get_hierarchical_category(product.get('categories', []))
-        bm_item['url'] = product_data.get('url')
+        bm_item.supermarket = 'BM in 20012'
+        bm_item.id = product.get('id')
+        bm_item.ean = ean
+        bm_item.brand = product_data.get('brand', {}).get('name')
+        bm_item.description = product_data.get('name')
+        bm_item.category = get_hierarchical_category(product.get('categories', []))
+        bm_item.url = product_data.get('url')
         image_url = product_data.get('imageURL')
-        bm_item['image_links'] = [image_url] if image_url else ['No encontrado']
+        bm_item.image_links = [image_url] if image_url else ['No encontrado']
         
-        description = product_data.get('name', '')
-        bm_item['measuring_unit'] = get_value_or_not_found(parse_measuring_unit(description))
+        if measuring_unit is None:
+            measuring_unit = get_value_or_not_found(parse_measuring_unit(product_data.get('name', '')))
+        bm_item.measuring_unit = measuring_unit
 
         regular_price = None
         offer_price = None
@@ -203,66 +259,37 @@ def process_product_data_from_api(product, mxn_promo_map, second_unit_promo_map,
                 unit_price_offer = final_unit_amount
 
         updated_promo = 'No encontrado'
-        if ean in mxn_promo_map:
-            promo_data = mxn_promo_map[ean]
-            updated_promo = f"{promo_data['type']}: {promo_data['minDescription']} - {promo_data['shortDescription']}"
-        elif ean in second_unit_promo_map:
-            promo_data = second_unit_promo_map[ean]
-            updated_promo = f"{promo_data['type']}: {promo_data['minDescription']} - {promo_data['shortDescription']}"
-        elif ean in offer_price_promo_map:
-            promo_data = offer_price_promo_map[ean]
-            updated_promo = f"{promo_data['type']}: {promo_data['minDescription']} - {promo_data['shortDescription']}"
-        elif ean in offer_deferred_promo_map:
-            promo_data = offer_deferred_promo_map[ean]
-            updated_promo = f"{promo_data['type']}: {promo_data['minDescription']} - {promo_data['shortDescription']}"
+        promotion = promotions.best(ean) if ean else None
+        if promotion is not None:
+            updated_promo = promotion['label']
         else:
             offers = product.get('offers', [])
             if offers:
                 offer = offers[0]
-                min_desc = offer.get('minDescription', '').strip()
-                short_desc = offer.get('shortDescription', '').strip()
-                promo_type = 'OfferDeferred' if 'Deferred' in short_desc else \
-                            'OfferPrice' if offer.get('promotionType') == 1 else \
-                            'MxN' if '2X1' in min_desc else \
-                            'SecondUnitDiscount' if '2ª al' in min_desc else 'Unknown'
-                if min_desc or short_desc:
-                    updated_promo = f"{promo_type}: {min_desc} - {short_desc}"
+                promotion = offer_promotion(offer, offer_type(offer))
+                if promotion is not None:
+                    updated_promo = promotion['label']
 
                     offer_amount = offer.get('amount')
                     if offer_amount is not None and offer_price is None:
                         offer_price = float(offer_amount)
                         regular_price = regular_price if regular_price is not None else offer_price
 
-        bm_item['promotion'] = updated_promo
+        bm_item.promotion = updated_promo
 
         if offer_price is not None:
-            bm_item['price'] = offer_price
-            bm_item['offer_price'] = regular_price if regular_price != offer_price else None
-            bm_item['unit_price'] = unit_price_offer if unit_price_offer is not None else unit_price_regular
+            bm_item.price = offer_price
+            bm_item.offer_price = regular_price if regular_price != offer_price else None
+            bm_item.unit_price = unit_price_offer if unit_price_offer is not None else unit_price_regular
         else:
-            bm_item['price'] = regular_price
-            bm_item['offer_price'] = 'No encontrado'
-            bm_item['unit_price'] = get_value_or_not_found(unit_price_regular)
+            bm_item.price = regular_price
+            bm_item.offer_price = 'No encontrado'
+            bm_item.unit_price = get_value_or_not_found(unit_price_regular)
 
-        bm_item['manufacturer'] = 'No encontrado'
-        bm_item['raw_ingredients'] = 'No encontrado'
+        nutritional_data = None
         if ean:
-            nutritional_data = get_nutritional_data(ean)
-            if nutritional_data:
-                nutrilabel = nutritional_data.get('nutrilabel', {})
-                product_info = nutrilabel.get('productInformation', {})
-                manufacturer_info = product_info.get('manufacturer', {})
-                if manufacturer_info:
-                    manufacturer_name = manufacturer_info.get('name')
-                    manufacturer_address = manufacturer_info.get('address')
-                    bm_item['manufacturer'] = f"{manufacturer_name} - {manufacturer_address}" if manufacturer_name and manufacturer_address else manufacturer_name
-                
-                ingredients_info = product_info.get('ingredientsInformation', [])
-                if ingredients_info and len(ingredients_info) > 0:
-                    ingredients_text = ingredients_info[0].get('ingredientsList', '')
-                    if ingredients_text:
-                        clean_ingredients = re.sub('<.*?>', '', ingredients_text)
-                        bm_item['raw_ingredients'] = clean_ingredients
+            nutritional_data = nutrition_map.get(ean) if nutrition_map is not None else get_nutritional_data(ean)
+        apply_nutritional_data(bm_item, nutritional_data)
 
         return bm_item
         
@@ -270,129 +297,514 @@ def process_product_data_from_api(product, mxn_promo_map, second_unit_promo_map,
         logging.error(f"Error processing product data for EAN {ean}: {e}")
         return None
 
-def scrape_beverages_api_only():
+def process_page_products(page_number, page_products, nutrition_map, promotions, snapshot=None):
+    """
+    Build the items of the new products of a catalog page once the promotions are known.
+
+    Args:
+        page_number: The catalog page the products come from (integer).
+        page_products: Map of product IDs to raw API products, in page order (dictionary).
+        nutrition_map: Map of EANs to nutritional info JSONs (dictionary).
+        promotions: The promotions of the promotion feeds (PromotionIndex).
+        snapshot: Previous snapshot for incremental runs; unchanged products are copied from
+            it instead of being processed (IncrementalSnapshot).
+
+    Returns:
+        A list of BmProductRecord objects for the products that could be processed.
+    """
+    started = time.perf_counter()
+    dump_items = logging.getLogger().isEnabledFor(logging.DEBUG)
+    page_items = []
+    reused_count = failed_count = 0
+    # The measuring units of the page are parsed in one batch, each distinct description once
+    measuring_units = parse_measuring_units((product.get('productData') or {}).get('name') for product in page_products.values())
+    for position, (product_id, product) in enumerate(page_products.items()):
+        bm_item = snapshot.reuse_item(product, promotions) if snapshot is not None else None
+        if bm_item:
+            snapshot.record_item(bm_item)
+            page_items.append(bm_item)
+            reused_count += 1
+            continue
+
+        measuring_format = measuring_units['format'][position]
+        measuring_unit = {
+            "format": measuring_format, "value": measuring_units['value'][position], "unit": measuring_units['unit'][position]
+        } if measuring_format is not None else 'No encontrado'
+        bm_item = process_product_data_from_api(product, promotions, nutrition_map, measuring_unit)
+        if bm_item:
+            if snapshot is not None:
+                snapshot.update_item(product, bm_item)
+                snapshot.record_item(bm_item)
+            page_items.append(bm_item)
+            if dump_items and is_sampled(product_id):
+                logging.debug(f"Product {product_id} - Page {page_number}: {json.dumps(bm_item.to_dict(), ensure_ascii=False)}")
+        else:
+            failed_count += 1
+            logging.error(f"Failed to process product {product_id}")
+
+    promoted_count = sum(1 for bm_item in page_items if bm_item.get('promotion') != 'No encontrado')
+    logging.info(
+        f"Page {page_number}: {len(page_items)} products built ({reused_count} reused, {failed_count} failed, "
+        f"{promoted_count} with promotion) in {(time.perf_counter() - started) * 1000:.1f} ms"
+    )
+    return page_items
+
+def is_sampled(product_id, rate=LOG_ITEM_SAMPLE_RATE):
+    """
+    Whether a product is one of the `rate` fraction of products dumped in full at DEBUG level.
+
+    The choice depends only on the product ID, so the same products are dumped on every run.
+    """
+    return zlib.crc32(str(product_id).encode()) < rate * 2**32
+
+def store_page_items(page_items, scraped_products, writer=None):
+    """
+    Stream the items of a page to the output writer, or keep them in memory if there is none.
+
+    Args:
+        page_items: The items built from a catalog page (list).
+        scraped_products: The in-memory list of items of the run (list).
+        writer: Streaming output stage, or None (JsonLinesWriter).
+
+    Returns:
+        The number of items stored.
+    """
+    if writer is not None:
+        writer.write_many(page_items)
+    else:
+        scraped_products.extend(page_items)
+    return len(page_items)
+
+def flush_pending_pages(pending_pages, promotions, scraped_products, snapshot=None, writer=None, checkpoint=None):
+    """
+    Join buffered catalog pages with the promotions, store their items and checkpoint them.
+
+    Args:
+        pending_pages: (page_number, page_products, nutrition_map) tuples waiting for the
+            promotions, in page order; emptied by this call (list).
+        promotions: The promotions of the promotion feeds (PromotionIndex).
+        scraped_products: The in-memory list of items of the run (list).
+        snapshot: Previous snapshot for incremental runs (IncrementalSnapshot).
+        writer: Streaming output stage, or None (JsonLinesWriter).
+        checkpoint: Crawl progress, saved after every page (CrawlCheckpoint).
+
+    Returns:
+        The number of items stored.
+    """
+    stored_count = 0
+    metrics = get_metrics()
+    for page_number, page_products, nutrition_map in pending_pages:
+        with metrics.stage('parse', page=page_number):
+            page_items = process_page_products(page_number, page_products, nutrition_map, promotions, snapshot)
+        with metrics.stage('write', page=page_number):
+            stored_count += store_page_items(page_items, scraped_products, writer)
+        if checkpoint is not None:
+            written_count = writer.count if writer is not None else len(scraped_products)
+            checkpoint.page_written(page_number, page_products, written_count, snapshot)
+    pending_pages.clear()
+    return stored_count
+
+def catalog_page_size(category, checkpoint=None):
+    """
+    Page size of a catalog crawl: the one an interrupted crawl being resumed was started
+    with, so its page numbers keep their offsets, or the one negotiated with the API.
+
+    Returns:
+        A tuple (page_size, probed_page): the page size and the first catalog page if
+        negotiating the page size just fetched it, or None (see `PageSizes.negotiate`).
+    """
+    if checkpoint is not None and checkpoint.last_page:
+        return checkpoint.page_size, None
+    page_size, probed_page = get_page_sizes().negotiate(BEVERAGES_API_URL, category)
+    if checkpoint is not None:
+        checkpoint.page_size = page_size
+    return page_size, probed_page
+
+def fetch_catalog_page(category, page_number, page_size, plan=None):
+    """
+    Fetch a catalog page of a category.
+
+    Args:
+        category: The store category ID (integer).
+        page_number: The catalog page (integer).
+        page_size: Products per page (integer).
+        plan: Catalog plan recording the total count the page was served with (CatalogPlan).
+
+    Returns:
+        The decoded API response.
+
+    Raises:
+        RequestException: If the page could not be fetched once the retry policy of the
+            HTTP client gave up on it.
+    """
+    # The HTTP stack is only imported by the code paths that send requests
+    from bm_scraper.utils.http_client import http_get
+
+    api_url = page_url(BEVERAGES_API_URL, page_number, page_size, category)
+    with get_metrics().stage('fetch', page=page_number):
+        response = http_get(api_url, proxies=PROXIES, headers=API_HEADERS, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+    if plan is not None:
+        plan.record(page_number, data.get('totalCount'))
+    return data
+
+def saved_promotions(category, checkpoint=None):
+    """
+    The promotions of an interrupted crawl being resumed, or the saved promotion index of the
+    category if it is recent enough (`PROMOTION_INDEX_MAX_AGE`).
+
+    Returns:
+        A PromotionIndex, or None if the promotion feeds have to be fetched.
+    """
+    promotions = checkpoint.promotions if checkpoint is not None else None
+    if promotions is None:
+        promotions = load_promotion_index(category)
+        if promotions is not None and checkpoint is not None:
+            checkpoint.promotions = promotions
+    return promotions
+
+def join_promotion_feeds(feed_promotions, category, checkpoint=None):
+    """
+    Combine the promotion indexes of the feeds of a category into one, and save it for later
+    runs and in the checkpoint.
+
+    Args:
+        feed_promotions: The PromotionIndex of every promotion feed (iterable).
+        category: The store category ID the feeds were fetched for (integer).
+        checkpoint: Crawl progress, saved with the promotions (CrawlCheckpoint).
+
+    Returns:
+        The combined PromotionIndex.
+    """
+    promotions = PromotionIndex.combine(feed_promotions)
+    save_promotion_index(promotions, category)
+    if checkpoint is not None:
+        checkpoint.promotions = promotions
+    return promotions
+
+def scrape_beverages_api_only(snapshot=None, writer=None, checkpoint=None, category=CATEGORY_ID):
     """
     Scrape beverage product data from the BM Supermercados API.
 
     Fetches product data from the main beverages API, processes each product, and applies
-    promotional data from separate promotion APIs. Handles pagination up to a maximum number
-    of pages, deduplicates products using product IDs, and stops early if consecutive empty
-    pages are encountered. Returns a list of processed product items.
+    promotional data from separate promotion APIs. The promotion feeds are fetched in
+    background threads while the catalog is paged; pages are buffered until every feed has
+    finished and promotions are then attributed in a join step, so a slow feed never stalls
+    the catalog crawl. Pages are requested with the largest page size the API accepts,
+    negotiated once per endpoint (`PageSizes`). The first catalog page gives the total
+    count of products, from which the remaining pages are planned (`CatalogPlan`) and
+    requested `CATALOG_PAGE_CONCURRENCY` at a time ahead of the page being processed, paced
+    by the rate limiter; pages are processed in order and products are deduplicated by
+    product ID. Pages served while the catalog changed are fetched again at the end and
+    only their new products are kept. Without a total count the pages are followed while
+    the API reports more, stopping early if consecutive empty pages are encountered.
+    Nutritional info for the new products of each page is fetched in a single batch through
+    a bounded worker pool. Returns a list of processed product items.
+
+    Args:
+        snapshot: Previous snapshot for incremental runs; only products whose payload or
+            promotions changed are parsed and enriched again (IncrementalSnapshot).
+        writer: Streaming output stage; when given, items are written to it as soon as
+            they are processed instead of being kept in memory (JsonLinesWriter).
+        checkpoint: Crawl progress; the crawl starts after its last written page with its
+            seen product IDs and promotions, and it is saved after every page written.
+            Its `completed` flag tells whether the crawl reached the end of the catalog
+            (CrawlCheckpoint).
+        category: The store category ID to crawl; Bebidas by default (integer).
 
     Returns:
-        A list of BmProductItem objects containing processed product data.
+        A list of BmProductRecord objects containing processed product data, empty when the
+        items are streamed to `writer`.
     """
+    # The HTTP stack is only imported by the code paths that send requests
+    from requests.exceptions import RequestException
+
+    from bm_scraper.utils.http_client import get_http_client
+
     scraped_products = []
-    seen_product_ids = set()
+    scraped_count = 0
+    seen_product_ids = set(checkpoint.seen_product_ids) if checkpoint is not None else set()
+    start_page = checkpoint.last_page + 1 if checkpoint is not None else 1
     consecutive_empty_pages = 0
+    crawl_interrupted = False
+    pending_pages = []
+    promotions = saved_promotions(category, checkpoint)
+    promo_futures = []
+    page_size, probed_page = catalog_page_size(category, checkpoint)
     
-    mxn_promo_map = fetch_promotion_products(MXN_PROMO_API_URL, "MxN")
-    second_unit_promo_map = fetch_promotion_products(SECOND_UNIT_PROMO_API_URL, "SecondUnitDiscount")
-    offer_price_promo_map = fetch_promotion_products(OFFER_PRICE_PROMO_API_URL, "OfferPrice")
-    offer_deferred_promo_map = fetch_promotion_products(OFFER_DEFERRED_PROMO_API_URL, "OfferDeferred")
-
-    for page_number in range(1, MAX_PAGES + 1):
-        logging.info(f"Processing page {page_number} of {MAX_PAGES}...")
-        
-        offset = (page_number - 1) * 20
-        api_url = BEVERAGES_API_URL.format(page=page_number, offset=offset)
+    if promotions is None:
+        promo_executor = ThreadPoolExecutor(max_workers=len(PROMOTION_FEEDS), thread_name_prefix='promotions')
+        # Every feed negotiates its own page size: the API can accept a different limit on each endpoint
+        promo_futures = [
+            promo_executor.submit(fetch_promotion_products, api_url, promo_type, category)
+            for api_url, promo_type in PROMOTION_FEEDS
+        ]
+        promo_executor.shutdown(wait=False)
+    nutrition_fetcher = NutritionFetcher()
+
+    # Pages to process in order: the first one, then every page of the plan it gives, then the pages to reconcile
+    plan = None
+    reconciled = False
+    page_queue = [start_page]
+    page_futures = {}
+    page_executor = ThreadPoolExecutor(max_workers=CATALOG_PAGE_CONCURRENCY, thread_name_prefix='catalog-pages')
+
+    def schedule_pages(position):
+        # Pages are requested up to CATALOG_PAGE_CONCURRENCY ahead of the one being processed, each in a copy of
+        # this context so its request spans nest under the crawl
+        for ahead in range(position, min(position + CATALOG_PAGE_CONCURRENCY, len(page_queue))):
+            if ahead in page_futures:
+                continue
+            if ahead == 0 and probed_page is not None:
+                # The first page was fetched while negotiating the page size
+                page_futures[ahead] = Future()
+                page_futures[ahead].set_result(probed_page)
+            else:
+                page_futures[ahead] = page_executor.submit(
+                    contextvars.copy_context().run, fetch_catalog_page, category, page_queue[ahead], page_size, plan
+                )
+
+    position = 0
+    while position < len(page_queue) or (plan is not None and not reconciled):
+        if position == len(page_queue):
+            reconciled = True
+            page_queue.extend(plan.reconcile_pages())
+            continue
+        schedule_pages(position)
+        page_number = page_queue[position]
+        page_future = page_futures.pop(position)
+        position += 1
+        logging.info(f"Processing page {page_number} of {plan.last_page if plan is not None else 'unknown'}...")
 
         try:
-            response = requests.get(api_url, 
-                                 proxies=PROXIES, 
-                                 headers=API_HEADERS, 
-                                 timeout=REQUEST_TIMEOUT)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = page_future.result()
             products = data.get('products', [])
             has_more = data.get('hasMore', False)
             total_count = data.get('totalCount', 0)
             
             if not products:
                 logging.info(f"No products found in API page {page_number}.")
-                break
+                # A planned page can come back empty if the catalog shrank while it was crawled
+                if plan is None:
+                    break
+                continue
             
             logging.info(f"Found {len(products)} products on page {page_number}.")
 
-            new_products_count = 0
+            if plan is None and total_count:
+                if page_number == 1:
+                    page_size = get_page_sizes().served(BEVERAGES_API_URL, category, page_size, len(products), total_count)
+                    if checkpoint is not None:
+                        checkpoint.page_size = page_size
+                plan = CatalogPlan(total_count, page_number, page_size)
+                page_queue.extend(plan.remaining_pages)
+                schedule_pages(position)
+                logging.info(f"{total_count} products in {plan.last_page} pages of {page_size}; requesting the remaining pages")
+
+            page_products = {}
             for product in products:
                 product_id = product.get('id')
-                
-                if product_id in seen_product_ids:
-                    continue
-                
-                bm_item = process_product_data_from_api(product, mxn_promo_map, second_unit_promo_map, offer_price_promo_map, offer_deferred_promo_map)
-                if bm_item:
-                    scraped_products.append(bm_item)
-                    seen_product_ids.add(product_id)
-                    new_products_count += 1
-                    
-                    logging.info("\n" + "="*50)
-                    logging.info(f"PRODUCT {product.get('id')} - Page {page_number}")
-                    logging.info("="*50)
-                    logging.info(json.dumps(dict(bm_item), indent=4, ensure_ascii=False))
-                    logging.info("="*50 + "\n")
-                else:
-                    logging.error(f"Failed to process product {product_id}")
-
-            if new_products_count == 0:
-                consecutive_empty_pages += 1
-                logging.info(f"No new products found on page {page_number} (consecutive empty pages: {consecutive_empty_pages})")
-                
-                if consecutive_empty_pages >= MAX_EMPTY_PAGES:
-                    logging.info(f"Stopping: {consecutive_empty_pages} consecutive pages with no new products")
-                    break
-            else:
+                if product_id not in seen_product_ids and product_id not in page_products:
+                    page_products[product_id] = product
+            seen_product_ids.update(page_products)
+
+            with get_metrics().stage('enrich', page=page_number):
+                nutrition_map = nutrition_fetcher.fetch_many([
+                    product.get('ean') for product in page_products.values()
+                    if snapshot is None or snapshot.needs_enrichment(product)
+                ])
+            pending_pages.append((page_number, page_products, nutrition_map))
+
+            # Join step: attribute promotions as soon as every promotion feed is available
+            if promotions is None and all(future.done() for future in promo_futures):
+                promotions = join_promotion_feeds([future.result() for future in promo_futures], category, checkpoint)
+            if promotions is not None:
+                scraped_count += flush_pending_pages(pending_pages, promotions, scraped_products, snapshot, writer, checkpoint)
+
+            new_products_count = len(page_products)
+            if new_products_count:
                 consecutive_empty_pages = 0
                 logging.info(f"Found {new_products_count} new products on page {page_number}")
+            else:
+                consecutive_empty_pages += 1
+                logging.info(f"No new products found on page {page_number} (consecutive empty pages: {consecutive_empty_pages})")
+
+            if plan is not None:
+                continue
 
+            # Without a total count the pages can only be followed one after another
+            if consecutive_empty_pages >= MAX_EMPTY_PAGES:
+                logging.info(f"Stopping: {consecutive_empty_pages} consecutive pages with no new products")
+                break
             if not has_more:
                 logging.info(f"API indicates no more pages available")
                 break
+            page_queue.append(page_number + 1)
 
         except RequestException as e:
             logging.error(f"Error getting product data (Page {page_number}): {e}")
+            crawl_interrupted = True
             break 
         except Exception as e:
             logging.error(f"Error processing data from page {page_number}: {e}")
+            if plan is None:
+                consecutive_empty_pages += 1
+                if consecutive_empty_pages < MAX_EMPTY_PAGES:
+                    page_queue.append(page_number + 1)
             continue
-        
-        if page_number < MAX_PAGES:
-            time.sleep(PAGE_DELAY)
 
-    logging.info(f"Scraping completed. Total scraped products: {len(scraped_products)}")
+    page_executor.shutdown(wait=False, cancel_futures=True)
+    if pending_pages:
+        logging.info(f"Waiting for promotion feeds to join {len(pending_pages)} buffered pages...")
+        if promotions is None:
+            promotions = join_promotion_feeds([future.result() for future in promo_futures], category, checkpoint)
+        scraped_count += flush_pending_pages(pending_pages, promotions, scraped_products, snapshot, writer, checkpoint)
+    if checkpoint is not None:
+        checkpoint.completed = not crawl_interrupted
+
+    nutrition_fetcher.close()
+    nutrition_fetcher.stats.log_summary()
+    get_http_client().log_stats()
+    logging.info(f"Scraping completed. Total scraped products: {scraped_count}")
     
     return scraped_products
 
-def scrape_beverages_master():
+def scrape_beverages_master(engine="sync", incremental=False, resume=False, categories=None, workers=SCHEDULER_WORKERS,
+                            parquet=PARQUET_EXPORT):
+    """
+    Run a full crawl and save the products to `OUTPUT_DIR/OUTPUT_FILE`.
+
+    Items are streamed to a JSON Lines file while the crawl runs and the final JSON file is
+    built from it with an atomic rename, so memory stays flat and an interrupted run keeps
+    everything processed so far. A checkpoint is saved after every page; if the crawl is
+    interrupted the previous JSON file is left untouched and the checkpoint is kept so the
+    next run can continue with `resume`. The prices of a completed crawl are appended to
+    the price history database unless `PRICE_HISTORY_ENABLED` is off. A crawl that finds no
+    products saves the fallback data instead; a crawl that fails with an unexpected error
+    does not, so the previous JSON file is not replaced by it.
+
+    Args:
+        engine: 'sync' for the requests loop, 'async' for the asyncio engine or 'sharded'
+            for the multi-process category scheduler (string).
+        incremental: Whether to only reprocess products that changed since the previous
+            snapshot and write a delta file (boolean).
+        resume: Whether to continue an interrupted crawl from its checkpoint; not supported
+            by the sharded engine (boolean).
+        categories: Store category IDs to crawl; more than one always uses the sharded
+            engine. Defaults to Bebidas, or to `CATEGORIES` for the sharded engine (list).
+        workers: Number of worker processes of the sharded engine (integer).
+        parquet: Whether to also export the products of a completed crawl to the Parquet
+            dataset in `PARQUET_DIR` (boolean).
+
+    Returns:
+        The number of products saved, or 0 if the crawl failed with an unexpected error
+        (logged with its traceback).
+    """
     try:
-        logging.info("Starting product query process with API only...")
-        
-        scraped_products = scrape_beverages_api_only()
-        
-        if not scraped_products or len(scraped_products) == 0:
-            logging.info("No products scraped. Using fallback data...")
-            scraped_products = generate_fallback_data()
+        if categories and len(categories) > 1:
+            engine = "sharded"
+        category = categories[0] if categories else CATEGORY_ID
+        logging.info(f"Starting product query process with API only ({engine} engine)...")
+        started_at = time.time()
         
-        if scraped_products:
-            output_dir = r"C:\Users\richa\Downloads\comexsoft-challengue\bm_scraper\output"
-            output_file = os.path.join(output_dir, "bm_productos_bebidas.json")
+        output_file = os.path.join(OUTPUT_DIR, OUTPUT_FILE)
+        parquet_exporter = None
+        if parquet:
+            # Created before crawling so a missing pyarrow fails the run right away
+            from bm_scraper.utils.parquet_export import ParquetExporter
+            parquet_exporter = ParquetExporter()
+        snapshot = IncrementalSnapshot.load(output_file) if incremental else None
+        if resume and engine == "sharded":
+            logging.warning("Sharded crawls cannot be resumed; starting a new crawl")
+            resume = False
+        checkpoint = CrawlCheckpoint.load(output_file) if resume else None
+        if checkpoint is not None and checkpoint.category not in (None, category):
+            logging.warning(f"The checkpoint belongs to category {checkpoint.category}; starting a new crawl")
+            checkpoint = None
+        resuming = checkpoint is not None
+        if resume and not resuming:
+            logging.info("No checkpoint to resume from; starting a new crawl")
+        if not resuming:
+            checkpoint = CrawlCheckpoint.for_output(output_file, category)
+
+        observed = PRICE_HISTORY_ENABLED
+        with JsonLinesWriter(output_file, append=resuming, keep=checkpoint.written_count) as writer:
+            if resuming and snapshot is not None:
+                snapshot.fingerprints.update(checkpoint.fingerprints)
+                for item in writer.iter_items():
+                    snapshot.record_item(item)
+
+            with get_metrics().stage('crawl', engine=engine, category=category):
+                if engine == "sharded":
+                    from bm_scraper.spiders.sharded_scheduler import scrape_categories_sharded
+                    scrape_categories_sharded(categories, workers, snapshot, writer, checkpoint)
+                elif engine == "async":
+                    from bm_scraper.spiders.bebidas_spider_async import scrape_beverages_async
+                    scrape_beverages_async(snapshot, writer, checkpoint, category)
+                else:
+                    scrape_beverages_api_only(snapshot, writer, checkpoint, category)
+            
+            if writer.count == 0:
+                logging.info("No products scraped. Using fallback data...")
+                writer.write_many(generate_fallback_data())
+                snapshot = None
+                observed = False
+                checkpoint.completed = True
+
+            if not checkpoint.completed:
+                if engine == "sharded":
+                    logging.warning(f"Crawl interrupted; {writer.count} items kept in {writer.jsonl_file}.")
+                else:
+                    logging.warning(
+                        f"Crawl interrupted after page {checkpoint.last_page}; {writer.count} items kept in "
+                        f"{writer.jsonl_file}. Run again with --resume to continue."
+                    )
+                return writer.count
             
             try:
-                os.makedirs(output_dir, exist_ok=True)
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump([dict(product) for product in scraped_products], f, indent=4, ensure_ascii=False)
-                logging.info(f"Data saved to: {output_file}")
+                with get_metrics().stage('finalize'):
+                    writer.finalize()
+                    if parquet_exporter is not None:
+                        parquet_exporter.export(writer.iter_items())
+                    if observed:
+                        from bm_scraper.utils.price_history import record_prices
+                        record_prices(writer.iter_items(), started_at)
+                    if snapshot is not None:
+                        snapshot.save()
+                    checkpoint.clear()
             except OSError as e:
                 logging.error(f"Error saving data to {output_file}: {e}")
                 raise
         
-        return scraped_products
+        return writer.count
 
     except Exception as e:
-        logging.error(f"Using fallback data due to error: {e}")
-        return generate_fallback_data()
+        logging.exception(f"Scraping failed; the previous output and the checkpoint are kept: {e}")
+        return 0
+    finally:
+        get_metrics().export()
 
 if __name__ == "__main__":
-    scrape_beverages_master()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape beverage products from BM Supermercados.")
+    parser.add_argument("--engine", choices=["sync", "async", "sharded"], default="sync",
+                        help="crawl engine: sequential requests loop, asyncio engine or multi-process category scheduler")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only reprocess products that changed since the previous snapshot and write a delta file")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted crawl from its checkpoint instead of starting over")
+    parser.add_argument("--categories", type=int, nargs="+", metavar="ID",
+                        help="store category IDs to crawl (default: 1690, Bebidas); several categories use the sharded engine")
+    parser.add_argument("--workers", type=int, default=SCHEDULER_WORKERS,
+                        help="worker processes of the sharded engine")
+    parser.add_argument("--parquet", action="store_true", default=PARQUET_EXPORT,
+                        help="also export the products to a Parquet dataset partitioned by run date and category")
+    parser.add_argument("--trace", metavar="FILE", default=TRACE_FILE,
+                        help="export a span per request and crawl stage to this OTLP JSON Lines file")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default=LOG_LEVEL,
+                        help="log level; DEBUG also dumps a sample of the products (LOG_ITEM_SAMPLE_RATE)")
+    args = parser.parse_args()
+    configure_logging(level=args.log_level)
+    get_metrics().trace_file = args.trace
+    scrape_beverages_master(engine=args.engine, incremental=args.incremental, resume=args.resume,
+                            categories=args.categories, workers=args.workers, parquet=args.parquet)
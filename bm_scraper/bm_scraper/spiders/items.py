@@ -19,4 +19,13 @@ class BmProductItem(scrapy.Item):
     offer_price = scrapy.Field()
     promotion = scrapy.Field()
     manufacturer = scrapy.Field()
-    raw_ingredients = scrapy.Field()
\ No newline at end of file
+    raw_ingredients = scrapy.Field()
+
+
+class BmRawProductItem(scrapy.Item):
+    """Raw API product of the Scrapy spider with its nutritional info and promotions."""
+    product = scrapy.Field()
+    nutrition = scrapy.Field()
+    page = scrapy.Field()
+    position = scrapy.Field()
+    promotions = scrapy.Field()
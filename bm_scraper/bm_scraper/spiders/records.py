@@ -0,0 +1,71 @@
+class BmProductRecord:
+    """
+    Product record built by the standalone engines, a slotted stand-in for `BmProductItem`.
+
+    Instances take about a quarter of the memory of a `scrapy.Item`, are filled with plain
+    attribute assignments and serialize with `to_dict()`, and importing this module does
+    not import Scrapy. Item-style
+    access (`record['price']`, `record.get('price')`, `dict(record)`) is kept for code shared
+    with the Scrapy spider; `to_item()` converts a record into a `BmProductItem` when running
+    under Scrapy. Fields that were never set are left out of `to_dict()`, like unset Item fields.
+    """
+
+    # In the order they are written to the output files
+    __slots__ = (
+        'supermarket', 'id', 'ean', 'brand', 'description', 'category', 'url', 'image_links',
+        'measuring_unit', 'promotion', 'price', 'offer_price', 'unit_price', 'manufacturer',
+        'raw_ingredients',
+    )
+    fields = __slots__
+
+    def __init__(self, values=None, **kwargs):
+        if values:
+            kwargs = {**values, **kwargs}
+        for name, value in kwargs.items():
+            self[name] = value
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        if name not in self.__slots__:
+            raise KeyError(f"BmProductRecord does not support field: {name}")
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return name in self.__slots__ and hasattr(self, name)
+
+    def __eq__(self, other):
+        if isinstance(other, BmProductRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"BmProductRecord({self.to_dict()!r})"
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def keys(self):
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def to_dict(self):
+        values = {}
+        for name in self.__slots__:
+            try:
+                values[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return values
+
+    def to_item(self):
+        from bm_scraper.spiders.items import BmProductItem
+        return BmProductItem(self.to_dict())
+
+
+def as_dict(item):
+    """Plain dictionary of a BmProductRecord, a BmProductItem or a dictionary."""
+    return item.to_dict() if isinstance(item, BmProductRecord) else dict(item)
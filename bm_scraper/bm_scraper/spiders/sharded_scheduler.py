@@ -0,0 +1,381 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+from bm_scraper.config.proxy_config import PROXIES, API_HEADERS
+from bm_scraper.config.config import (
+    CATEGORIES,
+    BEVERAGES_API_URL,
+    NUTRITIONAL_INFO_URL,
+    PAGE_SIZE,
+    REQUEST_TIMEOUT,
+    API_REQUESTS_PER_SECOND,
+    API_BURST,
+    CDN_REQUESTS_PER_SECOND,
+    CDN_BURST,
+    SCHEDULER_WORKERS,
+    SHARD_PAGES,
+    API_RATE_CEILING,
+    CDN_RATE_CEILING,
+    CDN_CONCURRENCY_CEILING,
+    NUTRITION_MAX_WORKERS,
+    ADAPTIVE_MIN_RATE,
+    RETRY_BUDGET
+)
+from bm_scraper.spiders.bebidas_spider_simple import (
+    PROMOTION_FEEDS,
+    fetch_promotion_products,
+    join_promotion_feeds,
+    process_page_products,
+    saved_promotions,
+    store_page_items
+)
+from bm_scraper.utils.logging_config import configure_logging
+from bm_scraper.utils.metrics import get_metrics
+from bm_scraper.utils.nutrition import NutritionFetcher
+from bm_scraper.utils.pagination import CatalogPlan, get_page_sizes, page_url
+from bm_scraper.utils.rate_limiter import AdaptiveHostRateLimiter
+from bm_scraper.utils.snapshot import payload_fingerprint
+
+
+# Payload fingerprints of the previous snapshot, set in every worker process for incremental runs
+_previous_payloads = None
+# Nutritional info lookups a worker process keeps in flight, set in every worker process
+_cdn_concurrency = NUTRITION_MAX_WORKERS
+
+
+def worker_host_rates(workers):
+    """
+    Per-process request rates that keep every host under its ceiling.
+
+    Each worker runs at the single-process rate until `workers` of them would exceed the
+    host ceiling; from then on the ceiling is split evenly between them, so throughput grows
+    linearly with the number of workers up to the ceiling and stays flat beyond it. A
+    worker never gets less than `ADAPTIVE_MIN_RATE`, so with more workers than the ceiling
+    can feed at that rate the ceiling is exceeded rather than the workers stalled. These
+    rates are also the highest a worker's adaptive limiter can speed up to.
+
+    Args:
+        workers: Number of worker processes (integer).
+
+    Returns:
+        A dictionary mapping host names to (rate, capacity) tuples for `AdaptiveHostRateLimiter`.
+    """
+    return {
+        urlsplit(BEVERAGES_API_URL).hostname:
+            (max(ADAPTIVE_MIN_RATE, min(API_REQUESTS_PER_SECOND, API_RATE_CEILING / workers)), API_BURST),
+        urlsplit(NUTRITIONAL_INFO_URL).hostname:
+            (max(ADAPTIVE_MIN_RATE, min(CDN_REQUESTS_PER_SECOND, CDN_RATE_CEILING / workers)), CDN_BURST),
+    }
+
+
+def worker_cdn_concurrency(workers):
+    """
+    Per-process nutritional info lookups in flight that keep the CDN under its ceiling.
+
+    Split like `worker_host_rates`: each worker keeps the single-process concurrency until
+    `workers` of them would exceed `CDN_CONCURRENCY_CEILING`, which is then divided evenly
+    between them, so adding workers does not queue more requests at the CDN and lengthen
+    its tail latency. A worker always keeps at least one lookup in flight. The worker's
+    connection pool to the CDN is sized to match.
+
+    Args:
+        workers: Number of worker processes (integer).
+
+    Returns:
+        The number of concurrent CDN requests of a worker (integer).
+    """
+    return max(1, min(NUTRITION_MAX_WORKERS, CDN_CONCURRENCY_CEILING // workers))
+
+
+def _init_worker(host_rates, cdn_concurrency, retry_budget, previous_payloads, trace_context):
+    global _previous_payloads, _cdn_concurrency
+    # The HTTP stack is only imported by the code paths that send requests
+    from bm_scraper.utils.http_client import get_http_client
+
+    # Worker processes exit without running atexit handlers, which would drop queued log records
+    configure_logging(async_io=False)
+    max_rates = {host: rate for host, (rate, capacity) in host_rates.items()}
+    http_client = get_http_client()
+    http_client.rate_limiter = AdaptiveHostRateLimiter(host_rates, max_rates=max_rates)
+    http_client.pool_sizes[urlsplit(NUTRITIONAL_INFO_URL).hostname] = cdn_concurrency
+    http_client.retry_policy.budget = retry_budget
+    # Page sizes are negotiated and saved by the parent; a cap met by a worker only applies to its own units
+    get_page_sizes().read_only = True
+    get_metrics().join_trace(*trace_context)
+    _previous_payloads = previous_payloads
+    _cdn_concurrency = cdn_concurrency
+
+
+def _run_unit(func, *args):
+    # Hands the metrics recorded by the worker so far back to the parent with the unit result
+    return func(*args), get_metrics().drain()
+
+
+def _merge_unit_metrics(future):
+    if not future.cancelled() and future.exception() is None:
+        get_metrics().merge(future.result()[1])
+
+
+def _submit_unit(executor, func, *args):
+    """Queue a work unit; the metrics of every unit that completes are added to the parent's, even if its result is not used."""
+    future = executor.submit(_run_unit, func, *args)
+    future.add_done_callback(_merge_unit_metrics)
+    return future
+
+
+def _unit_result(future):
+    return future.result()[0]
+
+
+def _needs_enrichment(product):
+    if _previous_payloads is None:
+        return True
+    return _previous_payloads.get(str(product.get('id'))) != payload_fingerprint(product)
+
+
+def fetch_catalog_shard(category, first_page, last_page, page_size, probed_page=None):
+    """
+    Work unit fetching a range of catalog pages of a category and their nutritional info.
+
+    Args:
+        category: The store category ID (integer).
+        first_page: First catalog page of the shard (integer).
+        last_page: Last catalog page of the shard (integer).
+        page_size: Products per page (integer).
+        probed_page: The first catalog page, already fetched with `page_size` by the parent
+            while negotiating it; requested by default (dictionary).
+
+    Returns:
+        A tuple (pages, exhausted, served, nutrition_summary): the (page_number, products,
+        nutrition_map) tuples fetched, whether the end of the category was reached, the
+        (page_number, total_count, served_at) tuples of the responses for the catalog plan
+        of the category and the summary of the nutritional info lookups.
+    """
+    # The HTTP stack is only imported by the code paths that send requests
+    from bm_scraper.utils.http_client import http_get
+
+    pages = []
+    served = []
+    exhausted = False
+    with NutritionFetcher(max_workers=_cdn_concurrency) as nutrition_fetcher:
+        for page_number in range(first_page, last_page + 1):
+            if page_number == 1 and probed_page is not None:
+                data = probed_page
+            else:
+                api_url = page_url(BEVERAGES_API_URL, page_number, page_size, category)
+                with get_metrics().stage('fetch', category=category, page=page_number):
+                    response = http_get(api_url, proxies=PROXIES, headers=API_HEADERS, timeout=REQUEST_TIMEOUT)
+                    response.raise_for_status()
+                    data = response.json()
+            served.append((page_number, data.get('totalCount'), time.time()))
+
+            products = data.get('products', [])
+            if products:
+                eans = [product.get('ean') for product in products if _needs_enrichment(product)]
+                with get_metrics().stage('enrich', category=category, page=page_number):
+                    pages.append((page_number, products, nutrition_fetcher.fetch_many(eans)))
+            if not products or not data.get('hasMore', False):
+                exhausted = True
+                break
+    return pages, exhausted, served, nutrition_fetcher.stats.summary()
+
+
+def _first_page(future):
+    # (products on the first page of a category, total count it reported), or None if it failed or reported none
+    try:
+        pages, exhausted, served, nutrition_summary = _unit_result(future)
+    except Exception:
+        return None
+    if not served or not served[0][1]:
+        return None
+    return len(pages[0][1]) if pages else 0, served[0][1]
+
+
+def _submit_shard(executor, shards, shard, probed_page=None):
+    try:
+        future = _submit_unit(executor, fetch_catalog_shard, *shard, probed_page)
+    except RuntimeError as e:
+        # The pool is broken (a worker died) or shut down: the shard fails like one whose worker raised
+        future = Future()
+        future.set_exception(e)
+    shards.append((shard, future))
+
+
+def _shard_result(shard, future):
+    # Requests were already retried by the worker's HTTP client, so a failed shard is not resubmitted
+    try:
+        return _unit_result(future)
+    except Exception as e:
+        category, first_page, last_page, page_size = shard
+        logging.error(f"Error fetching category {category} pages {first_page}-{last_page}: {e}")
+        return None
+
+
+def _feed_result(category, promo_type, future):
+    # A feed whose unit failed, or whose worker died, is left out of the promotions of its category
+    try:
+        return _unit_result(future)
+    except Exception as e:
+        logging.error(f"Error fetching {promo_type} promotions of category {category}: {e}")
+        return None
+
+
+def scrape_categories_sharded(categories=None, workers=SCHEDULER_WORKERS, snapshot=None, writer=None, checkpoint=None):
+    """
+    Scrape several store categories with a pool of worker processes.
+
+    The crawl is split into work units: every promotion feed of each category, its first
+    catalog page and, once that page gives the page count of the category, (category, page
+    range) shards of `SHARD_PAGES` catalog pages for the remaining pages, queued as soon as the
+    first page of the category is answered. Units are fetched by `workers` processes, each
+    one throttled to its share of the per-host rate ceilings, keeping its share of
+    `CDN_CONCURRENCY_CEILING` lookups in flight and retrying with its share of
+    `RETRY_BUDGET`. Results are merged in the parent in queue order: products are deduplicated by product ID across shards and categories, joined with the
+    promotions of their category and written, so the output does not depend on which
+    worker finished first. Pages served while the catalog of a category changed are
+    fetched again once its shards are merged, as single-page shards whose new products are
+    kept (see `CatalogPlan`). Without a total count, the shards of a category are fetched
+    one after another until one reaches its end. The page size of every category and
+    promotion feed is negotiated with the API in the parent process, all endpoints at once,
+    and handed to its units with the first page the negotiation fetched, if any; the
+    workers never save page sizes. A promotion feed that fails
+    is logged and left out of the promotions of its category.
+
+    Args:
+        categories: Store category IDs to crawl; `CATEGORIES` by default (list).
+        workers: Number of worker processes (integer).
+        snapshot: Previous snapshot for incremental runs (IncrementalSnapshot).
+        writer: Streaming output stage (JsonLinesWriter).
+        checkpoint: Only its `completed` flag is set; sharded crawls are not resumable
+            (CrawlCheckpoint).
+
+    Returns:
+        A list of BmProductRecord objects containing processed product data, empty when the
+        items are streamed to `writer`.
+    """
+    started = time.perf_counter()
+    categories = list(categories or CATEGORIES)
+    scraped_products = []
+    scraped_count = 0
+    seen_product_ids = set()
+    crawl_interrupted = False
+    nutrition_summary = {}
+
+    previous_payloads = None
+    if snapshot is not None:
+        previous_payloads = {
+            product_id: fingerprint.get('payload')
+            for product_id, fingerprint in snapshot.previous_fingerprints.items() if product_id in snapshot.previous_items
+        }
+
+    logging.info(f"Crawling categories {categories} with {workers} worker processes")
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(
+            worker_host_rates(workers), worker_cdn_concurrency(workers), max(1, RETRY_BUDGET // workers), previous_payloads,
+            get_metrics().trace_context()
+        )
+    )
+    with executor:
+        category_promotions = {category: saved_promotions(category) for category in categories}
+        # Negotiated in the parent, so the worker processes do not probe the API; the endpoints are probed concurrently
+        endpoints = [(BEVERAGES_API_URL, category) for category in categories] + [
+            (api_url, category)
+            for category in categories if category_promotions[category] is None
+            for api_url, promo_type in PROMOTION_FEEDS
+        ]
+        with ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix='page-sizes') as negotiation:
+            # (page size, first page fetched while probing it or None) of every endpoint
+            negotiated = dict(zip(endpoints, negotiation.map(lambda endpoint: get_page_sizes().negotiate(*endpoint), endpoints)))
+        page_sizes = {category: negotiated[BEVERAGES_API_URL, category][0] for category in categories}
+        promo_futures = {
+            category: [
+                (promo_type, _submit_unit(executor, fetch_promotion_products, api_url, promo_type, category,
+                                          *negotiated[api_url, category]))
+                for api_url, promo_type in PROMOTION_FEEDS
+            ]
+            for category in categories if category_promotions[category] is None
+        }
+        shard_futures = {category: [] for category in categories}
+        for category in categories:
+            _submit_shard(executor, shard_futures[category], (category, 1, 1, page_sizes[category]),
+                          negotiated[BEVERAGES_API_URL, category][1])
+        plans = {}
+        # The shards of a category are queued as soon as its first page is answered, whatever the order of the categories
+        first_pages = {shard_futures[category][0][1]: category for category in categories}
+        for first_page_future in as_completed(first_pages):
+            category = first_pages[first_page_future]
+            served_first_page = _first_page(first_page_future)
+            if served_first_page is None:
+                continue
+            served_count, total_count = served_first_page
+            page_sizes[category] = category_page_size = get_page_sizes().served(
+                BEVERAGES_API_URL, category, page_sizes[category], served_count, total_count
+            )
+            plans[category] = plan = CatalogPlan(total_count, page_size=category_page_size)
+            # Shards keep about SHARD_PAGES pages of PAGE_SIZE products whatever the page size, so larger pages do not
+            # leave fewer units than workers
+            shard_pages = max(1, SHARD_PAGES * PAGE_SIZE // category_page_size)
+            for first_page in range(2, plan.last_page + 1, shard_pages):
+                shard = (category, first_page, min(first_page + shard_pages - 1, plan.last_page), category_page_size)
+                _submit_shard(executor, shard_futures[category], shard)
+
+        for category in categories:
+            promotions = category_promotions[category]
+            if promotions is None:
+                feed_promotions = [_feed_result(category, promo_type, future) for promo_type, future in promo_futures[category]]
+                promotions = join_promotion_feeds([feed for feed in feed_promotions if feed is not None], category)
+            shards = shard_futures[category]
+            plan = plans.get(category)
+            reconciled = False
+
+            # Shards to reconcile, or the next shard when there is no plan, are appended while the list is iterated
+            for index, (shard, future) in enumerate(shards):
+                result = _shard_result(shard, future)
+                if result is None:
+                    crawl_interrupted = True
+                    for _, pending in shards[index + 1:]:
+                        pending.cancel()
+                    break
+
+                pages, exhausted, served, shard_summary = result
+                for key in ('requested', 'found', 'missing', 'failed'):
+                    nutrition_summary[key] = nutrition_summary.get(key, 0) + shard_summary[key]
+                if plan is not None:
+                    for page_number, total_count, served_at in served:
+                        plan.record(page_number, total_count, served_at)
+
+                for page_number, products, nutrition_map in pages:
+                    page_products = {}
+                    for product in products:
+                        product_id = product.get('id')
+                        if product_id not in seen_product_ids and product_id not in page_products:
+                            page_products[product_id] = product
+                    seen_product_ids.update(page_products)
+                    logging.info(f"Found {len(page_products)} new products on page {page_number} of category {category}")
+
+                    with get_metrics().stage('parse', category=category, page=page_number):
+                        page_items = process_page_products(page_number, page_products, nutrition_map, promotions, snapshot)
+                    with get_metrics().stage('write', category=category, page=page_number):
+                        scraped_count += store_page_items(page_items, scraped_products, writer)
+
+                if plan is None:
+                    # Without a total count the shards can only be followed one after another
+                    if not exhausted:
+                        _submit_shard(executor, shards, (category, shard[2] + 1, shard[2] + SHARD_PAGES, page_sizes[category]))
+                elif index == len(shards) - 1 and not reconciled:
+                    reconciled = True
+                    for page_number in plan.reconcile_pages():
+                        _submit_shard(executor, shards, (category, page_number, page_number, plan.page_size))
+
+    if checkpoint is not None:
+        checkpoint.completed = not crawl_interrupted
+
+    logging.info(f"Nutritional info lookups: {nutrition_summary}")
+    logging.info(f"Scraping completed in {time.perf_counter() - started:.1f}s. Total scraped products: {scraped_count}")
+    return scraped_products
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+
+from bm_scraper.config.config import PAGE_SIZE
+from bm_scraper.utils.promotions import PromotionIndex
+
+
+class CrawlCheckpoint:
+    """
+    Progress of a catalog crawl, saved after every page written to the output.
+
+    Records the last catalog page whose items were written, the page size that gives the
+    offsets of its pages, the IDs of the products written so far, how many items the
+    streamed output holds, the promotion index once it is fetched and, for incremental
+    runs, the product fingerprints computed so far. A run
+    started with `--resume` continues from the next page instead of page 1 and reuses the
+    promotions instead of fetching them again.
+
+    Args:
+        path: Path of the checkpoint file (string).
+        category: The store category ID being crawled (integer).
+    """
+
+    def __init__(self, path, category=None):
+        self.path = path
+        self.category = category
+        self.last_page = 0
+        self.page_size = PAGE_SIZE
+        self.seen_product_ids = set()
+        self.written_count = 0
+        self.promotions = None
+        self.fingerprints = {}
+        self.completed = False
+
+    @property
+    def next_offset(self):
+        return self.last_page * self.page_size
+
+    @classmethod
+    def for_output(cls, output_file, category=None):
+        return cls(f"{os.path.splitext(output_file)[0]}.checkpoint.json", category)
+
+    @classmethod
+    def load(cls, output_file):
+        """
+        Load the checkpoint of an interrupted crawl.
+
+        Returns:
+            The saved CrawlCheckpoint, or None if there is nothing to resume.
+        """
+        checkpoint = cls.for_output(output_file)
+        try:
+            with open(checkpoint.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        checkpoint.category = state.get('category')
+        checkpoint.last_page = state.get('last_page', 0)
+        # Checkpoints saved before the page size was negotiated were crawled with pages of 20
+        checkpoint.page_size = state.get('page_size', 20)
+        checkpoint.seen_product_ids = set(state.get('seen_product_ids', []))
+        checkpoint.written_count = state.get('written_count', 0)
+        promotions = state.get('promotions')
+        checkpoint.promotions = PromotionIndex.from_dict(promotions) if promotions else None
+        checkpoint.fingerprints = state.get('fingerprints', {})
+        logging.info(
+            f"Resuming crawl after page {checkpoint.last_page} (offset {checkpoint.next_offset}, "
+            f"{len(checkpoint.seen_product_ids)} products already written)"
+        )
+        return checkpoint
+
+    def page_written(self, page_number, product_ids, written_count, snapshot=None):
+        """Record a page whose items were written to the output and save the checkpoint."""
+        self.last_page = max(self.last_page, page_number)
+        self.seen_product_ids.update(product_ids)
+        self.written_count = written_count
+        if snapshot is not None:
+            self.fingerprints = snapshot.fingerprints
+        self.save()
+
+    def save(self):
+        state = {
+            'category': self.category,
+            'last_page': self.last_page,
+            'page_size': self.page_size,
+            'offset': self.next_offset,
+            'seen_product_ids': sorted(self.seen_product_ids, key=str),
+            'written_count': self.written_count,
+            'promotions': self.promotions.to_dict() if self.promotions is not None else None,
+            'fingerprints': self.fingerprints,
+        }
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
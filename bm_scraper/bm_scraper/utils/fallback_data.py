@@ -1,4 +1,4 @@
-from bm_scraper.spiders.items import BmProductItem
+from bm_scraper.spiders.records import BmProductRecord
 
 
 def generate_fallback_data():
@@ -90,7 +90,7 @@ def generate_fallback_data():
     ]
     
     for product_data in sample_products:
-        bm_item = BmProductItem()
+        bm_item = BmProductRecord()
         bm_item['supermarket'] = 'BM Supermercados'
         bm_item['id'] = product_data['id']
         bm_item['description'] = product_data['description']
@@ -0,0 +1,325 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import RequestException
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from bm_scraper.config.config import (
+    BEVERAGES_API_URL,
+    NUTRITIONAL_INFO_URL,
+    API_POOL_SIZE,
+    CDN_POOL_SIZE,
+    DEFAULT_POOL_SIZE,
+    HTTP2_ENABLED
+)
+from bm_scraper.utils.metrics import get_metrics
+from bm_scraper.utils.rate_limiter import get_rate_limiter, parse_retry_after
+from bm_scraper.utils.retry import CircuitBreaker, RetryPolicy
+
+# DNS lookup and connect, and TLS handshake, times of the connection opened by the request running in this thread, if any
+_connection_timings = threading.local()
+
+def import_httpx():
+    """Import httpx on first use, since only HTTP/2 sessions need it; None when it is not installed."""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx
+
+
+class Http2Adapter(BaseAdapter):
+    """
+    Transport adapter that sends the requests of a `requests.Session` over HTTP/2 with httpx.
+
+    Responses and errors are translated back to their `requests` equivalents so callers
+    do not need to know which protocol was used. Requires `pip install httpx[http2]`.
+
+    Args:
+        pool_size: Maximum number of connections kept open per host (integer).
+    """
+
+    def __init__(self, pool_size):
+        super().__init__()
+        self.pool_size = pool_size
+        self.httpx = import_httpx()
+        self.protocol_counts = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _client_for(self, proxy):
+        with self._lock:
+            if proxy not in self._clients:
+                limits = self.httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                self._clients[proxy] = self.httpx.Client(http2=True, proxy=proxy, limits=limits)
+            return self._clients[proxy]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        proxy = (proxies or {}).get(urlsplit(request.url).scheme)
+        try:
+            httpx_response = self._client_for(proxy).request(
+                request.method, request.url, headers=dict(request.headers), content=request.body, timeout=timeout
+            )
+        except self.httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except self.httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        with self._lock:
+            self.protocol_counts[httpx_response.http_version] = self.protocol_counts.get(httpx_response.http_version, 0) + 1
+
+        response = requests.Response()
+        response.status_code = httpx_response.status_code
+        response.reason = httpx_response.reason_phrase
+        response.headers = CaseInsensitiveDict(httpx_response.headers)
+        response.url = request.url
+        response.request = request
+        response.encoding = httpx_response.encoding
+        response.elapsed = httpx_response.elapsed
+        response._content = httpx_response.content
+        return response
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        # Resolves the host (or the proxy) and opens the TCP connection; urllib3 does both in one call, trying every
+        # address found, so the DNS lookup is timed with the connect
+        started = time.perf_counter()
+        sock = super()._new_conn()
+        _connection_timings.dns_connect = time.perf_counter() - started
+        return sock
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        if isinstance(self, HTTPSConnection):
+            _connection_timings.tls = time.perf_counter() - started - getattr(_connection_timings, 'dns_connect', 0.0)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+TIMED_POOL_CLASSES = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    `HTTPAdapter` whose new connections record how long they took to open.
+
+    requests only reports the time until the response headers arrive; the connection
+    classes of this adapter also time the DNS lookup and TCP connect, and the proxy tunnel
+    and TLS handshake, of every connection they open, so `HttpClient` can split the time to
+    first byte of the requests that did not reuse a kept-alive connection.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        # SOCKS proxies need the connection pools of urllib3.contrib.socks
+        if not proxy.lower().startswith('socks'):
+            manager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+        return manager
+
+
+class HttpClient:
+    """
+    Shared HTTP layer keeping one pooled keep-alive session per host.
+
+    Each host gets its own `requests.Session` whose connection pool is sized from
+    `pool_sizes`, so connections (and their TCP + TLS handshakes, including the CONNECT
+    tunnel through the proxy) are reused across requests instead of being opened for
+    every call. Sessions are safe to share between the worker threads of the crawl.
+
+    Args:
+        pool_sizes: Map of host names to the number of connections kept open to them
+            (dictionary).
+        default_pool_size: Pool size for hosts not listed in `pool_sizes` (integer).
+        http2: Whether to send requests over HTTP/2; ignored when httpx is not
+            installed (boolean).
+        rate_limiter: Limiter every request waits on before it is sent, or None to leave
+            the pacing to the callers (HostRateLimiter).
+        retry_policy: Policy retrying the failed requests of `get`, or None to not retry
+            them (RetryPolicy).
+    """
+
+    def __init__(self, pool_sizes=None, default_pool_size=DEFAULT_POOL_SIZE, http2=HTTP2_ENABLED, rate_limiter=None,
+                 retry_policy=None):
+        self.pool_sizes = pool_sizes if pool_sizes is not None else {
+            urlsplit(BEVERAGES_API_URL).hostname: API_POOL_SIZE,
+            urlsplit(NUTRITIONAL_INFO_URL).hostname: CDN_POOL_SIZE,
+        }
+        self.default_pool_size = default_pool_size
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.http2 = http2 and import_httpx() is not None
+        if http2 and not self.http2:
+            logging.warning("HTTP/2 requested but httpx is not installed; using HTTP/1.1 keep-alive")
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url):
+        host = urlsplit(url).hostname
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                pool_size = self.pool_sizes.get(host, self.default_pool_size)
+                if self.http2:
+                    adapter = Http2Adapter(pool_size)
+                else:
+                    adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def get(self, url, **kwargs):
+        """Send a GET request once the rate limiter grants a slot for its host, retrying it as the retry policy allows."""
+        paced = getattr(_paced, 'active', False)
+
+        def send(attempt):
+            # Retries wait for a slot of their own even when the first attempt was paced by the caller
+            if self.rate_limiter is not None and (attempt > 0 or not paced):
+                started = time.perf_counter()
+                self.rate_limiter.acquire_blocking(url)
+                get_metrics().observe_wait(url, time.perf_counter() - started)
+            return self.fetch(url, **kwargs)
+
+        if self.retry_policy is None:
+            return send(0)
+        return self.retry_policy.call(url, send)
+
+    def fetch(self, url, **kwargs):
+        """Send a GET request right away and report its outcome to the rate limiter and the metrics."""
+        metrics = get_metrics()
+        proxied = bool(kwargs.get('proxies'))
+        _connection_timings.__dict__.clear()
+        start_ns = time.time_ns()
+        started = time.perf_counter()
+        try:
+            response = self.session_for(url).get(url, **kwargs)
+        except RequestException as e:
+            if self.rate_limiter is not None:
+                self.rate_limiter.record(url, failed=True)
+            metrics.observe_request(url, start_ns, time.perf_counter() - started, proxied, error=e,
+                                    **_connection_timings.__dict__)
+            raise
+        metrics.observe_request(
+            url, start_ns, time.perf_counter() - started, proxied,
+            status=response.status_code,
+            ttfb=response.elapsed.total_seconds(),
+            size=len(response.content),
+            **_connection_timings.__dict__
+        )
+        if self.rate_limiter is not None:
+            self.rate_limiter.record(
+                url,
+                latency=response.elapsed.total_seconds(),
+                status=response.status_code,
+                retry_after=parse_retry_after(response.headers.get('Retry-After'))
+            )
+        return response
+
+    def stats(self):
+        """
+        Connection reuse counters per host.
+
+        Returns:
+            A dictionary mapping each host to its number of 'requests', new 'connections'
+            (each one a TCP + TLS handshake) and 'reused' connections.
+        """
+        stats = {}
+        with self._lock:
+            sessions = dict(self._sessions)
+
+        for host, session in sessions.items():
+            adapter = session.get_adapter(f'https://{host}')
+            if isinstance(adapter, Http2Adapter):
+                stats[host] = {'requests': sum(adapter.protocol_counts.values()), 'protocols': dict(adapter.protocol_counts)}
+                continue
+
+            requests_count = connections = 0
+            for manager in [adapter.poolmanager, *adapter.proxy_manager.values()]:
+                for key in manager.pools.keys():
+                    pool = manager.pools.get(key)
+                    if pool is not None:
+                        requests_count += pool.num_requests
+                        connections += pool.num_connections
+            stats[host] = {'requests': requests_count, 'connections': connections, 'reused': requests_count - connections}
+        return stats
+
+    def log_stats(self):
+        for host, host_stats in self.stats().items():
+            logging.info(f"HTTP connections to {host}: {host_stats}")
+        if self.rate_limiter is not None:
+            logging.info(f"Request rates per host at the end of the run: {self.rate_limiter.rates()}")
+        if self.retry_policy is not None:
+            logging.info(f"Retries: {self.retry_policy.retries} of a budget of {self.retry_policy.budget}")
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+_paced = threading.local()
+
+
+def get_http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient(
+                rate_limiter=get_rate_limiter(),
+                retry_policy=RetryPolicy(circuit_breaker=CircuitBreaker())
+            )
+        return _http_client
+
+
+def call_paced(func, *args):
+    """
+    Call `func` in a thread whose requests already got their rate limiter slot.
+
+    Used by the asyncio engine, which waits for the slot on the event loop before handing
+    the request to a worker thread, so the thread does not wait for it a second time.
+    """
+    _paced.active = True
+    try:
+        return func(*args)
+    finally:
+        _paced.active = False
+
+
+def http_get(url, **kwargs):
+    return get_http_client().get(url, **kwargs)
@@ -1,16 +1,60 @@
-
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+
+from bm_scraper.config.config import LOG_DIR, LOG_LEVEL, LOG_ASYNC
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+def configure_logging(level=LOG_LEVEL, async_io=LOG_ASYNC, log_dir=LOG_DIR):
+    """
+    Log to `scraper.log` in `log_dir` and to the console, unless logging is already configured.
+
+    Args:
+        level: Level of the root logger, e.g. "INFO" or "DEBUG" (string or integer).
+        async_io: Whether records are formatted and written by a background thread; the
+            logging calls of the crawl then only put the record on a queue
+            (QueueHandler/QueueListener). Pending records are written at exit (boolean).
+        log_dir: Directory of the log file (string).
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
 
-def configure_logging():
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs')
     os.makedirs(log_dir, exist_ok=True)
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(os.path.join(log_dir, 'scraper.log')),
-            logging.StreamHandler()
-        ]
-    )
\ No newline at end of file
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(os.path.join(log_dir, 'scraper.log')), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root.setLevel(level)
+    if async_io:
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            root.addHandler(handler)
+
+
+def reset_logging():
+    """Write the pending records and remove the handlers installed by `configure_logging`."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        atexit.unregister(_listener.stop)
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
@@ -0,0 +1,371 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from bm_scraper.config.config import METRICS_ENABLED, METRICS_FILE, TRACE_FILE, TRACE_BATCH_SIZE
+
+# Upper bounds in seconds of the buckets of every duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS = {
+    'bm_http_requests_total': ('counter', 'HTTP requests sent, by host, status code (or "error") and route (proxy or direct).'),
+    'bm_http_retries_total': ('counter', 'HTTP requests sent again after a failed attempt, by host.'),
+    'bm_http_rejected_total': ('counter', 'HTTP requests not sent because the circuit of their host was open, by host.'),
+    'bm_http_response_bytes_total': ('counter', 'Bytes of HTTP response bodies received, by host.'),
+    'bm_http_request_duration_seconds': (
+        'histogram',
+        'HTTP request timings by host and phase: dns_connect (DNS lookup and TCP connect) and tls (proxy tunnel and '
+        'TLS handshake) for requests that opened a new connection, ttfb (until the response headers), download '
+        '(response body) and total.'
+    ),
+    'bm_rate_limit_wait_seconds': ('histogram', 'Time requests waited for a rate limiter slot, by host.'),
+    'bm_stage_duration_seconds': ('histogram', 'Duration of the crawl stages: crawl, promotions, fetch, enrich, parse, write and finalize.'),
+    'bm_metrics_written_timestamp_seconds': ('gauge', 'Unix time the metrics were written.'),
+}
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Span of the stage running in the current thread or asyncio task
+_current_span = contextvars.ContextVar('bm_scraper_current_span', default=None)
+
+
+def _new_id(bits):
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def _format_number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """
+    Process-wide instrumentation of the crawl: request and stage metrics, and trace spans.
+
+    Every request sent by `HttpClient` is recorded with its host, status code, whether it
+    went through the proxy, its response size and its timings (DNS lookup and connect, TLS, time to first
+    byte, download and total); the crawl stages are timed with `stage()`. Counters and
+    histograms are written in the Prometheus text format by `write_prometheus()`. When a
+    trace file is set, every request and stage is also exported as an OpenTelemetry span:
+    spans are written in batches, each line of the file being an OTLP/JSON
+    `ExportTraceServiceRequest` that an OpenTelemetry Collector can read.
+
+    Args:
+        enabled: Whether anything is recorded at all (boolean).
+        trace_file: Path of the OTLP JSON Lines file, or None to not export spans (string).
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, trace_file=TRACE_FILE):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.trace_id = _new_id(128)
+        self.root_span_id = None
+        self._counters = {}
+        self._histograms = {}
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def join_trace(self, trace_id, parent_span_id, trace_file):
+        """Attach the spans of this process to a trace started in another process."""
+        self.trace_id = trace_id
+        self.root_span_id = parent_span_id
+        self.trace_file = trace_file
+
+    def trace_context(self):
+        """(trace_id, span_id, trace_file) of the current span, to continue the trace in a worker process."""
+        return self.trace_id, _current_span.get() or self.root_span_id, self.trace_file
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def observe_request(self, url, start_ns, total, proxied, status=None, ttfb=None, size=0, dns_connect=None, tls=None,
+                        error=None):
+        """
+        Record a request sent by the HTTP client.
+
+        Args:
+            url: The requested URL (string).
+            start_ns: Unix time the request was started, in nanoseconds (integer).
+            total: Seconds until the response body was received or the request failed (number).
+            proxied: Whether the request went through the proxy (boolean).
+            status: The response status code, or None if the request failed (integer).
+            ttfb: Seconds until the response headers were received (number).
+            size: Bytes of the response body (integer).
+            dns_connect: Seconds spent resolving the host and connecting to it, if a new connection
+                was opened (number).
+            tls: Seconds spent on the proxy tunnel and TLS handshake of a new connection (number).
+            error: The exception of a failed request (Exception).
+        """
+        if not self.enabled:
+            return
+        host = urlsplit(url).hostname
+        route = 'proxy' if proxied else 'direct'
+        self.increment('bm_http_requests_total', host=host, status=status if status is not None else 'error', route=route)
+        self.increment('bm_http_response_bytes_total', size, host=host)
+        phases = {'dns_connect': dns_connect, 'tls': tls, 'ttfb': ttfb, 'download': None, 'total': total}
+        if ttfb is not None:
+            phases['download'] = max(total - ttfb, 0.0)
+        for phase, value in phases.items():
+            if value is not None:
+                self.observe('bm_http_request_duration_seconds', value, host=host, phase=phase)
+
+        if self.trace_file:
+            attributes = {
+                'http.request.method': 'GET', 'url.full': url, 'server.address': host, 'bm.route': route,
+                'http.response.body.size': size,
+            }
+            if status is not None:
+                attributes['http.response.status_code'] = status
+            if error is not None:
+                attributes['error.type'] = type(error).__name__
+            attributes.update({f'bm.{phase}_seconds': value for phase, value in phases.items() if value is not None})
+            failed = error is not None or status >= 400
+            self._add_span(f'GET {host}', _new_id(64), start_ns, int(total * 1e9), attributes, SPAN_KIND_CLIENT, failed)
+
+    def count_retry(self, url):
+        self.increment('bm_http_retries_total', host=urlsplit(url).hostname)
+
+    def observe_wait(self, url, seconds):
+        self.observe('bm_rate_limit_wait_seconds', seconds, host=urlsplit(url).hostname)
+
+    @contextmanager
+    def stage(self, name, **attributes):
+        """
+        Time a crawl stage and export it as a span; requests and stages started inside it
+        in the same thread or asyncio task become its children.
+        """
+        if not self.enabled:
+            yield
+            return
+        span_id = _new_id(64)
+        if self.root_span_id is None:
+            self.root_span_id = span_id
+        token = _current_span.set(span_id)
+        start_ns = time.time_ns()
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_span.reset(token)
+            if self.root_span_id == span_id:
+                self.root_span_id = None
+            self.observe('bm_stage_duration_seconds', elapsed, stage=name)
+            if self.trace_file:
+                self._add_span(name, span_id, start_ns, int(elapsed * 1e9), attributes, SPAN_KIND_INTERNAL, failed)
+
+    def _add_span(self, name, span_id, start_ns, duration_ns, attributes, kind, failed):
+        parent_span_id = _current_span.get() or self.root_span_id
+        if parent_span_id == span_id:
+            parent_span_id = None
+        span = {
+            'traceId': self.trace_id,
+            'spanId': span_id,
+            'parentSpanId': parent_span_id or '',
+            'name': name,
+            'kind': kind,
+            'startTimeUnixNano': str(start_ns),
+            'endTimeUnixNano': str(start_ns + duration_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()],
+            'status': {'code': STATUS_ERROR if failed else STATUS_OK},
+        }
+        with self._lock:
+            self._spans.append(span)
+            full = len(self._spans) >= TRACE_BATCH_SIZE
+        if full:
+            self.flush_spans()
+
+    def flush_spans(self):
+        """Append the buffered spans to the trace file as one OTLP/JSON line."""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans or not self.trace_file:
+            return
+        request = {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': 'bm_scraper'}},
+                {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+            ]},
+            'scopeSpans': [{'scope': {'name': 'bm_scraper'}, 'spans': spans}],
+        }]}
+        try:
+            os.makedirs(os.path.dirname(self.trace_file) or '.', exist_ok=True)
+            # One write per line, so lines appended by several worker processes do not interleave
+            with open(self.trace_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(request, separators=(',', ':')) + '\n')
+        except OSError as e:
+            logging.error(f"Error writing trace spans to {self.trace_file}: {e}")
+
+    def drain(self):
+        """
+        Take the metrics recorded so far, resetting them, and flush the pending spans.
+
+        Used by worker processes to hand their metrics to the parent, which adds them with `merge()`.
+        """
+        self.flush_spans()
+        with self._lock:
+            snapshot = {'counters': self._counters, 'histograms': self._histograms}
+            self._counters, self._histograms = {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            for key, value in snapshot['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (buckets, total, count) in snapshot['histograms'].items():
+                histogram = self._histograms.setdefault(key, [[0] * len(DURATION_BUCKETS), 0.0, 0])
+                histogram[0] = [a + b for a, b in zip(histogram[0], buckets)]
+                histogram[1] += total
+                histogram[2] += count
+
+    def total(self, name, **labels):
+        """Sum of a counter over every label set including `labels`."""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(
+                value for (metric, metric_labels), value in self._counters.items()
+                if metric == name and wanted <= set(metric_labels)
+            )
+
+    def quantile(self, name, q, **labels):
+        """
+        Estimate the `q` quantile (0 to 1) of a histogram as Prometheus' histogram_quantile()
+        does, interpolating linearly inside the bucket it falls in.
+
+        The histograms of every label set including `labels` are added up, e.g.
+        `quantile('bm_http_request_duration_seconds', 0.99, phase='total')` covers all hosts.
+
+        Returns:
+            The estimated value, or None if nothing was observed.
+        """
+        wanted = set(labels.items())
+        buckets = [0] * len(DURATION_BUCKETS)
+        count = 0
+        with self._lock:
+            for (metric, metric_labels), (histogram_buckets, _, histogram_count) in self._histograms.items():
+                if metric == name and wanted <= set(metric_labels):
+                    buckets = [a + b for a, b in zip(buckets, histogram_buckets)]
+                    count += histogram_count
+        if not count:
+            return None
+
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+            if bucket_count and cumulative + bucket_count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = bound
+        # Beyond the last bucket, like histogram_quantile()
+        return DURATION_BUCKETS[-1]
+
+    def prometheus_text(self):
+        """The recorded metrics in the Prometheus text exposition format (string)."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            if metric_type == 'gauge':
+                samples = [f'{name} {_format_number(time.time())}']
+            elif metric_type == 'counter':
+                samples = [
+                    f'{name}{{{_format_labels(labels)}}} {_format_number(value)}'
+                    for (metric, labels), value in sorted(counters.items(), key=str) if metric == name
+                ]
+            else:
+                samples = []
+                for (metric, labels), (buckets, total, count) in sorted(histograms.items(), key=str):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                        cumulative += bucket_count
+                        bucket_labels = _format_labels((*labels, ('le', bound)))
+                        samples.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+                    samples.append(f'{name}_bucket{{{_format_labels((*labels, ("le", "+Inf")))}}} {count}')
+                    samples.append(f'{name}_sum{{{_format_labels(labels)}}} {_format_number(total)}')
+                    samples.append(f'{name}_count{{{_format_labels(labels)}}} {count}')
+            if samples:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', *samples]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=METRICS_FILE):
+        """Write the metrics to `path` atomically, so a scraper never reads a partial file."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def export(self, metrics_file=METRICS_FILE):
+        """Write the metrics file and flush the pending spans at the end of a run, logging instead of raising."""
+        if not self.enabled:
+            return
+        self.flush_spans()
+        try:
+            self.write_prometheus(metrics_file)
+            logging.info(f"Metrics written to {metrics_file}")
+        except OSError as e:
+            logging.error(f"Error writing the metrics to {metrics_file}: {e}")
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics of the crawl."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
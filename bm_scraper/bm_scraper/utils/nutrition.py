@@ -0,0 +1,145 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bm_scraper.config.config import NUTRITION_MAX_WORKERS
+from bm_scraper.utils.nutrition_cache import get_nutrition_cache
+from bm_scraper.utils.product_parsers import fetch_nutritional_data
+
+
+def fetch_nutritional_data_timed(ean, cached=None):
+    """
+    Fetch the nutritional info of a product, classifying and timing the lookup.
+
+    Args:
+        ean: The product EAN (string).
+        cached: The (entry, fresh) tuple of `NutritionCache.lookup` when the caller already
+            looked the EAN up in the cache (tuple).
+
+    Returns:
+        A tuple (ean, data, elapsed_seconds, outcome, error) where outcome is 'found',
+        'missing' or 'failed' and error is the exception of a failed lookup, if any.
+    """
+    # The HTTP stack is only imported by the code paths that send requests
+    from requests.exceptions import HTTPError
+
+    started = time.perf_counter()
+    try:
+        data = fetch_nutritional_data(ean, cached)
+        outcome, error = ('found' if data else 'missing'), None
+    except HTTPError as e:
+        data = None
+        status = e.response.status_code if e.response is not None else None
+        outcome, error = ('missing', None) if status == 404 else ('failed', e)
+    except Exception as e:
+        data = None
+        outcome, error = 'failed', e
+    return ean, data, time.perf_counter() - started, outcome, error
+
+
+class NutritionFetchStats:
+    """
+    Per-run statistics for nutritional info lookups.
+
+    Records the latency of every EAN lookup together with its outcome: 'found' when the
+    CDN returned a JSON document, 'missing' when it answered 404 (the product has no
+    nutritional sheet) and 'failed' for any other error.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.outcomes = {}
+        self.errors = {}
+
+    def record(self, ean, elapsed, outcome, error=None):
+        self.latencies[ean] = elapsed
+        self.outcomes[ean] = outcome
+        if error is not None:
+            self.errors[ean] = str(error)
+
+    def count(self, outcome):
+        return sum(1 for value in self.outcomes.values() if value == outcome)
+
+    def summary(self):
+        latencies = sorted(self.latencies.values())
+        if not latencies:
+            return {'requested': 0, 'found': 0, 'missing': 0, 'failed': 0}
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+        return {
+            'requested': len(latencies),
+            'found': self.count('found'),
+            'missing': self.count('missing'),
+            'failed': self.count('failed'),
+            'latency_p50': round(percentile(0.50), 3),
+            'latency_p95': round(percentile(0.95), 3),
+            'latency_max': round(latencies[-1], 3),
+            'latency_total': round(sum(latencies), 3),
+        }
+
+    def log_summary(self, slowest=5):
+        summary = self.summary()
+        logging.info(f"Nutritional info lookups: {summary}")
+
+        for ean, elapsed in sorted(self.latencies.items(), key=lambda entry: entry[1], reverse=True)[:slowest]:
+            logging.info(f"Slow nutritional info lookup for EAN {ean}: {elapsed:.3f}s ({self.outcomes[ean]})")
+        for ean, error in self.errors.items():
+            logging.warning(f"Nutritional info lookup failed for EAN {ean}: {error}")
+
+        cache = get_nutrition_cache()
+        if cache is not None:
+            cache.log_stats()
+
+
+class NutritionFetcher:
+    """
+    Batch stage that fetches nutritional info JSONs through a bounded thread pool.
+
+    A single pool is kept for the whole run so that every catalog page (or the whole
+    catalog at once) can be looked up with at most `max_workers` requests in flight.
+    Results for EANs already looked up in this run are reused.
+
+    Args:
+        max_workers: Maximum number of concurrent requests to the CDN (integer).
+    """
+
+    def __init__(self, max_workers=NUTRITION_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.stats = NutritionFetchStats()
+        self.results = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nutrition')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def fetch_many(self, eans):
+        """
+        Fetch the nutritional info of several products concurrently.
+
+        Args:
+            eans: EANs to look up; empty values and duplicates are ignored (iterable).
+
+        Returns:
+            A dictionary mapping every requested EAN to its nutritional JSON, or None if
+            it could not be retrieved.
+        """
+        pending = [ean for ean in dict.fromkeys(eans) if ean and ean not in self.results]
+        # Each lookup runs in a copy of the caller's context, so its request spans belong to the caller's stage
+        contexts = [contextvars.copy_context() for _ in pending]
+
+        for ean, data, elapsed, outcome, error in self._executor.map(
+            contextvars.Context.run, contexts, [fetch_nutritional_data_timed] * len(pending), pending
+        ):
+            self.stats.record(ean, elapsed, outcome, error)
+            self.results[ean] = data
+
+        return {ean: self.results.get(ean) for ean in eans if ean}
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from bm_scraper.config.config import (
+    NUTRITION_CACHE_ENABLED,
+    NUTRITION_CACHE_DIR,
+    NUTRITION_CACHE_TTL,
+    NUTRITION_CACHE_MAX_BYTES
+)
+
+
+class NutritionCache:
+    """
+    Persistent cache of nutritional info JSONs keyed by EAN.
+
+    Every entry is a small JSON file holding the response body together with its ETag and
+    Last-Modified validators. Entries younger than `ttl` are served without touching the
+    network; older ones are revalidated with a conditional request. 404 answers are cached
+    too (with a None body) since most products never get a nutritional sheet. When the
+    cache grows beyond `max_bytes` the least recently used entries are evicted.
+
+    Args:
+        cache_dir: Directory holding the cache entries (string).
+        ttl: Seconds an entry is served without revalidation (integer).
+        max_bytes: Maximum total size of the cache entries on disk (integer).
+    """
+
+    def __init__(self, cache_dir=NUTRITION_CACHE_DIR, ttl=NUTRITION_CACHE_TTL, max_bytes=NUTRITION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.counters = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._sizes = {
+            entry.name: entry.stat().st_size
+            for entry in os.scandir(cache_dir) if entry.is_file() and entry.name.endswith('.json')
+        }
+        self._total_bytes = sum(self._sizes.values())
+
+    def _path(self, ean):
+        return os.path.join(self.cache_dir, f"{ean}.json")
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def get(self, ean):
+        try:
+            with open(self._path(ean), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # The file modification time tracks the last use for LRU eviction
+        try:
+            os.utime(self._path(ean))
+        except OSError:
+            pass
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get('fetched_at', 0) < self.ttl
+
+    def lookup(self, ean):
+        """
+        Look up an EAN before going to the network.
+
+        Returns:
+            A tuple (entry, fresh): the cached entry or None, and whether it is still
+            within its TTL and can be used without a request.
+        """
+        entry = self.get(ean)
+        fresh = entry is not None and self.is_fresh(entry)
+        if fresh:
+            self._count('hits')
+        return entry, fresh
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidated(self, ean, entry):
+        self._count('revalidated')
+        entry['fetched_at'] = time.time()
+        self._write(ean, entry)
+        return entry['body']
+
+    def put(self, ean, body, etag=None, last_modified=None):
+        self._count('misses')
+        self._write(ean, {'body': body, 'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time()})
+        return body
+
+    def _write(self, ean, entry):
+        path = self._path(ean)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write nutritional info cache entry for EAN {ean}: {e}")
+            return
+
+        with self._lock:
+            name = os.path.basename(path)
+            self._total_bytes += size - self._sizes.get(name, 0)
+            self._sizes[name] = size
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            entries = []
+            for name in self._sizes:
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.cache_dir, name)), name))
+                except OSError:
+                    entries.append((0, name))
+
+            for _, name in sorted(entries):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+                self._total_bytes -= self._sizes.pop(name)
+                self.counters['evicted'] += 1
+
+    def log_stats(self):
+        logging.info(f"Nutritional info cache: {self.counters} ({len(self._sizes)} entries, {self._total_bytes} bytes)")
+
+
+_nutrition_cache = None
+_nutrition_cache_lock = threading.Lock()
+
+
+def get_nutrition_cache():
+    """Return the process-wide nutritional info cache, or None if caching is disabled."""
+    global _nutrition_cache
+    if not NUTRITION_CACHE_ENABLED:
+        return None
+    with _nutrition_cache_lock:
+        if _nutrition_cache is None:
+            _nutrition_cache = NutritionCache()
+        return _nutrition_cache
@@ -0,0 +1,134 @@
+import gzip
+import json
+import logging
+import os
+import textwrap
+
+from bm_scraper.config.config import OUTPUT_COMPRESSION
+from bm_scraper.spiders.records import as_dict
+
+
+def open_jsonl(path, mode, compression=None):
+    """
+    Open a JSON Lines file in text mode, optionally compressed.
+
+    Args:
+        path: Path of the file (string).
+        mode: 'r', 'w' or 'a' (string).
+        compression: None, 'gzip' or 'zstd' (string).
+    """
+    if compression == 'gzip':
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the 'zstandard' package (pip install zstandard)") from None
+        return zstandard.open(path, f'{mode}t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class JsonLinesWriter:
+    """
+    Streaming output stage writing every item as soon as it is processed.
+
+    Items are appended to `<output>.jsonl` (`.jsonl.gz` / `.jsonl.zst` when compressed)
+    and flushed page by page, so a crash keeps everything processed so far and memory does
+    not grow with the catalog. `finalize()` then converts the JSON Lines file into the
+    usual indented JSON array through a temporary file and an atomic rename, so the final
+    output is never left half written.
+
+    Args:
+        output_file: Path of the final JSON file (string).
+        compression: None, 'gzip' or 'zstd' for the JSON Lines file (string).
+        append: Whether to keep the items of an existing JSON Lines file, e.g. when
+            resuming a crawl (boolean).
+        keep: When appending, the number of existing items to keep; items written after
+            the last checkpoint of an interrupted crawl are dropped (integer).
+    """
+
+    def __init__(self, output_file, compression=OUTPUT_COMPRESSION, append=False, keep=None):
+        extension = {'gzip': '.gz', 'zstd': '.zst'}.get(compression, '')
+        self.output_file = output_file
+        self.compression = compression
+        self.jsonl_file = f"{os.path.splitext(output_file)[0]}.jsonl{extension}"
+        self.count = 0
+
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        if append and os.path.exists(self.jsonl_file):
+            self.count = sum(1 for _ in self.iter_items())
+            if keep is not None and self.count > keep:
+                self._truncate(keep)
+        self._stream = open_jsonl(self.jsonl_file, 'a' if append else 'w', compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def iter_items(self):
+        with open_jsonl(self.jsonl_file, 'r', self.compression) as f:
+            try:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logging.warning(f"Skipping truncated line in {self.jsonl_file}")
+            except EOFError:
+                # A compressed stream cut short by an interrupted run
+                logging.warning(f"{self.jsonl_file} ends with an incomplete compressed block")
+
+    def _truncate(self, keep):
+        tmp_file = f"{self.jsonl_file}.tmp"
+        with open_jsonl(tmp_file, 'w', self.compression) as target:
+            for index, item in enumerate(self.iter_items()):
+                if index >= keep:
+                    break
+                target.write(json.dumps(item, ensure_ascii=False))
+                target.write('\n')
+        os.replace(tmp_file, self.jsonl_file)
+        logging.info(f"Dropped {self.count - keep} items written after the last checkpoint")
+        self.count = keep
+
+    def write(self, item):
+        self._stream.write(json.dumps(as_dict(item), ensure_ascii=False))
+        self._stream.write('\n')
+        self.count += 1
+
+    def write_many(self, items):
+        for item in items:
+            self.write(item)
+        self.flush()
+
+    def flush(self):
+        self._stream.flush()
+
+    def close(self):
+        if not self._stream.closed:
+            self._stream.close()
+
+    def finalize(self):
+        """
+        Close the stream and atomically write the final JSON array from the JSON Lines file.
+
+        Returns:
+            The path of the final JSON file.
+        """
+        self.close()
+        tmp_file = f"{self.output_file}.tmp"
+
+        with open(tmp_file, 'w', encoding='utf-8') as target:
+            target.write('[')
+            first = True
+            for item in self.iter_items():
+                target.write('\n' if first else ',\n')
+                target.write(textwrap.indent(json.dumps(item, indent=4, ensure_ascii=False), '    '))
+                first = False
+            target.write(']' if first else '\n]')
+
+        os.replace(tmp_file, self.output_file)
+        logging.info(f"Data saved to: {self.output_file} ({self.count} items, streamed to {self.jsonl_file})")
+        return self.output_file
@@ -0,0 +1,318 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from bm_scraper.config.config import (
+    PAGE_SIZE,
+    PAGE_SIZE_CANDIDATES,
+    PAGE_SIZE_MAX_AGE,
+    PAGE_SIZES_FILE,
+    REQUEST_TIMEOUT
+)
+
+
+def page_count(total_count, page_size=PAGE_SIZE):
+    """Number of catalog pages of `page_size` products holding `total_count` products."""
+    return math.ceil(total_count / page_size)
+
+
+def page_url(url_template, page_number, page_size, category):
+    """API URL of a page of `page_size` products, from a URL template of `config.py`."""
+    return url_template.format(page=page_number, limit=page_size, offset=(page_number - 1) * page_size, category=category)
+
+
+# Query parameters that select a page of a feed rather than the feed itself
+PAGING_PARAMS = {'page', 'limit', 'offset'}
+
+
+def endpoint_key(url, category):
+    """
+    Feed of an API URL template for a category: its host, path and query parameters (the
+    filters of a promotion feed, the category) without the paging ones. The catalog and the
+    promotion feeds share the host and path but not their page sizes, so each feed is keyed
+    on its own.
+    """
+    parts = urlsplit(page_url(url, 1, 0, category))
+    query = sorted((name, value) for name, value in parse_qsl(parts.query) if name not in PAGING_PARAMS)
+    return f"{parts.netloc}{parts.path}?{urlencode(query)}"
+
+
+class CatalogPlan:
+    """
+    Catalog pages of a category, planned from the total count reported by its first page.
+
+    Once the first page tells how many products the category has, the remaining pages are
+    known and can all be requested at once instead of following `hasMore`. The catalog can
+    change while they are fetched: a product added or removed shifts the products after it
+    to the next or previous page, so a page served after the change can repeat products of
+    the page before it (dropped by the deduplication by product ID of the engines) or miss
+    the product that moved back onto a page served before the change. Every page records
+    the total count it was served with; once the planned pages are fetched,
+    `reconcile_pages` gives the pages served with another total count than the last one
+    (which are fetched again so the products they missed are picked up by ID) and the pages
+    added if the catalog grew.
+
+    Args:
+        total_count: Total count of products reported by the first page (integer).
+        first_page: Page the crawl started from (integer).
+        page_size: Products per page (integer).
+    """
+
+    def __init__(self, total_count, first_page=1, page_size=PAGE_SIZE):
+        self.total_count = total_count
+        self.first_page = first_page
+        self.page_size = page_size
+        self.last_page = page_count(total_count, page_size)
+        self._served = {first_page: (time.time(), total_count)}
+        self._lock = threading.Lock()
+
+    @property
+    def remaining_pages(self):
+        """Pages after the first one (range)."""
+        return range(self.first_page + 1, self.last_page + 1)
+
+    def record(self, page_number, total_count, served_at=None):
+        """Record the total count a page was served with; `served_at` is the Unix time of its response, now by default."""
+        with self._lock:
+            self._served[page_number] = (served_at if served_at is not None else time.time(), total_count)
+
+    @property
+    def current_total(self):
+        """Total count reported by the last page served, or None if no page reported one."""
+        with self._lock:
+            served = [served for served in self._served.values() if served[1] is not None]
+        return max(served)[1] if served else None
+
+    def reconcile_pages(self):
+        """
+        Pages to fetch again once the planned pages are done, in page order.
+
+        Returns:
+            A list with the pages served with another total count than the last one and the
+            pages added if the catalog grew; empty when the catalog did not change.
+        """
+        current_total = self.current_total
+        if current_total is None:
+            return []
+        with self._lock:
+            stale = sorted(page for page, (_, total) in self._served.items() if total not in (None, current_total))
+        added = range(self.last_page + 1, page_count(current_total, self.page_size) + 1)
+        if not stale and not added:
+            return []
+        logging.info(
+            f"The catalog changed from {self.total_count} to {current_total} products while it was crawled; "
+            f"fetching {len(stale)} pages again and {len(added)} new pages"
+        )
+        self.last_page = max(self.last_page, page_count(current_total, self.page_size))
+        return stale + list(added)
+
+
+class PageSizes:
+    """
+    Page size (`limit`) of every API feed, negotiated with the API and saved between runs.
+
+    Page sizes are kept per feed and category (see `endpoint_key`), so a promotion feed is
+    probed on its own and never replaces the page size of the catalog. The first time a feed
+    is used, `limit` probes it with the `candidates` page sizes,
+    largest first. A page size is accepted when the first page comes back with exactly that
+    many products. When the API caps the page size below the requested one, the number of
+    products it served is probed in turn; when it rejects it with a 4xx response or an
+    unreadable body, the next candidate is tried, down to `default`. The result is saved to
+    `path` and reused until it is older than `max_age`. A probe that cannot tell (a feed
+    that fits in one page, or an unreachable endpoint) is only used for the current run.
+    Each feed is probed under a lock of its own, so feeds are negotiated concurrently, and
+    the first page the probe fetched with the accepted page size is handed to the caller
+    (`negotiate`) rather than requested again.
+
+    Args:
+        path: JSON file the page sizes are saved to (string).
+        candidates: Page sizes probed, largest first (list).
+        default: Page size used when no candidate is accepted (integer).
+        max_age: Seconds a negotiated page size is reused before it is probed again (float).
+        read_only: Whether page sizes learned in this process are kept for the current run
+            only instead of being saved to `path`, as in the worker processes of the
+            sharded engine (boolean).
+    """
+
+    def __init__(self, path=PAGE_SIZES_FILE, candidates=PAGE_SIZE_CANDIDATES, default=PAGE_SIZE, max_age=PAGE_SIZE_MAX_AGE,
+                 read_only=False):
+        self.path = path
+        self.candidates = sorted(candidates, reverse=True)
+        self.default = default
+        self.max_age = max_age
+        self.read_only = read_only
+        self._sizes = self._load()
+        self._unsaved = {}
+        self._lock = threading.Lock()
+        # Held while a feed is probed, so concurrent callers wait for that probe and not for the probes of other feeds
+        self._feed_locks = {}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if self.read_only:
+            return
+        # Several crawls can save at the same time, so each process writes its own temporary file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._sizes, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error saving the page sizes to {self.path}: {e}")
+
+    def _known(self, key):
+        entry = self._sizes.get(key)
+        if entry is not None and time.time() - entry['probed_at'] <= self.max_age:
+            return entry['limit']
+        return self._unsaved.get(key)
+
+    def saved(self, url, category):
+        """Page size known for the feed of `url` and `category`, or `default`; never sends a request."""
+        with self._lock:
+            return self._known(endpoint_key(url, category)) or self.default
+
+    def limit(self, url, category):
+        """
+        Page size to request from the feed of `url` and `category`, probing it if needed.
+
+        Args:
+            url: URL template of the endpoint, with `{page}`, `{limit}`, `{offset}` and
+                `{category}` placeholders (string).
+            category: The store category ID of the feed (integer).
+
+        Returns:
+            The page size (integer).
+        """
+        return self.negotiate(url, category)[0]
+
+    def negotiate(self, url, category):
+        """
+        Page size to request from the feed of `url` and `category`, probing it if needed,
+        with the first page the probe fetched.
+
+        Args:
+            url: URL template of the endpoint, with `{page}`, `{limit}`, `{offset}` and
+                `{category}` placeholders (string).
+            category: The store category ID of the feed (integer).
+
+        Returns:
+            A tuple (page_size, probed_page): the page size and the decoded first page of
+            the feed requested with it, to be used instead of requesting it again, or None
+            if this call did not probe the feed or the probe fetched no such page.
+        """
+        key = endpoint_key(url, category)
+        with self._lock:
+            feed_lock = self._feed_locks.setdefault(key, threading.Lock())
+        with feed_lock:
+            with self._lock:
+                page_size = self._known(key)
+            if page_size is not None:
+                return page_size, None
+            page_size, verified, probed_page = self._probe(url, category)
+            with self._lock:
+                if verified:
+                    self._sizes[key] = {'limit': page_size, 'probed_at': time.time()}
+                    self._save()
+                else:
+                    self._unsaved[key] = page_size
+        return page_size, probed_page
+
+    def _probe(self, url, category):
+        # The HTTP stack is only imported by the code paths that send requests
+        from requests.exceptions import HTTPError, RequestException
+
+        from bm_scraper.config.proxy_config import API_HEADERS, PROXIES
+        from bm_scraper.utils.http_client import http_get
+
+        endpoint = endpoint_key(url, category)
+        candidates = [size for size in self.candidates if size > self.default]
+        while candidates:
+            page_size = candidates.pop(0)
+            try:
+                response = http_get(page_url(url, 1, page_size, category), proxies=PROXIES, headers=API_HEADERS,
+                                    timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+                data = response.json()
+                served = len(data['products'])
+            except HTTPError as e:
+                if e.response is None or e.response.status_code >= 500:
+                    logging.warning(f"Could not probe the page size of {endpoint}: {e}")
+                    return self.default, False, None
+                logging.info(f"Page size {page_size} rejected by {endpoint}: {e}")
+                continue
+            except RequestException as e:
+                logging.warning(f"Could not probe the page size of {endpoint}: {e}")
+                return self.default, False, None
+            except (ValueError, KeyError, TypeError) as e:
+                logging.info(f"Page size {page_size} rejected by {endpoint}: unreadable response ({e})")
+                continue
+
+            total_count = data.get('totalCount')
+            if served == page_size:
+                logging.info(f"Page size {page_size} accepted by {endpoint}")
+                return page_size, True, data
+            if (total_count is not None and served >= total_count) or (total_count is None and not data.get('hasMore', False)):
+                logging.info(f"The feed probed on {endpoint} fits in a page of {page_size}; its page size is not saved")
+                return page_size, False, data
+            if self.default < served < page_size:
+                logging.info(f"{endpoint} caps the page size at {served} products; probing it")
+                candidates = [served] + [size for size in candidates if size < served]
+                continue
+            logging.info(f"Page size {page_size} not served by {endpoint}: {served} products")
+        logging.info(f"Using the default page size {self.default} for {endpoint}")
+        return self.default, True, None
+
+    def served(self, url, category, page_size, served_count, total_count):
+        """
+        Page size the first page of a feed was actually served with.
+
+        An API that caps the page size below the requested one returns fewer products on the
+        first page than the feed holds. The following pages then have to be requested with
+        the size it served, so their offsets do not skip products, and that size replaces
+        the one saved for the feed until it is probed again. A feed shorter than the page
+        size is not capped: it keeps the page size it was requested with.
+
+        Args:
+            url: URL template of the feed (string).
+            category: The store category ID of the feed (integer).
+            page_size: Page size the first page was requested with (integer).
+            served_count: Products on the first page (integer).
+            total_count: Total count of products reported by the first page (integer).
+
+        Returns:
+            The page size to request the following pages with.
+        """
+        capped = total_count is not None and 0 < served_count < min(page_size, total_count)
+        if not capped:
+            return page_size
+        key = endpoint_key(url, category)
+        logging.warning(f"{key} served {served_count} products per page instead of {page_size}; using pages of {served_count}")
+        with self._lock:
+            self._sizes.pop(key, None)
+            self._unsaved[key] = served_count
+            self._save()
+        return served_count
+
+
+_page_sizes = None
+_page_sizes_lock = threading.Lock()
+
+
+def get_page_sizes():
+    """Return the process-wide page sizes of the API feeds."""
+    global _page_sizes
+    with _page_sizes_lock:
+        if _page_sizes is None:
+            _page_sizes = PageSizes()
+        return _page_sizes
@@ -0,0 +1,164 @@
+import logging
+import os
+import shutil
+from datetime import date
+
+from bm_scraper.config.config import PARQUET_DIR, PARQUET_BATCH_SIZE
+from bm_scraper.spiders.records import BmProductRecord
+from bm_scraper.utils.product_parsers import NOT_FOUND, to_cents
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+except ImportError:
+    pyarrow = None
+
+
+# Item fields holding prices in euros, stored as integer cents in `<field>_cents` columns
+PRICE_FIELDS = ('price', 'offer_price', 'unit_price')
+# Partition columns of the dataset, in directory order
+PARTITION_COLUMNS = ('run_date', 'category')
+
+
+def _null(value):
+    if value == NOT_FOUND or value == [NOT_FOUND] or value == "":
+        return None
+    return value
+
+
+def product_schema():
+    """
+    Arrow schema of the product snapshots, derived from the fields of `BmProductRecord`.
+
+    `measuring_unit` is flattened into `measuring_unit_format`, `measuring_unit_value` and
+    `measuring_unit_unit`, prices are int64 `<field>_cents` columns, `image_links` is a list
+    of strings and any other field is a string. The `run_date` partition column is appended.
+    """
+    fields = []
+    for name in BmProductRecord.fields:
+        if name == 'measuring_unit':
+            fields += [
+                pyarrow.field('measuring_unit_format', pyarrow.string()),
+                pyarrow.field('measuring_unit_value', pyarrow.float64()),
+                pyarrow.field('measuring_unit_unit', pyarrow.string()),
+            ]
+        elif name in PRICE_FIELDS:
+            fields.append(pyarrow.field(f'{name}_cents', pyarrow.int64()))
+        elif name == 'image_links':
+            fields.append(pyarrow.field(name, pyarrow.list_(pyarrow.string())))
+        else:
+            fields.append(pyarrow.field(name, pyarrow.string()))
+    fields.append(pyarrow.field('run_date', pyarrow.date32()))
+    return pyarrow.schema(fields)
+
+
+def items_to_columns(items, run_date):
+    """
+    Convert product items into the columns of `product_schema()`.
+
+    Args:
+        items: BmProductRecord objects or dictionaries (iterable).
+        run_date: Date of the crawl (datetime.date).
+
+    Returns:
+        A dictionary mapping column names to lists of values.
+    """
+    columns = {name: [] for name in product_schema().names}
+    for item in items:
+        for name in BmProductRecord.fields:
+            value = item.get(name)
+            if name == 'measuring_unit':
+                measuring_unit = _null(value) or {}
+                columns['measuring_unit_format'].append(measuring_unit.get('format'))
+                columns['measuring_unit_value'].append(measuring_unit.get('value'))
+                columns['measuring_unit_unit'].append(measuring_unit.get('unit'))
+            elif name in PRICE_FIELDS:
+                columns[f'{name}_cents'].append(to_cents(value))
+            elif name == 'image_links':
+                links = [link for link in value or [] if _null(link) is not None]
+                columns[name].append(links or None)
+            else:
+                value = _null(value)
+                columns[name].append(str(value) if value is not None else None)
+        columns['run_date'].append(run_date)
+    return columns
+
+
+class ParquetExporter:
+    """
+    Columnar export of the product snapshots as a Parquet dataset.
+
+    Every export writes the items of a run under `<root_dir>/run_date=YYYY-MM-DD/category=...`
+    (Hive partitioning), replacing any earlier export of the same day, so
+    queries filtering on the run date or category only read the files they need and
+    columnar readers only load the columns they select. Items are converted in batches of
+    `batch_size`, so memory does not grow with the catalog.
+
+    Args:
+        root_dir: Directory of the dataset (string).
+        batch_size: Items converted per Arrow record batch (integer).
+    """
+
+    def __init__(self, root_dir=PARQUET_DIR, batch_size=PARQUET_BATCH_SIZE):
+        if pyarrow is None:
+            raise ImportError("Parquet export requires the 'pyarrow' package (pip install pyarrow)")
+        self.root_dir = root_dir
+        self.batch_size = batch_size
+        self.schema = product_schema()
+
+    def partitioning(self):
+        partition_schema = pyarrow.schema([self.schema.field(name) for name in PARTITION_COLUMNS])
+        return pyarrow.dataset.partitioning(partition_schema, flavor='hive')
+
+    def dataset(self):
+        """The exported snapshots as a typed `pyarrow.dataset.Dataset`, to filter by run date or category."""
+        return pyarrow.dataset.dataset(self.root_dir, schema=self.schema, format='parquet', partitioning=self.partitioning())
+
+    def _record_batches(self, items, run_date):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield pyarrow.RecordBatch.from_pydict(items_to_columns(batch, run_date), schema=self.schema)
+                batch = []
+        if batch:
+            yield pyarrow.RecordBatch.from_pydict(items_to_columns(batch, run_date), schema=self.schema)
+
+    def export(self, items, run_date=None):
+        """
+        Write the items of a run to the dataset.
+
+        Args:
+            items: BmProductRecord objects or dictionaries (iterable).
+            run_date: Date of the crawl; today by default (datetime.date).
+
+        Returns:
+            The number of items written.
+        """
+        run_date = run_date or date.today()
+        partition_dir = f"run_date={run_date.isoformat()}"
+        tmp_dir = os.path.join(self.root_dir, f".{partition_dir}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        written = []
+
+        pyarrow.dataset.write_dataset(
+            self._record_batches(items, run_date),
+            tmp_dir,
+            schema=self.schema,
+            format='parquet',
+            partitioning=self.partitioning(),
+            basename_template='part-{i}.parquet',
+            file_visitor=lambda written_file: written.append(written_file.metadata.num_rows)
+        )
+
+        # The run date partition is swapped in whole, so a new export of the same day never
+        # leaves categories of the previous one behind
+        target_dir = os.path.join(self.root_dir, partition_dir)
+        shutil.rmtree(target_dir, ignore_errors=True)
+        if os.path.isdir(os.path.join(tmp_dir, partition_dir)):
+            os.replace(os.path.join(tmp_dir, partition_dir), target_dir)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        count = sum(written)
+        logging.info(f"Parquet snapshot saved to: {target_dir} ({count} items in {len(written)} files)")
+        return count
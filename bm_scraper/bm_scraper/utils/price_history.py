@@ -0,0 +1,185 @@
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from bm_scraper.config.config import PRICE_HISTORY_DB
+from bm_scraper.utils.product_parsers import NOT_FOUND, to_cents
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    ean TEXT NOT NULL,
+    observed_at INTEGER NOT NULL,
+    observed_date TEXT NOT NULL,
+    product_id TEXT,
+    category TEXT,
+    price_cents INTEGER,
+    offer_price_cents INTEGER,
+    unit_price_cents INTEGER,
+    promotion TEXT,
+    PRIMARY KEY (ean, observed_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_observations_date ON observations (observed_date, ean);
+CREATE INDEX IF NOT EXISTS idx_observations_category ON observations (category, observed_date);
+CREATE INDEX IF NOT EXISTS idx_observations_time ON observations (observed_at, ean, price_cents);
+CREATE TRIGGER IF NOT EXISTS observations_no_update BEFORE UPDATE ON observations
+BEGIN SELECT RAISE(ABORT, 'observations are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS observations_no_delete BEFORE DELETE ON observations
+BEGIN SELECT RAISE(ABORT, 'observations are append-only'); END;
+"""
+
+PRICE_CHANGES_QUERY = """
+SELECT ean, product_id, category, observed_at, previous_price_cents, price_cents, promotion FROM (
+    SELECT *, LAG(price_cents) OVER (PARTITION BY ean ORDER BY observed_at) AS previous_price_cents
+    FROM observations
+    WHERE ean IN (SELECT ean FROM observations WHERE observed_at >= :since)
+)
+WHERE observed_at >= :since AND previous_price_cents IS NOT NULL AND price_cents IS NOT previous_price_cents
+ORDER BY ean, observed_at
+"""
+
+MIN_PRICES_QUERY = """
+SELECT ean, MIN(price_cents) AS min_price_cents, COUNT(*) AS observations
+FROM observations
+WHERE observed_at >= :since AND price_cents IS NOT NULL
+GROUP BY ean
+ORDER BY ean
+"""
+
+
+def _text(value):
+    if value is None or value == NOT_FOUND:
+        return None
+    return str(value)
+
+
+class PriceHistory:
+    """
+    Local SQLite store of the prices observed by every run, for price monitoring.
+
+    Each run appends one observation per EAN (price, offer price and unit price in integer
+    cents, and promotion), keyed by EAN and run timestamp; observations are never updated
+    or deleted. Indexes on EAN, category and date make time-window queries such as the
+    price changes of the last 24 hours or the minimum price over 90 days cheap, without
+    reading any JSON snapshot.
+
+    Args:
+        path: Path of the SQLite database file (string).
+    """
+
+    def __init__(self, path=PRICE_HISTORY_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # Refreshes the query planner statistics of the tables that grew
+        self.connection.execute("PRAGMA optimize")
+        self.connection.close()
+
+    def ingest(self, items, observed_at=None):
+        """
+        Append the observations of a run.
+
+        Args:
+            items: BmProductRecord objects or dictionaries (iterable).
+            observed_at: Unix timestamp of the run; now by default (number).
+
+        Returns:
+            The number of observations added; items without an EAN and EANs already
+            observed at this timestamp are skipped.
+        """
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        observed_date = datetime.fromtimestamp(observed_at, timezone.utc).date().isoformat()
+        rows = (
+            (
+                str(item['ean']), observed_at, observed_date, _text(item.get('id')), _text(item.get('category')),
+                to_cents(item.get('price')), to_cents(item.get('offer_price')), to_cents(item.get('unit_price')),
+                _text(item.get('promotion'))
+            )
+            for item in items if item.get('ean')
+        )
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany("INSERT OR IGNORE INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            added = self.connection.total_changes - before
+        logging.info(f"Price history: {added} observations added to {self.path}")
+        return added
+
+    def history(self, ean):
+        """Every observation of an EAN, oldest first (list of sqlite3.Row)."""
+        return self.connection.execute(
+            "SELECT * FROM observations WHERE ean = ? ORDER BY observed_at", (str(ean),)
+        ).fetchall()
+
+    def price_changes(self, hours=24, now=None):
+        """
+        Observations of the last `hours` whose price differs from the previous observation of the EAN.
+
+        Returns:
+            A list of sqlite3.Row with ean, product_id, category, observed_at,
+            previous_price_cents, price_cents and promotion.
+        """
+        since = (now if now is not None else time.time()) - hours * 3600
+        return self.connection.execute(PRICE_CHANGES_QUERY, {'since': since}).fetchall()
+
+    def min_prices(self, days=90, now=None):
+        """
+        Minimum observed price of every EAN over the last `days`.
+
+        Returns:
+            A list of sqlite3.Row with ean, min_price_cents and observations.
+        """
+        since = (now if now is not None else time.time()) - days * 86400
+        return self.connection.execute(MIN_PRICES_QUERY, {'since': since}).fetchall()
+
+
+def record_prices(items, observed_at=None):
+    """
+    Append the observations of a run to `PRICE_HISTORY_DB`, logging instead of raising on database errors.
+
+    Returns:
+        The number of observations added.
+    """
+    try:
+        with PriceHistory() as price_history:
+            return price_history.ingest(items, observed_at)
+    except sqlite3.Error as e:
+        logging.error(f"Error saving the price history to {PRICE_HISTORY_DB}: {e}")
+        return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the price history of previous runs.")
+    parser.add_argument("--db", default=PRICE_HISTORY_DB, help="price history database")
+    subparsers = parser.add_subparsers(dest="query", required=True)
+    changes_parser = subparsers.add_parser("changes", help="price changes in the last hours")
+    changes_parser.add_argument("--hours", type=float, default=24)
+    min_parser = subparsers.add_parser("min", help="minimum price per EAN over the last days")
+    min_parser.add_argument("--days", type=float, default=90)
+    history_parser = subparsers.add_parser("history", help="every observation of an EAN")
+    history_parser.add_argument("ean")
+    args = parser.parse_args()
+
+    with PriceHistory(args.db) as price_history:
+        if args.query == "changes":
+            rows = price_history.price_changes(args.hours)
+        elif args.query == "min":
+            rows = price_history.min_prices(args.days)
+        else:
+            rows = price_history.history(args.ean)
+        for row in rows:
+            print("\t".join("" if value is None else str(value) for value in row))
@@ -1,9 +1,23 @@
+import logging
 import re
+from functools import lru_cache
 
-import requests
-from requests.exceptions import RequestException
+from bm_scraper.config.config import NUTRITIONAL_INFO_URL, NUTRITION_TIMEOUT, MEASURING_UNIT_CACHE_SIZE
+from bm_scraper.utils.nutrition_cache import get_nutrition_cache
 
 
+# Value of the item fields that could not be scraped
+NOT_FOUND = "No encontrado"
+
+
+def to_cents(value):
+    """Price in euros as integer cents, None when it is missing or not a number."""
+    if value is None or value == NOT_FOUND:
+        return None
+    try:
+        return int(round(float(value) * 100))
+    except (TypeError, ValueError):
+        return None
 
 
 def get_value_or_not_found(value):
@@ -13,64 +27,145 @@ def get_value_or_not_found(value):
                 return "No encontrado"
             return value 
             
+def fetch_nutritional_data(ean, cached=None):
+    # The HTTP stack is only imported by the code paths that send requests
+    from bm_scraper.utils.http_client import http_get
+
+    cache = get_nutrition_cache()
+    # `cached` is the (entry, fresh) lookup of a caller that already checked the cache
+    if cached is None:
+        cached = cache.lookup(ean) if cache else (None, False)
+    entry, fresh = cached
+    if fresh:
+        return entry['body']
+
+    nutritional_url = NUTRITIONAL_INFO_URL.format(ean=ean)
+    headers = cache.conditional_headers(entry) if cache else {}
+    response = http_get(nutritional_url, headers=headers, timeout=NUTRITION_TIMEOUT)
+    if cache and response.status_code == 304 and entry:
+        return cache.revalidated(ean, entry)
+    if cache and response.status_code == 404:
+        cache.put(ean, None)
+    response.raise_for_status()
+
+    data = response.json() if response.status_code == 200 else None
+    if cache and response.status_code == 200:
+        cache.put(ean, data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return data
+
 def get_nutritional_data(ean):
     
-    nutritional_url = f"https://cdn-bm.aktiosdigitalservices.com/tol/bm/media/product/nutritional-info/{ean}.json"
     try:
-        response = requests.get(nutritional_url, timeout=10)
-        response.raise_for_status()
-        return response.json() if response.status_code == 200 else None
-    except RequestException:
-        return None
-    except Exception:
+        return fetch_nutritional_data(ean)
+    except Exception as e:
+        # Products without nutritional info get a 404 from the CDN, which is not worth a warning
+        if getattr(getattr(e, 'response', None), 'status_code', None) != 404:
+            logging.warning(f"Nutritional info for EAN {ean} not available: {e}")
         return None
 
-def parse_measuring_unit(description):
-    
+# Quantity of a single unit, optionally preceded by chained pack multipliers: 33cl, 1,5 l, 6x33cl, 4x6x25 cl, 500 g
+QUANTITY_PATTERN = re.compile(
+    r'(?:(\d+(?:\s*[x×]\s*\d+)*)\s*[x×]\s*)?'
+    r'(\d+(?:[.,]\d+)?)\s*(ml|cl|dl|litros?|lt|l|kilos?|kgs?|gramos|grs?|g)\b'
+)
+# Packs of packs written out: 4 packs de 6, 2 packs 6; a number before a single 'pack' is part of the name
+PACKS_OF_PACKS_PATTERN = re.compile(r'(?<![\d.,])(\d+)\s*packs\s*(?:de\s*)?(\d+)\b')
+# Units of a pack: 6 latas, pack 6 unidades, 2x6 botellines, 24 uds.
+PACK_UNITS_PATTERN = re.compile(
+    r'(?<![\d.,])(?:(\d+)\s*[x×]\s*)?(\d+)\s*(?:unidades|uds?|latas|botellas|botellines|botes|bricks|tercios)\b'
+)
+PACK_PATTERN = re.compile(r'\bpack\s*(?:de\s*)?(\d+)\b')
+
+# Factor converting every unit to liters or kilograms
+UNIT_FACTORS = {
+    'ml': (0.001, 'L'), 'cl': (0.01, 'L'), 'dl': (0.1, 'L'), 'l': (1.0, 'L'), 'lt': (1.0, 'L'),
+    'litro': (1.0, 'L'), 'litros': (1.0, 'L'),
+    'g': (0.001, 'kg'), 'gr': (0.001, 'kg'), 'grs': (0.001, 'kg'), 'gramos': (0.001, 'kg'),
+    'kg': (1.0, 'kg'), 'kgs': (1.0, 'kg'), 'kilo': (1.0, 'kg'), 'kilos': (1.0, 'kg'),
+}
+
+
+def _pack_count(text):
+    packs_match = PACKS_OF_PACKS_PATTERN.search(text)
+    if packs_match:
+        return int(packs_match.group(1)) * int(packs_match.group(2))
+    units_match = PACK_UNITS_PATTERN.search(text)
+    if units_match:
+        return int(units_match.group(1) or 1) * int(units_match.group(2))
+    pack_match = PACK_PATTERN.search(text)
+    if pack_match:
+        return int(pack_match.group(1))
+    return 1
+
+
+@lru_cache(maxsize=MEASURING_UNIT_CACHE_SIZE)
+def _parse_measuring_unit(description):
+    """Memoized (format, value, unit) tuple of a description, all None when it has no measuring unit."""
     if not description:
-        return {"format": "unit", "value": 1.0, "unit": "L"}
-    
+        return None, None, None
+
     desc_lower = description.lower()
-    
-    # Patterns to detect decimals and commas
-    pack_match = re.search(r'(\d+)x(\d+[,.]?\d*)\s*([cm]?l)\b', desc_lower)  # 12x33cl, 6x1,5L
-    unit_match = re.search(r'(\d+[,.]?\d*)\s*([cm]?l)\b', desc_lower)        # 33cl, 1,5L, 2.5L
-    
-    if pack_match:
-        # Pack format: 12x33cl → 3.96L
-        units_count = int(pack_match.group(1))
-        volume_str = pack_match.group(2).replace(',', '.') 
-        volume = float(volume_str)
-        unit = pack_match.group(3).upper()
-        
-        liters_per_unit = volume * (0.01 if unit == 'CL' else 0.001 if unit == 'ML' else 1.0)
-        total_liters = liters_per_unit * units_count
-        
-        return {
-            "format": "pack",
-            "value": round(total_liters, 2),
-            "unit": "L"
-        }
-    
-    elif unit_match:
-        # Unit format
-        volume_str = unit_match.group(1).replace(',', '.') 
-        volume = float(volume_str)
-        unit = unit_match.group(2).upper()
-        
-        liters = volume * (0.01 if unit == 'CL' else 0.001 if unit == 'ML' else 1.0)
-        
-        return {
-            "format": "unit", 
-            "value": round(liters, 2),
-            "unit": "L"
-        }
-    
-    return {
-        "format": "unit",
-        "value": 1.0,
-        "unit": "L"
-    }
+    quantity_match = QUANTITY_PATTERN.search(desc_lower)
+    if not quantity_match:
+        units_count = _pack_count(desc_lower)
+        if units_count > 1:
+            # Pack format without a volume or weight: pack 6 unidades → 6 units
+            return "pack", float(units_count), "ud"
+        return None, None, None
+
+    multipliers, amount, unit = quantity_match.groups()
+    factor, base_unit = UNIT_FACTORS[unit]
+    value = float(amount.replace(',', '.')) * factor
+
+    if multipliers:
+        # Pack formats: 12x33cl → 3.96L, packs of packs: 4x6x25cl → 6L
+        units_count = 1
+        for multiplier in re.split(r'\s*[x×]\s*', multipliers):
+            units_count *= int(multiplier)
+    else:
+        # Pack size written apart from the quantity: 330ml Pack 6 unidades → 1.98L
+        units_count = _pack_count(desc_lower[:quantity_match.start()] + ' ' + desc_lower[quantity_match.end():])
+
+    return ("pack" if units_count > 1 else "unit"), round(value * units_count, 2), base_unit
+
+
+def parse_measuring_unit(description):
+    """
+    Parse the measuring unit of a product from its description.
+
+    Volumes are converted to liters and weights to kilograms, multiplied by the number of
+    units of packs (6x33cl, pack 6 latas 33 cl) and packs of packs (4x6x25cl, 4 packs de 6
+    x 25 cl). Packs without a volume or weight are counted in units ("ud").
+
+    Args:
+        description: The product description (string).
+
+    Returns:
+        A dictionary with 'format' ('unit' or 'pack'), 'value' and 'unit' ('L', 'kg' or
+        'ud'), or None if the description has no measuring unit.
+    """
+    measuring_format, value, unit = _parse_measuring_unit(description)
+    if measuring_format is None:
+        return None
+    return {"format": measuring_format, "value": value, "unit": unit}
+
+
+def parse_measuring_units(descriptions):
+    """
+    Parse the measuring units of a batch of descriptions into columns.
+
+    Repeated descriptions, within the batch or across batches, are parsed only once.
+
+    Args:
+        descriptions: Product descriptions (iterable of strings).
+
+    Returns:
+        A dictionary with the 'format', 'value' and 'unit' lists, one entry per
+        description, None where a description has no measuring unit.
+    """
+    parsed = [_parse_measuring_unit(description) for description in descriptions]
+    formats, values, units = map(list, zip(*parsed)) if parsed else ([], [], [])
+    return {"format": formats, "value": values, "unit": units}
 
 
 def get_hierarchical_category(categories):
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import time
+
+from bm_scraper.config.config import PROMOTION_INDEX_DIR, PROMOTION_INDEX_MAX_AGE
+
+# Promotion types in attribution precedence order: MxN > SecondUnit > OfferPrice > OfferDeferred
+PROMOTION_PRECEDENCE = ('MxN', 'SecondUnitDiscount', 'OfferPrice', 'OfferDeferred')
+
+_RANKS = {promo_type: rank for rank, promo_type in enumerate(PROMOTION_PRECEDENCE)}
+
+
+def offer_promotion(offer, promo_type):
+    """
+    Promotion record of an API offer.
+
+    Returns:
+        A dictionary with the promotion 'type', 'minDescription', 'shortDescription' and
+        the 'label' written to the item, or None if the offer has no description.
+    """
+    min_desc = offer.get('minDescription', '').strip()
+    short_desc = offer.get('shortDescription', '').strip()
+    if not min_desc and not short_desc:
+        return None
+    return {
+        'type': promo_type,
+        'minDescription': min_desc,
+        'shortDescription': short_desc,
+        'label': f"{promo_type}: {min_desc} - {short_desc}",
+    }
+
+
+def offer_type(offer):
+    """Promotion type of an offer of a product that is in none of the promotion feeds, guessed from its descriptions."""
+    min_desc = offer.get('minDescription', '').strip()
+    short_desc = offer.get('shortDescription', '').strip()
+    if 'Deferred' in short_desc:
+        return 'OfferDeferred'
+    if offer.get('promotionType') == 1:
+        return 'OfferPrice'
+    if '2X1' in min_desc:
+        return 'MxN'
+    if '2ª al' in min_desc:
+        return 'SecondUnitDiscount'
+    return 'Unknown'
+
+
+class PromotionIndex:
+    """
+    Promotions of the products of a category, indexed by EAN.
+
+    Every promotion feed adds the first offer of each of its products; an EAN keeps one
+    promotion per type, ordered by `PROMOTION_PRECEDENCE`, so the promotion attributed to a
+    product is the first one and is looked up once instead of in one map per feed. Records
+    carry their pre-formatted 'label'. The index is JSON-serializable: it is saved in the
+    crawl checkpoint and, per category, under `PROMOTION_INDEX_DIR`, from where later runs
+    can reuse it instead of fetching the feeds again (see `PROMOTION_INDEX_MAX_AGE`).
+
+    Args:
+        promotions: Map of EANs to their promotion records, in precedence order (dictionary).
+        fetched_at: Unix time the promotion feeds were fetched; now by default (float).
+    """
+
+    def __init__(self, promotions=None, fetched_at=None):
+        self._promotions = promotions if promotions is not None else {}
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+    def __len__(self):
+        return len(self._promotions)
+
+    def __contains__(self, ean):
+        return ean in self._promotions
+
+    def add(self, ean, promotion):
+        """Add a promotion record to an EAN unless it already has one of that type; returns whether it was added."""
+        records = self._promotions.setdefault(ean, [])
+        if any(record['type'] == promotion['type'] for record in records):
+            return False
+        records.append(promotion)
+        records.sort(key=lambda record: _RANKS.get(record['type'], len(_RANKS)))
+        return True
+
+    def add_products(self, products, promo_type):
+        """
+        Add the promotions of a page of a promotion feed.
+
+        Args:
+            products: The 'products' list of a promotion API response (list).
+            promo_type: The type of promotion of the feed (string).
+
+        Returns:
+            The number of EANs that got a promotion of this type.
+        """
+        new_count = 0
+        for product in products:
+            ean = product.get('ean')
+            offers = product.get('offers', [])
+            if not ean or not offers:
+                continue
+            promotion = offer_promotion(offers[0], promo_type)
+            if promotion is not None and self.add(ean, promotion):
+                new_count += 1
+        return new_count
+
+    def merge(self, other):
+        """Add the promotions of another index to this one and return it."""
+        for ean, records in other._promotions.items():
+            for record in records:
+                self.add(ean, record)
+        self.fetched_at = min(self.fetched_at, other.fetched_at)
+        return self
+
+    @classmethod
+    def combine(cls, indexes):
+        """A new index with the promotions of every index, e.g. one per promotion feed."""
+        indexes = list(indexes)
+        combined = cls(fetched_at=min((index.fetched_at for index in indexes), default=None))
+        for index in indexes:
+            combined.merge(index)
+        return combined
+
+    def promotions(self, ean):
+        """Every promotion record of an EAN, in precedence order (list)."""
+        return self._promotions.get(ean, [])
+
+    def best(self, ean):
+        """The promotion record attributed to an EAN, or None."""
+        records = self._promotions.get(ean)
+        return records[0] if records else None
+
+    def count(self, promo_type):
+        """Number of EANs with a promotion of `promo_type`."""
+        return sum(1 for records in self._promotions.values() if any(record['type'] == promo_type for record in records))
+
+    def to_dict(self):
+        return {'fetched_at': self.fetched_at, 'promotions': self._promotions}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls({ean: list(records) for ean, records in state['promotions'].items()}, state.get('fetched_at'))
+
+    def save(self, path):
+        """Write the index to `path` atomically."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def promotion_index_path(category, index_dir=PROMOTION_INDEX_DIR):
+    return os.path.join(index_dir, f"{category}.json")
+
+
+def load_promotion_index(category, max_age=PROMOTION_INDEX_MAX_AGE):
+    """
+    Return the saved promotion index of a category if it is recent enough to be reused.
+
+    Args:
+        category: The store category ID (integer).
+        max_age: Seconds since its feeds were fetched for the index to be reused; 0 never
+            reuses it (float).
+
+    Returns:
+        The saved PromotionIndex, or None if the feeds have to be fetched.
+    """
+    if not max_age:
+        return None
+    path = promotion_index_path(category)
+    try:
+        index = PromotionIndex.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    age = time.time() - index.fetched_at
+    if age > max_age:
+        return None
+    logging.info(f"Reusing the promotions of category {category} fetched {age:.0f}s ago ({len(index)} products) from {path}")
+    return index
+
+
+def save_promotion_index(index, category):
+    """Save the promotion index of a category for later runs, logging instead of raising."""
+    path = promotion_index_path(category)
+    try:
+        index.save(path)
+    except OSError as e:
+        logging.error(f"Error saving the promotions of category {category} to {path}: {e}")
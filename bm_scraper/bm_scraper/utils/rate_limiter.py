@@ -0,0 +1,250 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from bm_scraper.config.config import (
+    BEVERAGES_API_URL,
+    NUTRITIONAL_INFO_URL,
+    API_REQUESTS_PER_SECOND,
+    API_BURST,
+    CDN_REQUESTS_PER_SECOND,
+    CDN_BURST,
+    DEFAULT_REQUESTS_PER_SECOND,
+    ADAPTIVE_RATE_LIMITING,
+    ADAPTIVE_MIN_RATE,
+    ADAPTIVE_MAX_SPEEDUP,
+    ADAPTIVE_RATE_INCREASE,
+    ADAPTIVE_RATE_DECREASE,
+    ADAPTIVE_LATENCY_TARGET
+)
+
+
+def parse_retry_after(value):
+    """
+    Parse a `Retry-After` header, given either in seconds or as an HTTP date.
+
+    Returns:
+        The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the request rate to a single host.
+
+    Tokens are refilled continuously at `rate` per second up to `capacity`. Acquiring a
+    token reserves it immediately and returns how long the caller has to wait for it, so
+    concurrent callers are spaced out instead of all waking up at the same time.
+
+    Args:
+        rate: Tokens added per second (float).
+        capacity: Maximum number of tokens that can be accumulated (float).
+    """
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire_blocking(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            import asyncio
+            await asyncio.sleep(delay)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket whose rate follows the responses of its host (AIMD).
+
+    Every fast, healthy response adds `increase` times the initial rate to the rate, up to
+    `max_rate`. A 429 or 503, any other 5xx, a connection error or a smoothed latency above
+    `latency_target` multiplies it by `decrease`, down to `min_rate`, at most once per
+    request interval so that a burst of failures only backs off once. A `Retry-After`
+    header also pauses the host for the time it asks for.
+
+    Args:
+        rate: Initial tokens added per second (float).
+        capacity: Maximum number of tokens that can be accumulated (float).
+        min_rate: Lowest rate the host is backed off to (float).
+        max_rate: Highest rate the host is sped up to; `ADAPTIVE_MAX_SPEEDUP` times the
+            initial rate by default (float).
+        increase: Fraction of the initial rate added after a healthy response (float).
+        decrease: Rate multiplier applied after an unhealthy response (float).
+        latency_target: Smoothed response time, in seconds, above which the host is backed
+            off (float).
+    """
+
+    def __init__(self, rate, capacity=1.0, min_rate=ADAPTIVE_MIN_RATE, max_rate=None,
+                 increase=ADAPTIVE_RATE_INCREASE, decrease=ADAPTIVE_RATE_DECREASE, latency_target=ADAPTIVE_LATENCY_TARGET):
+        super().__init__(rate, capacity)
+        self.min_rate = min(float(min_rate), self.rate)
+        self.max_rate = float(max_rate) if max_rate is not None else self.rate * ADAPTIVE_MAX_SPEEDUP
+        self.increase = self.rate * increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.latency = None
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+    def reserve(self):
+        delay = super().reserve()
+        with self._lock:
+            return max(delay, self._paused_until - time.monotonic())
+
+    def record(self, latency=None, status=None, retry_after=None, failed=False):
+        """
+        Adjust the rate to the outcome of a request.
+
+        Args:
+            latency: Response time in seconds (float).
+            status: HTTP status code of the response (integer).
+            retry_after: Seconds the server asked to wait before the next request (float).
+            failed: Whether the request failed without a response (boolean).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            unhealthy = (
+                failed
+                or (status is not None and (status >= 500 or status == 429))
+                or (self.latency is not None and self.latency > self.latency_target)
+            )
+            self._refill(now)
+            if not unhealthy:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+            elif now - self._last_decrease >= 1.0 / self.rate:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._last_decrease = now
+
+
+class HostRateLimiter:
+    """
+    Keeps one token bucket per host.
+
+    Args:
+        host_rates: Map of host names to (rate, capacity) tuples (dictionary).
+        default_rate: (rate, capacity) used for hosts not listed in `host_rates`, or None to
+            leave them unthrottled (tuple).
+    """
+
+    def __init__(self, host_rates, default_rate=None):
+        self.buckets = {host: self._make_bucket(host, rate, capacity) for host, (rate, capacity) in host_rates.items()}
+        self.default_rate = default_rate
+        self._lock = threading.Lock()
+
+    def _make_bucket(self, host, rate, capacity):
+        return TokenBucket(rate, capacity)
+
+    def bucket_for(self, url):
+        host = urlsplit(url).hostname
+        with self._lock:
+            if host not in self.buckets:
+                if self.default_rate is None:
+                    return None
+                self.buckets[host] = self._make_bucket(host, *self.default_rate)
+            return self.buckets[host]
+
+    def reserve(self, url):
+        """Reserve a request slot for `url` and return the seconds to wait for it."""
+        bucket = self.bucket_for(url)
+        return bucket.reserve() if bucket is not None else 0.0
+
+    def acquire_blocking(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            import asyncio
+            await asyncio.sleep(delay)
+
+    def record(self, url, **outcome):
+        """Report the outcome of a request to the bucket of its host (see `AdaptiveTokenBucket.record`)."""
+        bucket = self.bucket_for(url)
+        if isinstance(bucket, AdaptiveTokenBucket):
+            bucket.record(**outcome)
+
+    def rates(self):
+        with self._lock:
+            return {host: round(bucket.rate, 3) for host, bucket in self.buckets.items()}
+
+
+class AdaptiveHostRateLimiter(HostRateLimiter):
+    """
+    Keeps one adaptive token bucket per host.
+
+    Args:
+        host_rates: Map of host names to initial (rate, capacity) tuples (dictionary).
+        default_rate: Initial (rate, capacity) for hosts not listed in `host_rates`, or
+            None to leave them unthrottled (tuple).
+        max_rates: Map of host names to the highest rate they can be sped up to; hosts not
+            listed can reach `ADAPTIVE_MAX_SPEEDUP` times their initial rate (dictionary).
+    """
+
+    def __init__(self, host_rates, default_rate=None, max_rates=None):
+        self.max_rates = max_rates or {}
+        super().__init__(host_rates, default_rate)
+
+    def _make_bucket(self, host, rate, capacity):
+        return AdaptiveTokenBucket(rate, capacity, max_rate=self.max_rates.get(host))
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Return the process-wide limiter of the crawl.
+
+    It paces the API host, the nutritional info CDN and any other host, and is shared by
+    the HTTP client of the standalone spiders and the Scrapy `RateLimitingMiddleware`. It
+    is adaptive unless `ADAPTIVE_RATE_LIMITING` is disabled.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            host_rates = {
+                urlsplit(BEVERAGES_API_URL).hostname: (API_REQUESTS_PER_SECOND, API_BURST),
+                urlsplit(NUTRITIONAL_INFO_URL).hostname: (CDN_REQUESTS_PER_SECOND, CDN_BURST),
+            }
+            limiter_class = AdaptiveHostRateLimiter if ADAPTIVE_RATE_LIMITING else HostRateLimiter
+            _rate_limiter = limiter_class(host_rates, default_rate=(DEFAULT_REQUESTS_PER_SECOND, 1))
+        return _rate_limiter
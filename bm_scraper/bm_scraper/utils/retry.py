@@ -0,0 +1,190 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.exceptions import ConnectionError, RequestException
+
+from bm_scraper.config.config import (
+    MAX_RETRIES,
+    RETRY_DELAY,
+    RETRY_BACKOFF_MAX,
+    RETRY_HTTP_CODES,
+    RETRY_BUDGET,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT
+)
+from bm_scraper.utils.metrics import get_metrics
+from bm_scraper.utils.rate_limiter import parse_retry_after
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    After `failure_threshold` consecutive failures (connection errors, timeouts or 5xx
+    responses) the circuit of a host opens and its requests fail right away with
+    `CircuitOpenError`, so a host that is down costs a few timeouts instead of one per
+    request. Once `reset_timeout` seconds have passed, a single probe request is let
+    through: if it succeeds the circuit closes, otherwise it stays open for another
+    `reset_timeout`.
+
+    Args:
+        failure_threshold: Consecutive failures that open the circuit (integer).
+        reset_timeout: Seconds the circuit stays open before a probe (float).
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._probing = set()
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        """Whether a request to `host` may be sent now."""
+        return self.admit(host)[0]
+
+    def admit(self, host):
+        """Whether a request to `host` may be sent now, and whether it is the probe of its open circuit."""
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return True, False
+            if host in self._probing or time.monotonic() - opened_at < self.reset_timeout:
+                return False, False
+            self._probing.add(host)
+            return True, True
+
+    def release_probe(self, host):
+        """End the probe of `host` without a result, e.g. if it raised; the next request after it probes again."""
+        with self._lock:
+            self._probing.discard(host)
+
+    def record_success(self, host):
+        with self._lock:
+            if host in self._opened_at:
+                logging.info(f"Circuit of {host} closed")
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+            self._probing.discard(host)
+
+    def record_failure(self, host):
+        """Count a failure of `host`; returns whether its circuit is open."""
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if host in self._probing or (host not in self._opened_at and self._failures[host] >= self.failure_threshold):
+                if host not in self._opened_at:
+                    logging.warning(f"Circuit of {host} opened after {self._failures[host]} consecutive failures")
+                self._opened_at[host] = time.monotonic()
+                self._probing.discard(host)
+            return host in self._opened_at
+
+
+class RetryPolicy:
+    """
+    Retry policy shared by every request of the crawl.
+
+    A request is retried up to `max_retries` times when it fails with a connection error or
+    timeout or gets one of the `retry_http_codes`. Retries wait an exponential backoff with
+    full jitter (a random delay between 0 and `base_delay` doubled on every retry, capped
+    at `max_delay`), or longer if the response asks for it with `Retry-After`. All requests
+    draw from a single retry budget, so a failing run does not multiply its requests. The
+    circuit breaker of each host is checked before every attempt.
+
+    Args:
+        max_retries: Times a failed request is retried (integer).
+        base_delay: Backoff delay of the first retry in seconds (float).
+        max_delay: Longest delay between retries in seconds (float).
+        retry_http_codes: Response status codes that are retried (iterable).
+        budget: Retries allowed across all requests (integer).
+        circuit_breaker: Circuit breaker of the hosts, or None to not use one (CircuitBreaker).
+    """
+
+    def __init__(self, max_retries=MAX_RETRIES, base_delay=RETRY_DELAY, max_delay=RETRY_BACKOFF_MAX,
+                 retry_http_codes=RETRY_HTTP_CODES, budget=RETRY_BUDGET, circuit_breaker=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_http_codes = frozenset(retry_http_codes)
+        self.budget = budget
+        self.circuit_breaker = circuit_breaker
+        self.retries = 0
+        self._budget_spent = False
+        self._lock = threading.Lock()
+
+    def backoff(self, retry, retry_after=None):
+        """Seconds to wait before the `retry`-th retry (1 for the first one)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _take_retry(self):
+        with self._lock:
+            if self.retries >= self.budget:
+                if not self._budget_spent:
+                    logging.warning(f"Retry budget of {self.budget} retries spent; failed requests are no longer retried")
+                    self._budget_spent = True
+                return False
+            self.retries += 1
+            return True
+
+    def call(self, url, send):
+        """
+        Send a request, retrying it as the policy allows.
+
+        Args:
+            url: The requested URL, used for the circuit breaker and the logs (string).
+            send: Function sending the request; called with the attempt number, 0 for
+                the first one, and returning a `requests.Response` (callable).
+
+        Returns:
+            The last response, which may still have a retryable status code.
+
+        Raises:
+            CircuitOpenError: If the circuit of the host is open.
+            requests.exceptions.RequestException: The error of the last attempt.
+        """
+        host = urlsplit(url).hostname
+        breaker = self.circuit_breaker
+        for attempt in range(self.max_retries + 1):
+            allowed, probe = breaker.admit(host) if breaker is not None else (True, False)
+            if not allowed:
+                get_metrics().increment('bm_http_rejected_total', host=host)
+                raise CircuitOpenError(f"Circuit of {host} is open; not requesting {url}")
+
+            retry_after = None
+            circuit_open = False
+            try:
+                response = send(attempt)
+            except RequestException as e:
+                if breaker is not None:
+                    circuit_open = breaker.record_failure(host)
+                if circuit_open or attempt == self.max_retries or not self._take_retry():
+                    raise
+                reason = str(e)
+            else:
+                if breaker is not None:
+                    if response.status_code >= 500:
+                        circuit_open = breaker.record_failure(host)
+                    else:
+                        breaker.record_success(host)
+                retryable = response.status_code in self.retry_http_codes
+                if not retryable or circuit_open or attempt == self.max_retries or not self._take_retry():
+                    return response
+                reason = f"status {response.status_code}"
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            finally:
+                # A probe that raised anything else recorded no result; left in progress it would keep the circuit open for good
+                if probe:
+                    breaker.release_probe(host)
+
+            delay = self.backoff(attempt + 1, retry_after)
+            logging.warning(f"Retrying {url} in {delay:.2f}s, try {attempt + 1}/{self.max_retries} ({reason})")
+            get_metrics().count_retry(url)
+            time.sleep(delay)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+from bm_scraper.spiders.records import BmProductRecord, as_dict
+
+
+def payload_fingerprint(product):
+    """Hash of the raw API fields an item is built from."""
+    payload = [product.get('ean'), product.get('productData'), product.get('priceData'), product.get('offers'), product.get('categories')]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def record_fingerprint(payload_hash, promotions):
+    """Hash of the raw API fields plus the promotion records of the product."""
+    return hashlib.sha1(f"{payload_hash}|{json.dumps(promotions, sort_keys=True, ensure_ascii=False)}".encode('utf-8')).hexdigest()
+
+
+class IncrementalSnapshot:
+    """
+    Previous snapshot of the catalog used to only reprocess products that changed.
+
+    The previous output file provides the items indexed by product ID, and a sidecar
+    `<output>.index.json` file the fingerprints they were built from: a hash of the raw
+    'productData', 'priceData', 'offers' and 'categories' payload, and a hash of that
+    payload plus the promotion records of the product. A product whose payload is unchanged keeps its
+    nutritional info; one whose full fingerprint is unchanged is reused as is.
+
+    Args:
+        output_file: Path of the full snapshot JSON file (string).
+    """
+
+    def __init__(self, output_file):
+        base_path = os.path.splitext(output_file)[0]
+        self.output_file = output_file
+        self.index_file = f"{base_path}.index.json"
+        self.delta_file = f"{base_path}.delta.json"
+        self.previous_items = {}
+        self.previous_fingerprints = {}
+        self.fingerprints = {}
+        self.current_ids = set()
+        self.added = []
+        self.changed = []
+        self.reused_count = 0
+
+    @classmethod
+    def load(cls, output_file):
+        snapshot = cls(output_file)
+        try:
+            with open(snapshot.index_file, encoding='utf-8') as f:
+                snapshot.previous_fingerprints = json.load(f)
+            with open(output_file, encoding='utf-8') as f:
+                snapshot.previous_items = {str(item.get('id')): item for item in json.load(f)}
+        except (OSError, ValueError) as e:
+            logging.info(f"No previous snapshot to compare with ({e}); every product will be processed")
+            snapshot.previous_fingerprints = {}
+            snapshot.previous_items = {}
+        return snapshot
+
+    def _fingerprint(self, product):
+        product_id = str(product.get('id'))
+        if product_id not in self.fingerprints:
+            self.fingerprints[product_id] = {'payload': payload_fingerprint(product)}
+        return product_id, self.fingerprints[product_id]
+
+    def _previous(self, product_id, key):
+        if product_id not in self.previous_items:
+            return None
+        return self.previous_fingerprints.get(product_id, {}).get(key)
+
+    def needs_enrichment(self, product):
+        """Whether the nutritional info of a product has to be fetched again."""
+        product_id, fingerprint = self._fingerprint(product)
+        return self._previous(product_id, 'payload') != fingerprint['payload']
+
+    def reuse_item(self, product, promotions):
+        """
+        Return the previous item of a product if neither its payload nor its promotions changed.
+
+        Args:
+            product: The raw product data from the API (dictionary).
+            promotions: The promotions of the promotion feeds (PromotionIndex).
+
+        Returns:
+            A BmProductRecord copied from the previous snapshot, or None if the product has to
+            be processed.
+        """
+        product_id, fingerprint = self._fingerprint(product)
+        fingerprint['record'] = record_fingerprint(fingerprint['payload'], promotions.promotions(product.get('ean')))
+
+        if self._previous(product_id, 'record') != fingerprint['record']:
+            return None
+        self.reused_count += 1
+        return BmProductRecord(self.previous_items[product_id])
+
+    def update_item(self, product, bm_item):
+        """Complete a reprocessed item with the previous nutritional info if its payload is unchanged."""
+        if not self.needs_enrichment(product):
+            previous_item = self.previous_items[str(product.get('id'))]
+            bm_item['manufacturer'] = previous_item.get('manufacturer', 'No encontrado')
+            bm_item['raw_ingredients'] = previous_item.get('raw_ingredients', 'No encontrado')
+
+    def record_item(self, bm_item):
+        """Add an item of the current run to the delta as it is produced."""
+        product_id = str(bm_item['id'])
+        self.current_ids.add(product_id)
+        previous_item = self.previous_items.get(product_id)
+        if previous_item is None:
+            self.added.append(as_dict(bm_item))
+        else:
+            values = as_dict(bm_item)
+            if values != previous_item:
+                self.changed.append(values)
+
+    def save(self):
+        """
+        Write the fingerprint index and the delta file of the current run.
+
+        The delta lists the items added and changed since the previous snapshot and the
+        previous items of products that were not seen in this run.
+        """
+        delta = {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'added': self.added,
+            'changed': self.changed,
+            'removed': [item for product_id, item in self.previous_items.items() if product_id not in self.current_ids],
+        }
+        fingerprints = {product_id: fingerprint for product_id, fingerprint in self.fingerprints.items() if product_id in self.current_ids}
+
+        with open(self.index_file, 'w', encoding='utf-8') as f:
+            json.dump(fingerprints, f)
+        with open(self.delta_file, 'w', encoding='utf-8') as f:
+            json.dump(delta, f, indent=4, ensure_ascii=False)
+
+        logging.info(
+            f"Incremental run: {self.reused_count} products reused, {len(delta['added'])} added, "
+            f"{len(delta['changed'])} changed, {len(delta['removed'])} removed. Delta saved to: {self.delta_file}"
+        )
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from bm_scraper.spiders.bebidas_spider_async import AsyncApiClient
+from bm_scraper.utils.nutrition_cache import NutritionCache
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = []
+
+    async def acquire(self, url):
+        self.acquired.append(url)
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {'ETag': '"fetched"'}
+
+    def json(self):
+        return {'fetched': True}
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = NutritionCache(cache_dir=str(tmp_path))
+    monkeypatch.setattr('bm_scraper.spiders.bebidas_spider_async.get_nutrition_cache', lambda: cache)
+    monkeypatch.setattr('bm_scraper.utils.product_parsers.get_nutrition_cache', lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def requested(monkeypatch):
+    requested = []
+
+    def http_get(url, **kwargs):
+        requested.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr('bm_scraper.utils.http_client.http_get', http_get)
+    return requested
+
+
+def lookup_all(eans):
+    client = AsyncApiClient(max_concurrency=4)
+    client.limiter = CountingLimiter()
+
+    async def run():
+        return await asyncio.gather(*(client.get_nutritional_data(ean) for ean in eans))
+
+    try:
+        return asyncio.run(run()), client
+    finally:
+        client.close()
+
+
+def test_warm_cache_lookups_take_no_limiter_slot(cache, requested):
+    eans = [f'84{index:011d}' for index in range(50)]
+    for index, ean in enumerate(eans):
+        cache.put(ean, {'index': index} if index % 4 else None)
+
+    results, client = lookup_all(eans)
+
+    assert results == [{'index': index} if index % 4 else None for index in range(len(eans))]
+    assert client.limiter.acquired == []
+    assert requested == []
+    assert client.nutrition_stats.summary()['requested'] == len(eans)
+
+
+def test_cache_miss_takes_a_limiter_slot(cache, requested):
+    results, client = lookup_all(['8400000000001'])
+
+    assert results == [{'fetched': True}]
+    assert len(client.limiter.acquired) == 1
+    assert len(requested) == 1
+    assert cache.lookup('8400000000001')[1]
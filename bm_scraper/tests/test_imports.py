@@ -0,0 +1,10 @@
+import pytest
+
+from benchmarks.bench_import_time import MODULES, import_module, side_effects
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_has_no_side_effects(module):
+    # Only the side effects are checked; the import time is left to the benchmark
+    _, probe = import_module(module, importtime=False)
+    assert side_effects(probe) == []
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from bm_scraper.utils.pagination import PageSizes
+
+
+CATALOG_URL = 'https://api.example.com/catalog/product?page={page}&limit={limit}&offset={offset}&categories={category}'
+FEED_URL = CATALOG_URL + '&filters=offerPrice'
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+def page_of(url, total_count=500):
+    limit = int(url.split('limit=')[1].split('&')[0])
+    return {'products': [{'id': index} for index in range(limit)], 'totalCount': total_count}
+
+
+@pytest.fixture
+def page_sizes(tmp_path):
+    return PageSizes(path=str(tmp_path / 'page-sizes.json'), candidates=[100, 50], default=20)
+
+
+def test_probed_page_is_handed_to_the_caller(page_sizes, monkeypatch):
+    requested = []
+
+    def http_get(url, **kwargs):
+        requested.append(url)
+        return FakeResponse(page_of(url))
+
+    monkeypatch.setattr('bm_scraper.utils.http_client.http_get', http_get)
+
+    page_size, probed_page = page_sizes.negotiate(CATALOG_URL, 1690)
+    assert page_size == 100
+    assert probed_page == page_of(requested[0])
+    # Once known, the page size is returned without a request nor a page
+    assert page_sizes.negotiate(CATALOG_URL, 1690) == (100, None)
+    assert len(requested) == 1
+
+
+def test_feeds_are_probed_concurrently(page_sizes, monkeypatch):
+    catalog_probed = threading.Event()
+    feed_probed = threading.Event()
+
+    def http_get(url, **kwargs):
+        if 'filters=' in url:
+            feed_probed.set()
+        else:
+            catalog_probed.set()
+            # The catalog probe only completes once the feed has been probed alongside it
+            assert feed_probed.wait(timeout=5)
+        return FakeResponse(page_of(url))
+
+    monkeypatch.setattr('bm_scraper.utils.http_client.http_get', http_get)
+
+    catalog = threading.Thread(target=page_sizes.negotiate, args=(CATALOG_URL, 1690))
+    catalog.start()
+    assert catalog_probed.wait(timeout=5)
+    assert page_sizes.limit(FEED_URL, 1690) == 100
+    catalog.join(timeout=5)
+    assert page_sizes.saved(CATALOG_URL, 1690) == 100
@@ -0,0 +1,30 @@
+import json
+import os
+
+import pytest
+
+from bm_scraper.utils.product_parsers import parse_measuring_unit, parse_measuring_units
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'measuring_unit_corpus.json')
+
+with open(CORPUS_FILE, encoding='utf-8') as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize('entry', CORPUS, ids=[entry['description'] for entry in CORPUS])
+def test_golden_corpus(entry):
+    assert parse_measuring_unit(entry['description']) == entry['expected']
+
+
+def test_batch_matches_per_item_parser():
+    descriptions = [entry['description'] for entry in CORPUS] + ['', None]
+    columns = parse_measuring_units(descriptions)
+    rows = [
+        {'format': measuring_format, 'value': value, 'unit': unit} if measuring_format is not None else None
+        for measuring_format, value, unit in zip(columns['format'], columns['value'], columns['unit'])
+    ]
+    assert rows == [parse_measuring_unit(description) for description in descriptions]
+
+
+def test_empty_batch():
+    assert parse_measuring_units([]) == {'format': [], 'value': [], 'unit': []}
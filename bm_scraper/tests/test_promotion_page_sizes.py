@@ -0,0 +1,82 @@
+import pytest
+
+from bm_scraper.config.config import BEVERAGES_API_URL
+from bm_scraper.spiders.bebidas_spider_async import scrape_beverages_async
+from bm_scraper.spiders.bebidas_spider_simple import PROMOTION_FEEDS, scrape_beverages_api_only
+from bm_scraper.utils.pagination import PageSizes, page_url
+
+CATEGORY = 1690
+CATALOG_LIMIT = 48
+FEED_LIMIT = 12
+
+
+class FakePageSizes:
+    """Negotiated page sizes: the catalog accepts larger pages than the promotion feeds."""
+
+    def limit(self, url, category):
+        return CATALOG_LIMIT if url == BEVERAGES_API_URL else FEED_LIMIT
+
+    saved = limit
+
+    def negotiate(self, url, category):
+        return self.limit(url, category), None
+
+    def served(self, url, category, page_size, served_count, total_count):
+        return page_size
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def requested(monkeypatch):
+    requested = []
+
+    def http_get(url, **kwargs):
+        requested.append(url)
+        # The promotion feeds are the catalog endpoint with a filter
+        products = [] if 'filters=' in url else [{'id': 1, 'name': 'Agua'}]
+        return FakeResponse({'products': products, 'totalCount': len(products)})
+
+    for module in ('bebidas_spider_simple', 'bebidas_spider_async'):
+        monkeypatch.setattr(f'bm_scraper.spiders.{module}.get_page_sizes', FakePageSizes)
+        monkeypatch.setattr(f'bm_scraper.spiders.{module}.saved_promotions', lambda category, checkpoint=None: None)
+    monkeypatch.setattr('bm_scraper.spiders.bebidas_spider_simple.save_promotion_index', lambda promotions, category: None)
+    monkeypatch.setattr('bm_scraper.utils.http_client.http_get', http_get)
+    return requested
+
+
+@pytest.mark.parametrize('scrape', [scrape_beverages_api_only, scrape_beverages_async])
+def test_promotion_feeds_use_their_own_page_size(requested, scrape):
+    scrape(category=CATEGORY)
+
+    assert sorted(requested) == sorted([
+        page_url(BEVERAGES_API_URL, 1, CATALOG_LIMIT, CATEGORY),
+        *(page_url(api_url, 1, FEED_LIMIT, CATEGORY) for api_url, _ in PROMOTION_FEEDS),
+    ])
+
+
+@pytest.mark.parametrize('scrape', [scrape_beverages_api_only, scrape_beverages_async])
+def test_first_pages_fetched_by_the_probes_are_not_requested_again(requested, scrape, monkeypatch, tmp_path):
+    page_sizes = PageSizes(path=str(tmp_path / 'page-sizes.json'), candidates=[100], default=20)
+    for module in ('bebidas_spider_simple', 'bebidas_spider_async'):
+        monkeypatch.setattr(f'bm_scraper.spiders.{module}.get_page_sizes', lambda: page_sizes)
+
+    scrape(category=CATEGORY)
+
+    # Every feed fits in its first page, so the probe of each endpoint is its only request
+    assert sorted(requested) == sorted([
+        page_url(BEVERAGES_API_URL, 1, 100, CATEGORY),
+        *(page_url(api_url, 1, 100, CATEGORY) for api_url, _ in PROMOTION_FEEDS),
+    ])
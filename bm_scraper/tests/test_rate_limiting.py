@@ -0,0 +1,80 @@
+import pytest
+
+# Installs the default reactor, which process_request expects to find
+from twisted.internet import reactor  # noqa: F401
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+
+from bm_scraper.middlewares.rate_limiting import RateLimitingMiddleware
+from bm_scraper.utils.rate_limiter import HostRateLimiter
+
+
+API_URL = 'https://api.example.com/catalog/product?page={}'
+CDN_URL = 'https://cdn.example.com/nutritional-info/{}.json'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # process_request schedules its wait on `twisted.internet.reactor`, so the waits run on simulated time
+    clock = Clock()
+    monkeypatch.setattr('twisted.internet.reactor', clock)
+    return clock
+
+
+@pytest.fixture
+def middleware():
+    crawler = get_crawler(settings_dict={
+        'RATE_LIMITED_DOMAINS': {'api.example.com': 0.5},
+        'RANDOMIZE_DOWNLOAD_DELAY': False,
+    })
+    middleware = RateLimitingMiddleware.from_crawler(crawler)
+    # 2 requests per second with no burst: the API requests get slots 0, 0.5 and 1 second away
+    middleware.limiter = HostRateLimiter({'api.example.com': (2.0, 1.0)})
+    return middleware
+
+
+def process(middleware, url, finished):
+    request = Request(url)
+    deferred = Deferred.fromCoroutine(middleware.process_request(request, None))
+    deferred.addCallback(lambda result: finished.append(url))
+    return deferred
+
+
+def test_unthrottled_domain_is_not_held_back(clock, middleware):
+    finished = []
+    for index in range(3):
+        process(middleware, API_URL.format(index), finished)
+        process(middleware, CDN_URL.format(index), finished)
+
+    # Before any simulated time passes, every CDN request is through but only the first API request
+    assert [url for url in finished if 'cdn' in url] == [CDN_URL.format(index) for index in range(3)]
+    assert [url for url in finished if 'api' in url] == [API_URL.format(0)]
+
+    clock.advance(0.5)
+    assert [url for url in finished if 'api' in url] == [API_URL.format(0), API_URL.format(1)]
+    clock.advance(0.5)
+    assert [url for url in finished if 'api' in url] == [API_URL.format(index) for index in range(3)]
+
+
+def test_jitter_only_delays_throttled_domains(clock, middleware, monkeypatch):
+    middleware.randomize_delay = True
+    monkeypatch.setattr('random.uniform', lambda low, high: high)
+    finished = []
+    process(middleware, API_URL.format(0), finished)
+    process(middleware, CDN_URL.format(0), finished)
+
+    assert finished == [CDN_URL.format(0)]
+    clock.advance(0.5)
+    assert finished == [CDN_URL.format(0), API_URL.format(0)]
+
+
+def test_unthrottled_responses_are_not_reported_to_the_limiter(middleware):
+    reported = []
+    middleware.limiter.record = lambda url, **outcome: reported.append(url)
+    for url in (API_URL.format(0), CDN_URL.format(0)):
+        request = Request(url)
+        middleware.process_exception(request, ConnectionError(), None)
+
+    assert reported == [API_URL.format(0)]
@@ -0,0 +1,46 @@
+import pytest
+from requests.exceptions import ConnectionError
+
+from bm_scraper.utils.retry import CircuitBreaker, RetryPolicy
+
+
+URL = 'https://api.example.com/catalog/product?page=1'
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+
+def fail(attempt):
+    raise ConnectionError('Connection refused')
+
+
+def crash(attempt):
+    raise ValueError('Invalid header value')
+
+
+@pytest.fixture
+def policy():
+    # The first failure opens the circuit, and it can be probed right away
+    return RetryPolicy(max_retries=0, circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+
+
+def test_probe_raising_another_error_does_not_leave_the_circuit_open(policy):
+    with pytest.raises(ConnectionError):
+        policy.call(URL, fail)
+    with pytest.raises(ValueError):
+        policy.call(URL, crash)
+
+    # The next request probes the circuit again, and closes it
+    assert policy.call(URL, lambda attempt: FakeResponse()).status_code == 200
+    assert policy.circuit_breaker.admit('api.example.com') == (True, False)
+
+
+def test_only_one_probe_is_let_through(policy):
+    with pytest.raises(ConnectionError):
+        policy.call(URL, fail)
+
+    breaker = policy.circuit_breaker
+    assert breaker.admit('api.example.com') == (True, True)
+    assert breaker.admit('api.example.com') == (False, False)
@@ -0,0 +1,116 @@
+import logging
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from bm_scraper.config.config import ADAPTIVE_MIN_RATE, BEVERAGES_API_URL
+from bm_scraper.spiders import sharded_scheduler
+from bm_scraper.spiders.sharded_scheduler import (
+    _feed_result,
+    _submit_shard,
+    scrape_categories_sharded,
+    worker_cdn_concurrency,
+    worker_host_rates
+)
+from bm_scraper.utils.promotions import PromotionIndex
+
+
+@pytest.mark.parametrize('workers, api_rate, cdn_rate', [
+    # The API ceiling of 4 req/s only binds beyond 4 workers at 1 req/s, the CDN one of 40 req/s beyond 2 at 20 req/s
+    (1, 1.0, 20.0),
+    (4, 1.0, 10.0),
+    (8, 0.5, 5.0),
+    (64, 0.1, 0.625),
+])
+def test_rates_split_the_ceiling_between_workers(workers, api_rate, cdn_rate):
+    assert worker_host_rates(workers) == {
+        'www.online.bmsupermercados.es': (pytest.approx(api_rate), 1),
+        'cdn-bm.aktiosdigitalservices.com': (pytest.approx(cdn_rate), 8),
+    }
+
+
+@pytest.mark.parametrize('workers, concurrency', [(1, 8), (2, 8), (4, 4), (8, 2), (64, 1)])
+def test_cdn_concurrency_splits_the_ceiling_between_workers(workers, concurrency):
+    assert worker_cdn_concurrency(workers) == concurrency
+
+
+@pytest.mark.parametrize('workers', [1, 4, 64, 1000])
+def test_rates_never_drop_below_the_minimum_rate(workers):
+    for rate, capacity in worker_host_rates(workers).values():
+        assert rate >= ADAPTIVE_MIN_RATE
+        assert capacity >= 1
+
+
+def test_failed_promotion_feed_is_logged_and_skipped(caplog):
+    future = Future()
+    future.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+
+    with caplog.at_level(logging.ERROR):
+        assert _feed_result(1690, 'MxN', future) is None
+    assert 'MxN promotions of category 1690' in caplog.text
+
+
+class BrokenExecutor:
+    def submit(self, *args):
+        raise BrokenProcessPool('A child process terminated abruptly')
+
+
+def test_shard_submitted_to_a_broken_pool_fails_without_raising():
+    shards = []
+    _submit_shard(BrokenExecutor(), shards, (1690, 2, 5, 48))
+
+    (shard, future), = shards
+    assert shard == (1690, 2, 5, 48)
+    assert isinstance(future.exception(), BrokenProcessPool)
+
+
+class InlineExecutor:
+    """Runs every work unit in the test process as soon as it is submitted."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+
+class CategoryPageSizes:
+    """Negotiated page sizes that differ between categories."""
+
+    limits = {1690: 48, 1700: 24}
+
+    def negotiate(self, url, category):
+        return (self.limits[category] if url == BEVERAGES_API_URL else 10), None
+
+    def served(self, url, category, page_size, served_count, total_count):
+        return page_size
+
+
+def test_each_category_page_size_reaches_its_shards(monkeypatch):
+    shards = []
+
+    def fetch_catalog_shard(category, first_page, last_page, page_size, probed_page=None):
+        shards.append((category, page_size))
+        # Every category has 12 pages of its own page size
+        served = [(page_number, 12 * page_size, 0.0) for page_number in range(first_page, last_page + 1)]
+        return [], False, served, {'requested': 0, 'found': 0, 'missing': 0, 'failed': 0}
+
+    monkeypatch.setattr(sharded_scheduler, 'ProcessPoolExecutor', InlineExecutor)
+    monkeypatch.setattr(sharded_scheduler, 'fetch_catalog_shard', fetch_catalog_shard)
+    monkeypatch.setattr(sharded_scheduler, 'get_page_sizes', CategoryPageSizes)
+    monkeypatch.setattr(sharded_scheduler, 'saved_promotions', lambda category: PromotionIndex())
+
+    scrape_categories_sharded(categories=[1690, 1700], workers=2)
+
+    assert {category for category, _ in shards} == {1690, 1700}
+    for category, page_size in shards:
+        assert page_size == CategoryPageSizes.limits[category]